@@ -0,0 +1,62 @@
+-- Add compact binary embedding column to engagement_training_data
+-- Run this in Supabase SQL Editor (after bulk_update_engagement_training.sql)
+--
+-- Only needed for the compact embedding formats (--storage f16/f32 or
+-- EMBEDDING_STORAGE=f16); the default JSON storage works without it.
+--
+-- caption_embedding_bin holds "f16:<base64>" or "f32:<base64>" encoded
+-- embeddings (see ml/embedding_codec.py). It is ~7x smaller than the JSON
+-- text in caption_embedding and decodes without parsing.
+--
+-- Existing JSON embeddings are converted by:
+--   cd ml && python migrate_embedding_storage.py [--drop-json]
+
+ALTER TABLE public.engagement_training_data
+ADD COLUMN IF NOT EXISTS caption_embedding_bin TEXT;
+
+-- bulk_update_engagement_training, also writing caption_embedding_bin
+CREATE OR REPLACE FUNCTION public.bulk_update_engagement_training(rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  updated_count INTEGER;
+BEGIN
+  UPDATE public.engagement_training_data AS t
+  SET (
+    caption_embedding,
+    caption_embedding_bin,
+    predicted_score,
+    has_prediction,
+    prediction_made_at,
+    model_version,
+    prediction_accuracy,
+    updated_at
+  ) = (
+    SELECT
+      p.caption_embedding,
+      p.caption_embedding_bin,
+      p.predicted_score,
+      p.has_prediction,
+      p.prediction_made_at,
+      p.model_version,
+      p.prediction_accuracy,
+      NOW()
+    FROM jsonb_populate_record(t, to_jsonb(t) || e.patch) AS p
+  )
+  FROM jsonb_array_elements(rows) AS e(patch)
+  WHERE t.id = (e.patch->>'id')::UUID;
+
+  GET DIAGNOSTICS updated_count = ROW_COUNT;
+  RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the service role (ml scripts) may call it
+REVOKE ALL ON FUNCTION public.bulk_update_engagement_training(JSONB) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.bulk_update_engagement_training(JSONB) TO service_role;
+
+-- Verify how many rows use each format
+SELECT
+  COUNT(*) FILTER (WHERE caption_embedding_bin IS NOT NULL) AS binary_embeddings,
+  COUNT(*) FILTER (WHERE caption_embedding IS NOT NULL AND caption_embedding_bin IS NULL) AS json_only_embeddings,
+  COUNT(*) FILTER (WHERE caption_embedding IS NULL AND caption_embedding_bin IS NULL) AS missing_embeddings
+FROM public.engagement_training_data;
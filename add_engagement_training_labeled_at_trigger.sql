@@ -0,0 +1,40 @@
+-- Stamp engagement_training_data.labeled_at whenever a post's labels change
+-- Run this in Supabase SQL Editor
+--
+-- Incremental retraining (ml/train_model.py --incremental) continues the
+-- previous model on rows labeled after its data watermark. updated_at can't be
+-- used for that: writing predictions or embeddings also advances it.
+
+CREATE OR REPLACE FUNCTION update_engagement_training_labeled_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.is_labeled IS TRUE AND (
+    TG_OP = 'INSERT'
+    OR OLD.is_labeled IS DISTINCT FROM TRUE
+    OR NEW.theme IS DISTINCT FROM OLD.theme
+    OR NEW.tone IS DISTINCT FROM OLD.tone
+    OR NEW.dominant_color IS DISTINCT FROM OLD.dominant_color
+    OR NEW.engagement_score IS DISTINCT FROM OLD.engagement_score
+  ) THEN
+    NEW.labeled_at = NOW();
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_engagement_training_labeled_at
+  ON public.engagement_training_data;
+
+CREATE TRIGGER trg_engagement_training_labeled_at
+  BEFORE INSERT OR UPDATE ON public.engagement_training_data
+  FOR EACH ROW
+  EXECUTE FUNCTION update_engagement_training_labeled_at();
+
+-- Backfill rows labeled before the trigger existed
+UPDATE public.engagement_training_data
+SET labeled_at = COALESCE(updated_at, created_at)
+WHERE is_labeled = TRUE AND labeled_at IS NULL;
+
+-- Index used by incremental retraining
+CREATE INDEX IF NOT EXISTS idx_engagement_training_labeled_at
+  ON public.engagement_training_data(labeled_at);
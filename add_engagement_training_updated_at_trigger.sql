@@ -0,0 +1,27 @@
+-- Keep engagement_training_data.updated_at fresh on every update
+-- Run this in Supabase SQL Editor
+--
+-- The engagement score trigger only fires for metric/post_type changes, so
+-- labeling a post (theme, tone, is_labeled, ...) left updated_at untouched.
+-- The ml feature snapshot (ml/feature_store.py) syncs by updated_at, so every
+-- change must advance it.
+
+CREATE OR REPLACE FUNCTION update_engagement_training_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = NOW();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_engagement_training_updated_at
+  ON public.engagement_training_data;
+
+CREATE TRIGGER trg_engagement_training_updated_at
+  BEFORE UPDATE ON public.engagement_training_data
+  FOR EACH ROW
+  EXECUTE FUNCTION update_engagement_training_updated_at();
+
+-- Index used by incremental snapshot syncs
+CREATE INDEX IF NOT EXISTS idx_engagement_training_updated_at
+  ON public.engagement_training_data(updated_at);
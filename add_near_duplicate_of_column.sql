@@ -0,0 +1,23 @@
+-- Add near-duplicate marker column to engagement_training_data
+-- Run this in Supabase SQL Editor
+--
+-- Needed by `import_scraped_data.py --near-duplicates flag`: a post whose
+-- caption nearly copies an earlier post's keeps that post's post_url in
+-- near_duplicate_of. generate_embeddings.py and train_model.py skip rows
+-- where it is set, so flagged reposts cost no embedding and do not weigh
+-- on training. Existing rows are flagged by:
+--   cd ml && python near_duplicates.py build
+
+ALTER TABLE public.engagement_training_data
+ADD COLUMN IF NOT EXISTS near_duplicate_of TEXT;
+
+-- Most rows are not copies; index only the ones that are
+CREATE INDEX IF NOT EXISTS idx_engagement_training_near_duplicate_of
+ON public.engagement_training_data(near_duplicate_of)
+WHERE near_duplicate_of IS NOT NULL;
+
+-- Verify
+SELECT
+  COUNT(*) FILTER (WHERE near_duplicate_of IS NOT NULL) AS flagged_copies,
+  COUNT(DISTINCT near_duplicate_of) AS clusters
+FROM public.engagement_training_data;
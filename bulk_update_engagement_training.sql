@@ -0,0 +1,51 @@
+-- Bulk partial-row updates for engagement_training_data
+-- Run this in Supabase SQL Editor
+--
+-- Used by the ml scripts (ml/supabase_writer.py) to write many rows in a
+-- single round trip instead of one UPDATE ... WHERE id = ... per row.
+--
+-- rows: JSON array of patches, each with an "id" plus any of the columns
+-- listed below. Columns missing from a patch keep their current value.
+-- Returns the number of rows updated.
+--
+-- This version writes JSON embeddings (caption_embedding) only, so it runs
+-- on the base schema. add_caption_embedding_bin_column.sql replaces it with
+-- one that also writes caption_embedding_bin; once that has been applied,
+-- re-run that file rather than this one.
+
+CREATE OR REPLACE FUNCTION public.bulk_update_engagement_training(rows JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  updated_count INTEGER;
+BEGIN
+  UPDATE public.engagement_training_data AS t
+  SET (
+    caption_embedding,
+    predicted_score,
+    has_prediction,
+    prediction_made_at,
+    model_version,
+    prediction_accuracy,
+    updated_at
+  ) = (
+    SELECT
+      p.caption_embedding,
+      p.predicted_score,
+      p.has_prediction,
+      p.prediction_made_at,
+      p.model_version,
+      p.prediction_accuracy,
+      NOW()
+    FROM jsonb_populate_record(t, to_jsonb(t) || e.patch) AS p
+  )
+  FROM jsonb_array_elements(rows) AS e(patch)
+  WHERE t.id = (e.patch->>'id')::UUID;
+
+  GET DIAGNOSTICS updated_count = ROW_COUNT;
+  RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the service role (ml scripts) may call it
+REVOKE ALL ON FUNCTION public.bulk_update_engagement_training(JSONB) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.bulk_update_engagement_training(JSONB) TO service_role;
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cold-start cost of the ml.py subcommands and of loading a saved model.
+
+Every measurement runs in a fresh interpreter, so nothing is warm:
+
+    startup     wall time of `python ml.py <command> --help` (median of
+                --runs), next to a bare `python -c pass`, plus which heavy
+                libraries the command imported (from -X importtime)
+    model load  wall time to load a model of --features columns and
+                --rounds trees as native UBJSON, JSON and the legacy joblib
+                pickle: the whole fresh process and the load call alone
+                (libraries already imported), with the file sizes
+
+    python benchmark_cold_start.py --runs 7 --output cold_start.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+from benchmark_pipeline import git_revision
+from ml import COMMANDS
+
+HEAVY_MODULES = ("xgboost", "sklearn", "scipy", "pandas", "openai", "supabase", "joblib")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def timed_run(args: list, runs: int) -> float:
+    """Median wall time (ms) of running `python <args>` in a fresh process."""
+    seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=HERE, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - started)
+    return round(float(np.median(seconds)) * 1000, 1)
+
+def timed_load(path: str, runs: int) -> dict:
+    """Median wall time (ms) of a fresh process that loads `path`, and of the load call alone."""
+    script = ("import time, model_artifact, xgboost, joblib; started = time.perf_counter(); "
+              f"model_artifact.load_booster({path!r}); print(time.perf_counter() - started)")
+    wall, load = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", script], cwd=HERE, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        wall.append(time.perf_counter() - started)
+        load.append(float(result.stdout.strip().splitlines()[-1]))
+    return {"process_ms": round(float(np.median(wall)) * 1000, 1),
+            "load_ms": round(float(np.median(load)) * 1000, 1)}
+
+def heavy_imports(args: list) -> dict:
+    """Heavy top-level packages `python <args>` imports, with their cumulative import ms."""
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=HERE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    loaded = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) != 3 or not line.startswith("import time:"):
+            continue
+        name = parts[2].strip()
+        if name in HEAVY_MODULES:
+            loaded[name] = round(int(parts[1]) / 1000, 1)
+    return loaded
+
+def write_models(directory: str, n_features: int, rounds: int, seed: int) -> dict:
+    """The same small regressor saved in every format; {format: path}."""
+    import joblib
+    import xgboost as xgb
+
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((2000, n_features)).astype(np.float32)
+    y = X[:, :10].sum(axis=1) + rng.standard_normal(2000)
+    model = xgb.XGBRegressor(n_estimators=rounds, max_depth=6, random_state=seed, n_jobs=-1).fit(X, y)
+    paths = {}
+    for model_format in ("ubj", "json"):
+        paths[model_format] = os.path.join(directory, f"model.{model_format}")
+        model.get_booster().save_model(paths[model_format])
+    paths["pkl"] = os.path.join(directory, "model.pkl")
+    joblib.dump(model, paths["pkl"])
+    return paths
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ml.py subcommand start-up and model load times")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--commands", nargs="+", choices=COMMANDS, default=list(COMMANDS))
+    parser.add_argument("--features", type=int, default=1600, help="columns of the benchmark model")
+    parser.add_argument("--rounds", type=int, default=200, help="trees in the benchmark model")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="cold_start_benchmark.json")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  Cold-Start Benchmark                               ║")
+    print("╚══════════════════════════════════════════════════════╝")
+
+    interpreter_ms = timed_run(["-c", "pass"], args.runs)
+    print(f"🐍 Bare interpreter: {interpreter_ms:.0f} ms")
+
+    commands = []
+    for command in args.commands:
+        argv = ["ml.py", command, "--help"]
+        result = {"command": command, "module": COMMANDS[command][0],
+                  "startup_ms": timed_run(argv, args.runs), "heavy_imports_ms": heavy_imports(argv)}
+        commands.append(result)
+        loaded = ", ".join(result["heavy_imports_ms"]) or "none"
+        print(f"   🚀 {command:<8} {result['startup_ms']:>7.0f} ms  (heavy imports: {loaded})")
+
+    models = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_models(directory, args.features, args.rounds, args.seed)
+        print(f"\n🧠 Model load ({args.features} features, {args.rounds} trees)")
+        for model_format, path in paths.items():
+            result = {"format": model_format, "size_kb": round(os.path.getsize(path) / 1024, 1),
+                      **timed_load(path, args.runs)}
+            models.append(result)
+            print(f"   📦 {model_format:<5} {result['size_kb']:>9.0f} KB  load {result['load_ms']:>7.1f} ms  "
+                  f"(process {result['process_ms']:.0f} ms)")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "cpu_count": os.cpu_count(),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "model_features": args.features,
+            "model_rounds": args.rounds,
+        },
+        "interpreter_ms": interpreter_ms,
+        "commands": commands,
+        "model_load": models,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report written to {args.output}")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs speed of reduced caption embeddings.
+Trains the engagement model at several embedding sizes on the same split and
+reports holdout MAE, training time, scoring latency and feature memory.
+
+  python benchmark_embedding_dims.py --offline
+  python benchmark_embedding_dims.py --dims 64 256 1536 --reducers truncate pca --output dims.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_absolute_error, r2_score
+import xgboost as xgb
+from embedding_codec import coalesce_embedding_columns, decode_embeddings
+from embedding_reducer import REDUCERS
+from feature_pipeline import EMBEDDING_DIM
+import train_model
+
+DEFAULT_DIMS = (64, 256, 1536)
+SINGLE_ROW_SAMPLES = 200
+
+def load_data(use_snapshot: bool, offline: bool):
+    if use_snapshot or offline:
+        df, embeddings = train_model.load_snapshot_training_data(offline)
+    else:
+        df, embeddings = train_model.fetch_training_data()
+    if len(df) == 0:
+        print("❌ No labeled data with embeddings found!")
+        sys.exit(1)
+    if embeddings is None:
+        embeddings = decode_embeddings(coalesce_embedding_columns(df), EMBEDDING_DIM)
+    df = train_model.normalize_engagement_scores(df)
+    return df, np.asarray(embeddings)
+
+def run_one(df, embeddings, train_idx, test_idx, dim: int, reducer: str) -> dict:
+    y = df['engagement_score'].to_numpy(dtype=np.float64)
+    train_df = df.iloc[train_idx]
+    test_df = df.iloc[test_idx]
+
+    started = time.perf_counter()
+    X_train, transformer = train_model.prepare_features(
+        train_df, embeddings[train_idx], embedding_dim=dim, reducer=reducer
+    )
+    fit_features = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model = xgb.XGBRegressor(**train_model.DEFAULT_MODEL_PARAMS, random_state=42, n_jobs=-1)
+    model.fit(X_train, y[train_idx])
+    train_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    X_test = transformer.transform(test_df, embeddings[test_idx])
+    predictions = model.predict(X_test)
+    batch_seconds = time.perf_counter() - started
+
+    # Online path: one post at a time, as predict.py serve does
+    rows = test_df.head(SINGLE_ROW_SAMPLES).to_dict('records')
+    started = time.perf_counter()
+    for row, embedding in zip(rows, embeddings[test_idx][:len(rows)]):
+        model.predict(transformer.transform_one(row, embedding)[None, :])
+    single_ms = (time.perf_counter() - started) * 1000 / max(len(rows), 1)
+
+    return {
+        "dim": dim,
+        "reducer": reducer if dim < EMBEDDING_DIM else None,
+        "n_features": int(X_train.shape[1]),
+        "feature_mb": round(X_train.nbytes / 1e6, 2),
+        "feature_seconds": round(fit_features, 3),
+        "train_seconds": round(train_seconds, 3),
+        "batch_predict_ms_per_1k": round(batch_seconds * 1e6 / max(len(test_idx), 1), 2),
+        "single_predict_ms": round(single_ms, 3),
+        "test_mae": round(float(mean_absolute_error(y[test_idx], predictions)), 3),
+        "test_r2": round(float(r2_score(y[test_idx], predictions)), 4),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark reduced embedding sizes")
+    parser.add_argument("--dims", type=int, nargs="+", default=list(DEFAULT_DIMS))
+    parser.add_argument("--reducers", choices=REDUCERS, nargs="+", default=["truncate"])
+    parser.add_argument("--snapshot", action="store_true",
+                        help="sync and read the local feature snapshot")
+    parser.add_argument("--offline", action="store_true",
+                        help="read the existing snapshot without contacting Supabase")
+    parser.add_argument("--output", help="also write the results as JSON")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("🔍 Loading training data...")
+    df, embeddings = load_data(args.snapshot, args.offline)
+    valid = ~np.isnan(df['engagement_score'].to_numpy(dtype=np.float64))
+    df, embeddings = df[valid].reset_index(drop=True), embeddings[valid]
+    train_idx, test_idx = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42)
+    print(f"   ✅ {len(train_idx)} train / {len(test_idx)} holdout posts")
+
+    results = []
+    for dim in sorted(set(args.dims)):
+        reducers = args.reducers if dim < EMBEDDING_DIM else ["truncate"]
+        for reducer in reducers:
+            print(f"\n🎯 dim={dim} reducer={reducer if dim < EMBEDDING_DIM else '-'}")
+            results.append(run_one(df, embeddings, train_idx, test_idx, dim, reducer))
+
+    print(f"\n{'='*60}")
+    print(f"{'dim':>5} {'reducer':>9} {'MAE':>8} {'R²':>8} {'train s':>8} {'1 row ms':>9} {'feat MB':>8}")
+    for r in results:
+        print(f"{r['dim']:>5} {r['reducer'] or '-':>9} {r['test_mae']:>8.2f} {r['test_r2']:>8.3f} "
+              f"{r['train_seconds']:>8.2f} {r['single_predict_ms']:>9.3f} {r['feature_mb']:>8.2f}")
+    print(f"{'='*60}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"n_train": int(len(train_idx)), "n_test": int(len(test_idx)), "results": results}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark of the ml pipeline on synthetic data.
+For each dataset size, generates scraper-style CSVs and table rows
+(synthetic_data.py), then times and memory-profiles every stage:
+
+    import_parse       import_scraped_data.iter_import_rows over the CSV
+    prepare_features   train_model.prepare_features (fit + transform)
+    fit                XGBRegressor.fit on an 80% split
+    predict_batch      model.predict on the 20% holdout
+    predict_single     transform_one + predict, one post at a time
+
+and writes a JSON report (rewritten after every size, so a crash at 1M rows
+keeps the smaller results). Compare two reports to spot regressions:
+
+    python benchmark_pipeline.py --sizes 10000 100000 1000000 --output bench.json
+    python benchmark_pipeline.py --sizes 10000 --compare bench.json
+"""
+
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import sklearn
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_absolute_error
+from instrumentation import current_rss_mb
+import synthetic_data
+import import_scraped_data
+import train_model
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+SINGLE_ROW_SAMPLES = 500
+REGRESSION_THRESHOLD = 0.10  # flag stages >10% slower or hungrier than the baseline
+
+class StageProfiler:
+    """Wall/CPU time per stage, with RSS sampled in the background for its peak."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        start_rss = current_rss_mb()
+        peak = [start_rss]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                peak[0] = max(peak[0], current_rss_mb())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            cpu_seconds = time.process_time() - cpu_started
+            done.set()
+            sampler.join()
+            end_rss = current_rss_mb()
+            self.stages[name] = {
+                "seconds": round(seconds, 4),
+                "cpu_seconds": round(cpu_seconds, 4),
+                "rows": rows,
+                "rows_per_second": round(rows / seconds, 1) if rows and seconds > 0 else None,
+                "rss_start_mb": round(start_rss, 1),
+                "rss_peak_mb": round(max(peak[0], end_rss), 1),
+                "rss_growth_mb": round(max(peak[0], end_rss) - start_rss, 1),
+            }
+            print(f"   ⏱️  {name}: {seconds:.2f}s, peak RSS {max(peak[0], end_rss):.0f} MB")
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_size(n: int, workdir: str, seed: int, embedding_dim: int, reducer: str, rounds: int) -> dict:
+    profiler = StageProfiler()
+    csv_path = os.path.join(workdir, f"synthetic_{n}.csv")
+    embeddings_path = os.path.join(workdir, f"embeddings_{n}.npy")
+
+    print(f"\n📦 {n} rows")
+    started = time.perf_counter()
+    posts = synthetic_data.generate_posts(n, seed)
+    synthetic_data.write_csv(posts, csv_path)
+    embeddings = np.lib.format.open_memmap(embeddings_path, mode="w+", dtype=np.float32,
+                                           shape=(n, train_model.EMBEDDING_DIM))
+    synthetic_data.generate_embeddings(n, train_model.EMBEDDING_DIM, seed, out=embeddings)
+    df = synthetic_data.table_rows(posts, synthetic_data.engagement_scores(posts, embeddings, seed))
+    del posts
+    print(f"   🧪 Generated in {time.perf_counter() - started:.1f}s")
+
+    with profiler.stage("import_parse", rows=n):
+        parsed = sum(1 for row in import_scraped_data.iter_import_rows(csv_path) if row is not None)
+
+    with profiler.stage("prepare_features", rows=n):
+        X, transformer = train_model.prepare_features(df, embeddings, embedding_dim=embedding_dim, reducer=reducer)
+    y = df["engagement_score"].to_numpy(dtype=np.float64)
+
+    train_idx, test_idx = train_test_split(np.arange(n), test_size=0.2, random_state=42)
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+
+    params = dict(train_model.DEFAULT_MODEL_PARAMS)
+    if rounds:
+        params["n_estimators"] = rounds
+    model = xgb.XGBRegressor(**params, random_state=42, n_jobs=-1)
+    with profiler.stage("fit", rows=len(train_idx)):
+        model.fit(X_train, y_train)
+
+    with profiler.stage("predict_batch", rows=len(test_idx)):
+        predictions = model.predict(X_test)
+
+    sample = test_idx[:SINGLE_ROW_SAMPLES]
+    records = df.iloc[sample].to_dict("records")
+    with profiler.stage("predict_single", rows=len(sample)):
+        for record, embedding in zip(records, embeddings[sample]):
+            model.predict(transformer.transform_one(record, embedding)[None, :])
+
+    result = {
+        "rows": n,
+        "parsed_rows": parsed,
+        "n_features": int(X.shape[1]),
+        "feature_mb": round(X.nbytes / 1e6, 1),
+        "test_mae": round(float(mean_absolute_error(y_test, predictions)), 4),
+        "single_predict_ms": round(profiler.stages["predict_single"]["seconds"] * 1000 / max(len(sample), 1), 4),
+        "stages": profiler.stages,
+    }
+    del X, X_train, X_test, embeddings
+    for path in (csv_path, embeddings_path):
+        os.remove(path)
+    return result
+
+def compare(report: dict, baseline: dict):
+    """Print per-stage time and memory changes against a baseline report."""
+    base_runs = {run["rows"]: run for run in baseline.get("runs", [])}
+    print(f"\n{'='*60}")
+    print(f"📈 Against baseline {baseline['meta'].get('git_revision')} ({baseline['meta'].get('created_at')})")
+    for run in report["runs"]:
+        base = base_runs.get(run["rows"])
+        if not base:
+            continue
+        for stage, now in run["stages"].items():
+            before = base["stages"].get(stage)
+            if not before:
+                continue
+            time_change = now["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+            mem_change = (now["rss_growth_mb"] - before["rss_growth_mb"]) / max(before["rss_growth_mb"], 1.0)
+            flag = "⚠️ " if time_change > REGRESSION_THRESHOLD or mem_change > REGRESSION_THRESHOLD else "  "
+            print(f" {flag}{run['rows']:>8} {stage:<17} {before['seconds']:>9.2f}s -> {now['seconds']:>9.2f}s "
+                  f"({time_change:+.0%}), memory {mem_change:+.0%}")
+    print(f"{'='*60}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the ml pipeline on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="dataset sizes (1M rows at 1536 dims needs ~16 GB RAM for the dense path)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--embedding-dim", type=int, default=None,
+                        help="reduce embeddings before training (see train_model.py --embedding-dim)")
+    parser.add_argument("--reducer", default="truncate")
+    parser.add_argument("--rounds", type=int, default=None,
+                        help="override the model's n_estimators")
+    parser.add_argument("--workdir", default=None, help="where generated files go (default: a temp dir)")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  ml Pipeline Benchmark (synthetic data)             ║")
+    print("╚══════════════════════════════════════════════════════╝")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "scikit_learn": sklearn.__version__,
+            "xgboost": xgb.__version__,
+            "seed": args.seed,
+            "embedding_dim": args.embedding_dim or train_model.EMBEDDING_DIM,
+            "reducer": args.reducer if args.embedding_dim else None,
+            "model_params": {**train_model.DEFAULT_MODEL_PARAMS,
+                             **({"n_estimators": args.rounds} if args.rounds else {})},
+        },
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for n in sorted(args.sizes):
+            report["runs"].append(run_size(n, workdir, args.seed, args.embedding_dim, args.reducer, args.rounds))
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+    print(f"\n✅ Report written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
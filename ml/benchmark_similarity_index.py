@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of the IVF similar-post index (similarity_index.py)
+against a brute-force scan of the same memory-mapped embeddings.
+
+Builds an index in a temp dir, then for each --nprobe value reports recall@k
+(share of the exact top k the index returns) and p50/p95 latency of a full
+lookup (centroid ranking, list scan and row details), next to the
+brute-force scan's latency. Also times build and incremental adds.
+
+Embeddings come from the feature snapshot (--snapshot/--offline) or are
+generated: --rows posts around --topics caption "topics", since uniformly
+random vectors have no neighbourhood structure to index.
+
+    python benchmark_similarity_index.py --rows 200000 --nprobe 1 4 16 64
+    python benchmark_similarity_index.py --offline --output similarity.json
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+from benchmark_pipeline import git_revision
+from embedding_codec import EMBEDDING_DIMENSIONS
+from similarity_index import CHUNK_ROWS, SimilarityIndex, default_nlist, snapshot_rows, _top, _unit_rows
+import storage
+
+def clustered_embeddings(n: int, dim: int, topics: int, seed: int, out=None) -> np.ndarray:
+    """Unit vectors scattered around `topics` random centers, chunk by chunk into `out`."""
+    rng = np.random.default_rng(seed)
+    centers = _unit_rows(rng.standard_normal((topics, dim)))
+    out = out if out is not None else np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, CHUNK_ROWS):
+        m = min(CHUNK_ROWS, n - start)
+        noise = rng.standard_normal((m, dim)).astype(np.float32) * (1.2 / np.sqrt(dim))
+        out[start:start + m] = _unit_rows(centers[rng.integers(0, topics, m)] + noise)
+    return out
+
+def brute_force(embeddings, query: np.ndarray, k: int) -> np.ndarray:
+    """Exact top-k positions by cosine similarity, scanning in chunks."""
+    best_positions, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    for start in range(0, embeddings.shape[0], CHUNK_ROWS * 4):
+        chunk = np.asarray(embeddings[start:start + CHUNK_ROWS * 4])
+        scores = chunk @ query
+        top = _top(scores, k)
+        best_positions = np.concatenate([best_positions, top + start])
+        best_scores = np.concatenate([best_scores, scores[top]])
+        keep = _top(best_scores, k)
+        best_positions, best_scores = best_positions[keep], best_scores[keep]
+    return best_positions
+
+def percentiles_ms(seconds: list) -> dict:
+    ms = np.asarray(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "mean_ms": round(float(ms.mean()), 3)}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the similar-post index against brute force")
+    parser.add_argument("--rows", type=int, default=100_000, help="generated posts to index")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--snapshot", action="store_true", help="index the synced feature snapshot instead")
+    parser.add_argument("--offline", action="store_true", help="index the snapshot without syncing it")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--brute-queries", type=int, default=20,
+                        help="queries timed with the brute-force scan (ground truth covers all)")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--add-rows", type=int, default=1000, help="rows timed through incremental add")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=None, help="where the index goes (default: a temp dir)")
+    parser.add_argument("--output", default="similarity_benchmark.json")
+    storage.add_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  Similar-Post Index Benchmark                       ║")
+    print("╚══════════════════════════════════════════════════════╝")
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        if args.snapshot or args.offline:
+            storage.configure(args.backend, args.sqlite_path)
+            rows, embeddings = snapshot_rows(args.offline)
+            ids = rows["id"].astype(str).tolist()
+            details = rows[[c for c in ("engagement_score", "post_url", "caption") if c in rows.columns]] \
+                .to_dict("records")
+            # Indexed snapshot rows serve as queries (each also finds itself)
+            query_rows = rng.choice(len(ids), min(args.queries, len(ids)), replace=False)
+            queries = _unit_rows(embeddings[np.sort(query_rows)])
+            source = "snapshot"
+        else:
+            path = os.path.join(workdir, "embeddings.npy")
+            total = args.rows + args.add_rows + args.queries
+            matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(total, args.dim))
+            clustered_embeddings(total, args.dim, args.topics, args.seed, out=matrix)
+            matrix.flush()
+            embeddings = np.load(path, mmap_mode="r")
+            ids = [str(i) for i in range(total)]
+            details = [{"engagement_score": float(s)} for s in rng.uniform(0, 100, total)]
+            queries = np.asarray(embeddings[total - args.queries:])
+            source = "synthetic"
+
+        n = len(ids) - (0 if source == "snapshot" else args.add_rows + args.queries)
+        add_rows = 0 if source == "snapshot" else args.add_rows
+        nlist = args.nlist or default_nlist(n)
+        print(f"📦 {n} {source} embeddings ({embeddings.shape[1]} dims), {nlist} lists, {len(queries)} queries")
+
+        index_dir = os.path.join(workdir, "index")
+        started = time.perf_counter()
+        index = SimilarityIndex.build(ids[:n], embeddings[:n] if source == "synthetic" else embeddings,
+                                      details[:n], index_dir, nlist, args.seed)
+        build_seconds = time.perf_counter() - started
+        print(f"   🧭 Built in {build_seconds:.1f}s")
+
+        add_seconds = None
+        if add_rows:
+            started = time.perf_counter()
+            for start in range(n, n + add_rows, 100):
+                stop = min(start + 100, n + add_rows)
+                index.add(ids[start:stop], embeddings[start:stop], details[start:stop])
+            add_seconds = time.perf_counter() - started
+            print(f"   ➕ Added {add_rows} rows in batches of 100: {add_rows / add_seconds:.0f} rows/s")
+
+        # Ground truth over everything the index holds, in index positions
+        truth = [set(brute_force(index.vectors, q, args.k).tolist()) for q in queries]
+        brute_seconds = []
+        for q in queries[:args.brute_queries]:
+            started = time.perf_counter()
+            brute_force(index.vectors, q, args.k)
+            brute_seconds.append(time.perf_counter() - started)
+        brute = percentiles_ms(brute_seconds)
+        print(f"   🐢 Brute force: p50 {brute['p50_ms']:.1f} ms, p95 {brute['p95_ms']:.1f} ms")
+
+        results = []
+        for nprobe in args.nprobe:
+            seconds, recalls = [], []
+            for q, exact in zip(queries, truth):
+                started = time.perf_counter()
+                index.search(q, args.k, nprobe)
+                seconds.append(time.perf_counter() - started)
+                positions, _ = index.search_positions(q, args.k, nprobe)
+                recalls.append(len(exact & set(positions.tolist())) / max(len(exact), 1))
+            latency = percentiles_ms(seconds)
+            result = {"nprobe": nprobe, "recall_at_k": round(float(np.mean(recalls)), 4), **latency,
+                      "speedup_vs_brute_force": round(brute["p50_ms"] / max(latency["p50_ms"], 1e-6), 1)}
+            results.append(result)
+            print(f"   🔎 nprobe {nprobe:>4}: recall@{args.k} {result['recall_at_k']:.3f}, "
+                  f"p50 {latency['p50_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms")
+        index.close()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "cpu_count": os.cpu_count(),
+            "source": source,
+            "rows": n + add_rows,
+            "dim": int(embeddings.shape[1]),
+            "nlist": nlist,
+            "k": args.k,
+            "queries": len(queries),
+            "seed": args.seed,
+        },
+        "build_seconds": round(build_seconds, 3),
+        "add_rows_per_second": round(add_rows / add_seconds, 1) if add_seconds else None,
+        "brute_force": brute,
+        "ivf": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Report written to {args.output}")
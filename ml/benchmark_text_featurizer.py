@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Compare caption featurizers: stored OpenAI embeddings against the local
+CPU featurizers (caption_featurizer.py). Every featurizer trains the same
+XGBoost model on the same split, fitted on the training rows only, and is
+scored on:
+
+    accuracy     test MAE / R²
+    throughput   posts/s to featurize and score the holdout as a batch, and
+                 per-post latency of transform_one + predict
+
+For the OpenAI path the local cost is only copying stored embeddings; the
+real cost is the API round trip, measured on --api-sample captions when
+OPENAI_API_KEY is set (reported as api_posts_per_second).
+
+Accuracy needs real labeled captions, so rows come from the configured
+storage backend (or the feature snapshot with --snapshot/--offline).
+--synthetic N benchmarks throughput on generated posts instead; their
+captions carry no signal, so its accuracy numbers are not meaningful.
+
+    python benchmark_text_featurizer.py --offline --output featurizers.json
+    python benchmark_text_featurizer.py --synthetic 100000 --featurizers hashing tfidf_svd
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_absolute_error, r2_score
+from caption_featurizer import FEATURIZERS
+from embedding_codec import coalesce_embedding_columns, decode_embeddings
+from benchmark_pipeline import git_revision
+import storage
+import synthetic_data
+import train_model
+
+SINGLE_ROW_SAMPLES = 500
+
+def load_rows(args):
+    """(df, embeddings) for labeled rows that have both a caption and an embedding."""
+    if args.synthetic:
+        posts = synthetic_data.generate_posts(args.synthetic, args.seed)
+        embeddings = synthetic_data.generate_embeddings(args.synthetic, train_model.EMBEDDING_DIM, args.seed)
+        df = synthetic_data.table_rows(posts, synthetic_data.engagement_scores(posts, embeddings, args.seed))
+        return df, embeddings
+    if args.snapshot or args.offline:
+        df, embeddings = train_model.load_snapshot_training_data(args.offline)
+    else:
+        df, _ = train_model.fetch_training_data()
+        embeddings = decode_embeddings(coalesce_embedding_columns(df), train_model.EMBEDDING_DIM)
+    df = train_model.normalize_engagement_scores(df, train_model.image_score_range(df), verbose=False)
+    return df, embeddings
+
+def embed_with_api(captions: list) -> float:
+    """OpenAI embedding throughput (posts/s) over captions, in the importer's batches."""
+    import generate_embeddings
+    limiter = generate_embeddings.RateLimiter(generate_embeddings.DEFAULT_RPM, generate_embeddings.DEFAULT_TPM)
+    texts = [c[:generate_embeddings.MAX_INPUT_CHARS] for c in captions if isinstance(c, str) and c.strip()]
+    started = time.perf_counter()
+    for start in range(0, len(texts), generate_embeddings.DEFAULT_BATCH_SIZE):
+        generate_embeddings.generate_embeddings_batch(texts[start:start + generate_embeddings.DEFAULT_BATCH_SIZE],
+                                                      limiter)
+    return len(texts) / max(time.perf_counter() - started, 1e-9)
+
+def run_featurizer(featurizer: str, df, embeddings, train_idx, test_idx, args) -> dict:
+    print(f"\n🔤 {featurizer}")
+    train_df = df.iloc[train_idx].reset_index(drop=True)
+    test_df = df.iloc[test_idx].reset_index(drop=True)
+    local = featurizer != "openai"
+    dim = args.text_dim if local else args.embedding_dim
+
+    started = time.perf_counter()
+    transformer = train_model.fit_transformer(train_df, None if local else embeddings[train_idx],
+                                              dim, args.reducer, featurizer)
+    fit_featurizer_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    X_train, _ = train_model.prepare_features(train_df, None if local else embeddings[train_idx], transformer)
+    featurize_train_seconds = time.perf_counter() - started
+
+    params = dict(train_model.DEFAULT_MODEL_PARAMS)
+    if args.rounds:
+        params["n_estimators"] = args.rounds
+    model = xgb.XGBRegressor(**params, random_state=42, n_jobs=-1)
+    y_train = train_df["engagement_score"].to_numpy(dtype=np.float64)
+    y_test = test_df["engagement_score"].to_numpy(dtype=np.float64)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    del X_train
+
+    # Batch scoring: captions (or stored embeddings) in, scores out
+    test_embeddings = None if local else embeddings[test_idx]
+    started = time.perf_counter()
+    X_test, _ = train_model.prepare_features(test_df, test_embeddings, transformer)
+    predictions = model.predict(X_test)
+    batch_seconds = time.perf_counter() - started
+
+    sample = min(len(test_df), SINGLE_ROW_SAMPLES)
+    records = test_df.iloc[:sample].to_dict("records")
+    started = time.perf_counter()
+    for i, record in enumerate(records):
+        model.predict(transformer.transform_one(record, None if local else test_embeddings[i])[None, :])
+    single_seconds = time.perf_counter() - started
+
+    result = {
+        "featurizer": featurizer,
+        "caption_dim": transformer.embedding_features,
+        "n_features": transformer.n_features,
+        "test_mae": round(float(mean_absolute_error(y_test, predictions)), 4),
+        "test_r2": round(float(r2_score(y_test, predictions)), 4),
+        "fit_featurizer_seconds": round(fit_featurizer_seconds, 4),
+        "featurize_train_posts_per_second": round(len(train_df) / max(featurize_train_seconds, 1e-9), 1),
+        "fit_seconds": round(fit_seconds, 4),
+        "batch_posts_per_second": round(len(test_df) / max(batch_seconds, 1e-9), 1),
+        "single_predict_ms": round(single_seconds * 1000 / max(sample, 1), 4),
+        "transformer_kb": round(len(json.dumps(transformer.to_dict())) / 1024, 1),
+        "api_posts_per_second": None,
+    }
+    if not local and args.api_sample:
+        if os.getenv("OPENAI_API_KEY"):
+            result["api_posts_per_second"] = round(embed_with_api(list(test_df["caption"][:args.api_sample])), 1)
+        else:
+            print("   ⚠️  OPENAI_API_KEY not set, skipping the API throughput sample")
+    print(f"   ✅ MAE {result['test_mae']:.2f}, R² {result['test_r2']:.4f}, "
+          f"{result['batch_posts_per_second']:.0f} posts/s batch, {result['single_predict_ms']:.2f} ms/post")
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark local caption featurizers against OpenAI embeddings")
+    parser.add_argument("--featurizers", nargs="+", choices=FEATURIZERS, default=list(FEATURIZERS))
+    parser.add_argument("--snapshot", action="store_true", help="sync and read the local feature snapshot")
+    parser.add_argument("--offline", action="store_true", help="read the existing snapshot without syncing")
+    parser.add_argument("--synthetic", type=int, metavar="ROWS",
+                        help="generated posts instead of stored data (throughput only)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--text-dim", type=int, default=None,
+                        help="output size of the local featurizers (default: per method)")
+    parser.add_argument("--embedding-dim", type=int, default=None,
+                        help="reduce the OpenAI embeddings first (see train_model.py --embedding-dim)")
+    parser.add_argument("--reducer", default="truncate")
+    parser.add_argument("--rounds", type=int, default=None, help="override the model's n_estimators")
+    parser.add_argument("--api-sample", type=int, default=0,
+                        help="holdout captions to embed through the OpenAI API for its throughput")
+    parser.add_argument("--output", default="featurizer_benchmark.json")
+    storage.add_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  Caption Featurizer Benchmark                       ║")
+    print("╚══════════════════════════════════════════════════════╝")
+
+    storage.configure(args.backend, args.sqlite_path)
+    df, embeddings = load_rows(args)
+    if len(df) < 10:
+        print(f"❌ Need at least 10 labeled posts with embeddings, found {len(df)}")
+        sys.exit(1)
+    y = df["engagement_score"].to_numpy(dtype=np.float64)
+    rows = np.nonzero(~np.isnan(y))[0]
+    train_idx, test_idx = train_test_split(rows, test_size=0.2, random_state=42)
+    print(f"📊 {len(train_idx)} training / {len(test_idx)} holdout posts")
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "cpu_count": os.cpu_count(),
+            "source": "synthetic" if args.synthetic else ("snapshot" if args.snapshot or args.offline
+                                                         else storage.backend()),
+            "rows": int(len(rows)),
+            "seed": args.seed,
+        },
+        "featurizers": [],
+    }
+    for featurizer in args.featurizers:
+        report["featurizers"].append(run_featurizer(featurizer, df, embeddings, train_idx, test_idx, args))
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print(f" {'featurizer':<11} {'dim':>5} {'MAE':>8} {'R²':>8} {'posts/s':>10} {'ms/post':>8}")
+    for result in report["featurizers"]:
+        print(f" {result['featurizer']:<11} {result['caption_dim']:>5} {result['test_mae']:>8.2f} "
+              f"{result['test_r2']:>8.4f} {result['batch_posts_per_second']:>10.0f} {result['single_predict_ms']:>8.2f}")
+    print(f"{'='*60}")
+    print(f"✅ Report written to {args.output}")
@@ -0,0 +1,126 @@
+"""
+Local caption featurizers: an in-process, CPU-only alternative to OpenAI
+caption embeddings. A featurizer turns raw caption text into the feature
+transformer's caption block, so training and scoring need neither stored
+embeddings nor API calls. Methods:
+
+    openai     stored text-embedding-3 embeddings (the default; no featurizer)
+    hashing    signed hashing of word unigrams/bigrams into `dim` buckets,
+               L2-normalized. Stateless, nothing to fit or store.
+    tfidf_svd  TF-IDF over the training captions' vocabulary, projected onto
+               `dim` latent components (truncated SVD / LSA) and L2-normalized
+
+A fitted featurizer is saved inside the feature transformer (vocabulary,
+idf weights and components for tfidf_svd), so scoring rebuilds the same
+caption block from the post's caption. scikit-learn is imported when a
+featurizer is built, not with this module.
+"""
+
+import numpy as np
+from embedding_codec import decode_embedding, encode_embedding
+
+FEATURIZERS = ("openai", "hashing", "tfidf_svd")
+LOCAL_FEATURIZERS = ("hashing", "tfidf_svd")
+DEFAULT_DIMS = {"hashing": 512, "tfidf_svd": 128}
+MAX_VOCABULARY = 5000
+MIN_DOCUMENT_COUNT = 2
+NGRAM_RANGE = (1, 2)
+MAX_CAPTION_CHARS = 8000  # same cut as the text sent for OpenAI embeddings
+
+def _captions(captions) -> list:
+    """Caption texts with missing values as empty strings."""
+    return [c[:MAX_CAPTION_CHARS] if isinstance(c, str) else "" for c in captions]
+
+class CaptionFeaturizer:
+    """Maps captions to (n, dim) float32 vectors; empty captions stay all-zero."""
+
+    def __init__(self, method: str, dim: int = None, seed: int = 42,
+                 max_vocabulary: int = MAX_VOCABULARY):
+        if method not in LOCAL_FEATURIZERS:
+            raise ValueError(f"Unknown caption featurizer: {method}")
+        dim = dim or DEFAULT_DIMS[method]
+        if dim <= 0:
+            raise ValueError(f"Caption feature dimension must be positive, got {dim}")
+        self.method = method
+        self.dim = dim
+        self.seed = seed
+        self.max_vocabulary = max_vocabulary
+        self.vocabulary = None  # terms in column order (tfidf_svd)
+        self.idf = None
+        self.components = None  # (len(vocabulary), dim)
+        self._vectorizer = None
+        if method == "hashing":
+            from sklearn.feature_extraction.text import HashingVectorizer
+            self._vectorizer = HashingVectorizer(n_features=dim, ngram_range=NGRAM_RANGE,
+                                                 alternate_sign=True, norm="l2", dtype=np.float32)
+
+    @property
+    def fitted(self) -> bool:
+        return self.method == "hashing" or self.components is not None
+
+    def fit(self, captions):
+        """Learn the vocabulary, idf weights and components; a no-op for hashing."""
+        if self.method != "tfidf_svd":
+            return self
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        tfidf = TfidfVectorizer(ngram_range=NGRAM_RANGE, max_features=self.max_vocabulary,
+                                min_df=MIN_DOCUMENT_COUNT, dtype=np.float32)
+        try:
+            weights = tfidf.fit_transform(_captions(captions))
+        except ValueError:
+            raise ValueError("tfidf_svd featurizer found no caption terms to fit on") from None
+        terms = tfidf.get_feature_names_out()
+        components = np.zeros((len(terms), self.dim), dtype=np.float32)
+        # SVD needs fewer components than terms; any extra columns stay zero
+        k = min(self.dim, len(terms) - 1, weights.shape[0] - 1)
+        if k > 0:
+            svd = TruncatedSVD(n_components=k, random_state=self.seed).fit(weights)
+            components[:, :k] = svd.components_.T
+        self._set_state(list(terms), tfidf.idf_.astype(np.float32), components)
+        return self
+
+    def _set_state(self, vocabulary, idf, components):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.components = components
+        # A fixed vocabulary needs no fit, so a loaded featurizer counts terms directly
+        self._vectorizer = CountVectorizer(ngram_range=NGRAM_RANGE, dtype=np.float32,
+                                           vocabulary={term: i for i, term in enumerate(vocabulary)})
+
+    def transform(self, captions) -> np.ndarray:
+        if not self.fitted:
+            raise ValueError("tfidf_svd featurizer used before fit()")
+        counts = self._vectorizer.transform(_captions(captions))
+        if self.method == "hashing":
+            return counts.toarray()
+        import scipy.sparse as sp
+        from sklearn.preprocessing import normalize
+
+        weights = normalize(counts @ sp.diags(self.idf), norm="l2", copy=False)
+        return normalize(np.asarray(weights @ self.components, dtype=np.float32), norm="l2", copy=False)
+
+    def transform_one(self, caption) -> np.ndarray:
+        return self.transform([caption])[0]
+
+    def to_dict(self) -> dict:
+        data = {"method": self.method, "dim": self.dim, "seed": self.seed,
+                "max_vocabulary": self.max_vocabulary}
+        if self.method == "tfidf_svd" and self.components is not None:
+            data["vocabulary"] = self.vocabulary
+            data["idf"] = encode_embedding(self.idf, "f32")
+            data["components"] = encode_embedding(self.components.ravel(), "f32")
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        featurizer = cls(data["method"], data["dim"], data.get("seed", 42),
+                         data.get("max_vocabulary", MAX_VOCABULARY))
+        if "components" in data:
+            vocabulary = data["vocabulary"]
+            components = decode_embedding(data["components"]).reshape(len(vocabulary), featurizer.dim)
+            featurizer._set_state(vocabulary, decode_embedding(data["idf"]), components)
+        return featurizer
@@ -0,0 +1,137 @@
+"""
+Persistent local cache of caption embeddings.
+Keyed by a hash of the normalized caption text and the embedding model, so
+reposts and duplicated promo captions are only embedded once.
+Backed by SQLite with a size-bounded LRU eviction policy.
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from embedding_inputs import normalize_caption
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+def cache_key(text: str, model: str) -> str:
+    """Hash of the normalized caption text and model name."""
+    payload = f"{model}\x00{normalize_caption(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with LRU eviction.
+
+    Safe to share between threads; all access goes through one connection
+    guarded by a lock.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys: list) -> dict:
+        """Return {key: embedding} for the keys present in the cache."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        if not unique:
+            return found
+        
+        with self.lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                chunk = unique[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self.conn.commit()
+            
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        
+        return found
+
+    def get(self, key: str):
+        """Return a single cached embedding or None."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict, model: str):
+        """Store {key: embedding} and evict least-recently-used entries."""
+        if not items:
+            return
+        
+        now = time.time()
+        rows = []
+        for key, embedding in items.items():
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((key, model, int(vector.shape[0]), vector.tobytes(), now))
+        
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dims, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
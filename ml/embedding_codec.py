@@ -0,0 +1,116 @@
+"""
+Compact storage format for caption embeddings.
+Embeddings can be stored either as JSON text in caption_embedding (the
+default) or as a base64 float16/float32 blob in caption_embedding_bin, a
+column added by add_caption_embedding_bin_column.sql:
+
+    "f16:<base64 of little-endian float16 values>"
+    "f32:<base64 of little-endian float32 values>"
+
+A 1536-dim float16 blob is ~4 KB against ~30 KB of JSON, and decodes with a
+single np.frombuffer instead of parsing 1536 floats.
+"""
+
+import os
+import json
+import base64
+import numpy as np
+
+STORAGE_FORMATS = ("json", "f16", "f32")
+DEFAULT_STORAGE = os.getenv("EMBEDDING_STORAGE", "json")
+BINARY_COLUMN = "caption_embedding_bin"
+# text-embedding-3-small returns 1536 values; generate_embeddings.py can ask
+# for fewer (EMBEDDING_DIMENSIONS), which every reader must then agree on
+NATIVE_DIMENSIONS = 1536
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(NATIVE_DIMENSIONS)))
+
+_DTYPES = {
+    "f16": np.dtype("<f2"),
+    "f32": np.dtype("<f4"),
+}
+
+def encode_embedding(embedding, storage: str = DEFAULT_STORAGE) -> str:
+    """Encode one embedding as JSON text or a prefixed base64 blob."""
+    if storage == "json":
+        return json.dumps([float(v) for v in embedding])
+    if storage not in _DTYPES:
+        raise ValueError(f"Unknown embedding storage format: {storage}")
+    raw = np.asarray(embedding, dtype=_DTYPES[storage]).tobytes()
+    return f"{storage}:{base64.b64encode(raw).decode('ascii')}"
+
+def embedding_columns(embedding, storage: str = DEFAULT_STORAGE) -> dict:
+    """Column values to write for one embedding in the given storage format."""
+    if storage == "json":
+        return {"caption_embedding": encode_embedding(embedding, "json")}
+    return {BINARY_COLUMN: encode_embedding(embedding, storage)}
+
+def stored_columns(binary: bool) -> tuple:
+    """Columns that may hold an embedding; binary when caption_embedding_bin exists."""
+    return ("caption_embedding", BINARY_COLUMN) if binary else ("caption_embedding",)
+
+def has_embedding_filter(binary: bool) -> str:
+    """or_() condition matching rows with an embedding in any stored column."""
+    return ",".join(f"{column}.not.is.null" for column in stored_columns(binary))
+
+def is_blob(value) -> bool:
+    return isinstance(value, str) and value[:4] in ("f16:", "f32:")
+
+def decode_embedding(value) -> np.ndarray:
+    """Decode one stored embedding (blob, JSON text or list) to float32."""
+    if value is None:
+        return None
+    if is_blob(value):
+        raw = base64.b64decode(value[4:])
+        return np.frombuffer(raw, dtype=_DTYPES[value[:3]]).astype(np.float32)
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def decode_embeddings(values, dim: int) -> np.ndarray:
+    """Decode a column of stored embeddings into a float32 matrix.
+
+    Accepts any mix of blobs, JSON strings and lists. Rows without an
+    embedding stay all-zero. JSON strings are parsed in one vectorized call
+    instead of one json.loads per row.
+    """
+    values = list(values)
+    matrix = np.zeros((len(values), dim), dtype=np.float32)
+
+    json_rows, json_values = [], []
+    list_rows, list_values = [], []
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            if is_blob(value):
+                matrix[i] = decode_embedding(value)
+            elif value:
+                json_rows.append(i)
+                json_values.append(value)
+        elif isinstance(value, (list, tuple, np.ndarray)) and len(value) > 0:
+            list_rows.append(i)
+            list_values.append(value)
+
+    if json_rows:
+        try:
+            # numpy's C text parser handles "[a, b, ...]" bodies faster than json
+            parsed = np.loadtxt([v.strip()[1:-1] for v in json_values],
+                                delimiter=",", dtype=np.float32, ndmin=2)
+        except ValueError:
+            parsed = json.loads("[" + ",".join(json_values) + "]")
+        matrix[json_rows] = np.asarray(parsed, dtype=np.float32)
+    if list_rows:
+        matrix[list_rows] = np.asarray(list_values, dtype=np.float32)
+
+    return matrix
+
+def coalesce_embedding_columns(df):
+    """Per-row stored embedding: the binary column when set, else the JSON one."""
+    binary = df[BINARY_COLUMN] if BINARY_COLUMN in df.columns else None
+    legacy = df["caption_embedding"] if "caption_embedding" in df.columns else None
+    if binary is None and legacy is None:
+        import pandas as pd
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    if binary is None:
+        return legacy
+    if legacy is None:
+        return binary
+    return binary.where(binary.notna(), legacy)
@@ -0,0 +1,21 @@
+"""
+What a caption costs as embeddings API input: the length cap, the
+whitespace normalization the embedding cache keys on, and the token
+estimate used for rate limiting and spend reports.
+Standard library only, so per-row callers (the importer's near-duplicate
+check) can use it without loading the embedding client.
+"""
+
+import re
+
+MAX_INPUT_CHARS = 8000  # Limit to 8000 chars (OpenAI limit)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_caption(text: str) -> str:
+    """Collapse whitespace so trivially different copies share a key."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 chars per token) used for budgeting."""
+    return max(1, len(text) // 4)
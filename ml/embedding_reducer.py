@@ -0,0 +1,120 @@
+"""
+Caption embedding dimensionality reduction.
+The embedding block is most of every feature vector, so shrinking it cuts
+training time and memory. Methods:
+
+    truncate  keep the first `dim` values and re-normalize. text-embedding-3
+              models are trained so this equals requesting `dimensions=dim`
+              from the API, without re-embedding stored captions.
+    pca       project onto the top `dim` principal components of the
+              training embeddings
+    random    Gaussian random projection (regenerated from the seed)
+
+A fitted reducer is saved inside the feature transformer, so scoring applies
+the same projection automatically.
+"""
+
+import numpy as np
+from embedding_codec import decode_embedding, encode_embedding
+
+REDUCERS = ("truncate", "pca", "random")
+FIT_CHUNK_ROWS = 4096
+
+class EmbeddingReducer:
+    """Maps (n, source_dim) embeddings to (n, dim); all-zero rows (no embedding) stay zero."""
+
+    def __init__(self, method: str, dim: int, source_dim: int, seed: int = 42):
+        if method not in REDUCERS:
+            raise ValueError(f"Unknown embedding reducer: {method}")
+        if not 0 < dim <= source_dim:
+            raise ValueError(f"Reduced dimension {dim} must be in 1..{source_dim}")
+        self.method = method
+        self.dim = dim
+        self.source_dim = source_dim
+        self.seed = seed
+        self.mean = None
+        self.components = None  # (source_dim, dim)
+        self._n = 0
+        self._total = None
+        self._gram = None
+        if method == "random":
+            rng = np.random.default_rng(seed)
+            self.components = (rng.standard_normal((source_dim, dim)) / np.sqrt(dim)).astype(np.float32)
+
+    def fit(self, embeddings):
+        """Fit PCA components; a no-op for truncate and random.
+
+        Works in row chunks, so a memory-mapped matrix is never loaded whole.
+        """
+        if self.method != "pca":
+            return self
+        for start in range(0, embeddings.shape[0], FIT_CHUNK_ROWS):
+            self.partial_fit(embeddings[start:start + FIT_CHUNK_ROWS])
+        return self.finish_fit()
+
+    def partial_fit(self, embeddings):
+        """Accumulate PCA statistics from one chunk of rows."""
+        if self.method != "pca":
+            return self
+        if self._gram is None:
+            self._n = 0
+            self._total = np.zeros(self.source_dim, dtype=np.float64)
+            self._gram = np.zeros((self.source_dim, self.source_dim), dtype=np.float64)
+        chunk = np.asarray(embeddings, dtype=np.float64)
+        self._n += chunk.shape[0]
+        self._total += chunk.sum(axis=0)
+        self._gram += chunk.T @ chunk
+        return self
+
+    def finish_fit(self):
+        """Turn the accumulated statistics into components."""
+        if self.method != "pca":
+            return self
+        if self._gram is None:
+            raise ValueError("PCA reducer has no rows to fit")
+        n = max(self._n, 1)
+        mean = self._total / n
+        covariance = self._gram / n - np.outer(mean, mean)
+        # eigh returns ascending eigenvalues; keep the largest `dim`
+        _, vectors = np.linalg.eigh(covariance)
+        self.mean = mean.astype(np.float32)
+        self.components = np.ascontiguousarray(vectors[:, ::-1][:, :self.dim], dtype=np.float32)
+        self._gram = self._total = None
+        return self
+
+    def transform(self, embeddings) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        present = np.any(embeddings != 0, axis=1)
+        if self.method == "truncate":
+            reduced = embeddings[:, :self.dim].copy()
+            norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+            np.divide(reduced, norms, out=reduced, where=norms > 0)
+        else:
+            if self.components is None:
+                raise ValueError("PCA reducer used before fit()")
+            # float64 keeps batch and single-row results identical once
+            # rounded back to float32 (BLAS blocking differs by batch size)
+            centered = embeddings.astype(np.float64)
+            if self.mean is not None:
+                centered -= self.mean
+            reduced = (centered @ self.components.astype(np.float64)).astype(np.float32)
+        reduced[~present] = 0.0
+        return reduced
+
+    def transform_one(self, embedding) -> np.ndarray:
+        return self.transform(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+
+    def to_dict(self) -> dict:
+        data = {"method": self.method, "dim": self.dim, "source_dim": self.source_dim, "seed": self.seed}
+        if self.method == "pca" and self.components is not None:
+            data["mean"] = encode_embedding(self.mean, "f32")
+            data["components"] = encode_embedding(self.components.ravel(), "f32")
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        reducer = cls(data["method"], data["dim"], data["source_dim"], data.get("seed", 42))
+        if "components" in data:
+            reducer.mean = decode_embedding(data["mean"])
+            reducer.components = decode_embedding(data["components"]).reshape(reducer.source_dim, reducer.dim)
+        return reducer
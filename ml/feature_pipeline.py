@@ -0,0 +1,406 @@
+"""
+Feature layout for the engagement model.
+FeatureTransformer is fitted once on the training rows, saved next to the
+model, and reused at scoring time so the column layout never depends on the
+rows being scored.
+
+Column blocks, in order:
+  1. caption embedding (embedding_dim, or the reducer's dim when the
+     transformer carries an EmbeddingReducer), or the local
+     CaptionFeaturizer's vectors computed from the caption text
+  2. likes, comments, views, followers
+  3. post type one-hot
+  4-6. theme / tone / color multi-hot, each followed by an "other" column set
+       when a row has a value outside the fitted vocabulary
+  7. cta_present, paid
+  8. posting hour / 24
+  9. language one-hot
+"""
+
+import re
+import json
+import numpy as np
+import pandas as pd
+from embedding_codec import EMBEDDING_DIMENSIONS, coalesce_embedding_columns, decode_embedding, decode_embeddings
+from embedding_reducer import EmbeddingReducer
+from caption_featurizer import CaptionFeaturizer
+
+EMBEDDING_DIM = EMBEDDING_DIMENSIONS  # stored caption embedding size
+POST_TYPES = ['reel', 'video', 'image', 'carousel']
+LANGUAGES = ['English', 'Hindi', 'Bengali', 'Hinglish', 'Other']
+MULTI_HOT_COLUMNS = (('themes', 'theme'), ('tones', 'tone'), ('colors', 'dominant_color'))
+TRANSFORMER_VERSION = 1
+
+_HOUR = re.compile(r"^\s*([+-]?\d+)\s*$")
+
+def split_comma_separated(value):
+    """Split comma-separated string into list of values."""
+    if not value or pd.isna(value):
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(',') if v.strip()]
+    return []
+
+def _column(df, name, default=None):
+    """Column as a Series, or a constant Series when the column is missing."""
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+def _numeric(series) -> np.ndarray:
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)
+
+def _numeric_or_zero(series) -> np.ndarray:
+    """float(value or 0): missing values (None or NaN) become 0."""
+    return np.nan_to_num(_numeric(series.where(series.notna(), 0)), nan=0.0)
+
+def _truthy(series) -> np.ndarray:
+    return series.where(series.notna(), False).astype(bool).to_numpy(dtype=np.float32)
+
+def _exploded_values(series) -> pd.Series:
+    """Comma-separated column -> one stripped, non-empty value per entry.
+
+    The index holds the row position each value came from.
+    """
+    series = series.reset_index(drop=True)
+    series = series.where(series.map(lambda v: isinstance(v, str)))
+    exploded = series.str.split(",").explode().dropna().str.strip()
+    return exploded[exploded != ""]
+
+def _fill_one_hot(matrix, offset, series, categories):
+    """Set matrix[row, offset + k] = 1 where series == categories[k]."""
+    codes = pd.Index(categories).get_indexer(series.to_numpy())
+    rows = np.nonzero(codes >= 0)[0]
+    matrix[rows, offset + codes[rows]] = 1.0
+
+def _fill_multi_hot(matrix, offset, exploded, vocabulary, other_column=None):
+    """Set matrix[row, offset + k] = 1 for each exploded value in vocabulary.
+
+    Values outside the vocabulary set `other_column` when one is given.
+    """
+    if exploded.empty:
+        return
+    codes = pd.Index(vocabulary, dtype=object).get_indexer(exploded.to_numpy())
+    rows = exploded.index.to_numpy()
+    known = codes >= 0
+    matrix[rows[known], offset + codes[known]] = 1.0
+    if other_column is not None:
+        matrix[rows[~known], other_column] = 1.0
+
+def _posting_hours(series) -> np.ndarray:
+    """Posting hour / 24, or 0.5 when missing or unparseable."""
+    hours = np.full(len(series), 0.5, dtype=np.float32)
+    text = series.reset_index(drop=True)
+    present = text.notna() & (text.astype(str) != "")
+    if not present.any():
+        return hours
+    head = text[present].astype(str).str.split(":").str[0]
+    parsed = pd.to_numeric(head.str.extract(_HOUR.pattern)[0], errors="coerce")
+    valid = parsed.notna()
+    hours[parsed.index[valid].to_numpy()] = parsed[valid].to_numpy() / 24.0
+    return hours
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+class FeatureTransformer:
+    """Fitted feature layout: vocabularies as value -> column index dicts."""
+
+    def __init__(self, themes=(), tones=(), colors=(), embedding_dim: int = EMBEDDING_DIM,
+                 unknown_bucket: bool = True, min_count: int = 1, reducer: EmbeddingReducer = None,
+                 featurizer: CaptionFeaturizer = None):
+        if featurizer is not None:
+            if reducer is not None:
+                raise ValueError("A caption featurizer replaces stored embeddings; it takes no reducer")
+            embedding_dim = featurizer.dim
+        if reducer is not None and reducer.source_dim != embedding_dim:
+            raise ValueError(f"Reducer expects {reducer.source_dim}-dim embeddings, got {embedding_dim}")
+        self.embedding_dim = embedding_dim
+        self.reducer = reducer
+        self.featurizer = featurizer
+        self.unknown_bucket = unknown_bucket
+        self.min_count = min_count
+        self.vocabularies = {
+            'themes': {v: i for i, v in enumerate(themes)},
+            'tones': {v: i for i, v in enumerate(tones)},
+            'colors': {v: i for i, v in enumerate(colors)},
+        }
+        self._post_types = {v: i for i, v in enumerate(POST_TYPES)}
+        self._languages = {v: i for i, v in enumerate(LANGUAGES)}
+        self._build_layout()
+
+    def _build_layout(self):
+        offsets = {}
+        col = self.embedding_features + 4 + len(POST_TYPES)
+        for name, _ in MULTI_HOT_COLUMNS:
+            offsets[name] = col
+            col += len(self.vocabularies[name]) + (1 if self.unknown_bucket else 0)
+        self._offsets = offsets
+        self._bool_col = col
+        self._hour_col = col + 2
+        self._language_col = col + 3
+        self.n_features = col + 3 + len(LANGUAGES)
+
+    @property
+    def embedding_features(self) -> int:
+        """Width of the embedding block after reduction."""
+        return self.reducer.dim if self.reducer else self.embedding_dim
+
+    @property
+    def themes(self) -> list:
+        return list(self.vocabularies['themes'])
+
+    @property
+    def tones(self) -> list:
+        return list(self.vocabularies['tones'])
+
+    @property
+    def colors(self) -> list:
+        return list(self.vocabularies['colors'])
+
+    @property
+    def uses_stored_embeddings(self) -> bool:
+        """False when the caption block comes from a local featurizer."""
+        return self.featurizer is None
+
+    def caption_features(self, df) -> np.ndarray:
+        """Caption block input for df: decoded stored embeddings, or featurized captions."""
+        if self.featurizer is not None:
+            return self.featurizer.transform(_column(df, 'caption'))
+        return decode_embeddings(coalesce_embedding_columns(df), self.embedding_dim)
+
+    def fit(self, df, embeddings=None):
+        """Collect sorted vocabularies from df (values seen in >= min_count rows).
+
+        Also fits the embedding reducer, if any, on embeddings (decoded from
+        df when omitted), or the caption featurizer on df's captions.
+        """
+        if self.featurizer is not None:
+            self.featurizer.fit(_column(df, 'caption'))
+        elif self.reducer is not None:
+            if embeddings is None:
+                embeddings = decode_embeddings(coalesce_embedding_columns(df), self.embedding_dim)
+            self.reducer.fit(embeddings)
+        return self.fit_counts(self.value_counts(df))
+
+    @staticmethod
+    def value_counts(df) -> dict:
+        """Rows containing each theme/tone/color value, per block.
+
+        Counts from several chunks can be summed and passed to fit_counts,
+        which is how streamed training fits the vocabularies.
+        """
+        counts = {}
+        for name, column in MULTI_HOT_COLUMNS:
+            exploded = _exploded_values(_column(df, column))
+            # Count each value once per row
+            counts[name] = exploded.reset_index().drop_duplicates().iloc[:, 1].value_counts()
+        return counts
+
+    def fit_counts(self, counts: dict):
+        """Set sorted vocabularies from value_counts() output."""
+        for name, _ in MULTI_HOT_COLUMNS:
+            block = counts.get(name)
+            values = [] if block is None else sorted(block[block >= self.min_count].index.tolist())
+            self.vocabularies[name] = {v: i for i, v in enumerate(values)}
+        self._build_layout()
+        return self
+
+    def unseen_values(self, df) -> dict:
+        """Theme/tone/color values in df without a column of their own."""
+        unseen = {}
+        for name, column in MULTI_HOT_COLUMNS:
+            values = set(_exploded_values(_column(df, column)))
+            missing = sorted(values - set(self.vocabularies[name]))
+            if missing:
+                unseen[name] = missing
+        return unseen
+
+    def feature_names(self) -> list:
+        prefix = f"caption_{self.featurizer.method}" if self.featurizer else "embedding"
+        names = [f"{prefix}_{i}" for i in range(self.embedding_features)]
+        names += ["likes_count", "comments_count", "views_count", "followers"]
+        names += [f"post_type={v}" for v in POST_TYPES]
+        for name, column in MULTI_HOT_COLUMNS:
+            names += [f"{column}={v}" for v in self.vocabularies[name]]
+            if self.unknown_bucket:
+                names.append(f"{column}=<other>")
+        names += ["cta_present", "paid", "posting_hour"]
+        names += [f"language={v}" for v in LANGUAGES]
+        return names
+
+    def transform(self, df, embeddings=None) -> np.ndarray:
+        """Vectorized transform of a DataFrame into a float32 matrix.
+
+        embeddings: already-decoded (len(df), embedding_dim) matrix (or
+        already-featurized captions); built by caption_features() when omitted.
+        """
+        X = np.zeros((len(df), self.n_features), dtype=np.float32)
+        dim = self.embedding_features
+
+        # 1. Caption embedding
+        if embeddings is None:
+            embeddings = self.caption_features(df)
+        if self.reducer is not None:
+            embeddings = self.reducer.transform(embeddings)
+        X[:, :dim] = embeddings
+
+        self._fill_tabular(X, df)
+        return X
+
+    def transform_tabular(self, df) -> np.ndarray:
+        """Every column after the embedding block, as a (len(df), n_tabular) float32 matrix."""
+        T = np.zeros((len(df), self.n_features - self.embedding_features), dtype=np.float32)
+        self._fill_tabular(T, df, shift=self.embedding_features)
+        return T
+
+    def _fill_tabular(self, X, df, shift: int = 0):
+        """Write blocks 2-9 into X, whose column 0 is layout column `shift`."""
+        dim = self.embedding_features - shift
+
+        # 2. Numerical features
+        X[:, dim] = _numeric(_column(df, 'likes_count', 0))
+        X[:, dim + 1] = _numeric(_column(df, 'comments_count', 0))
+        X[:, dim + 2] = _numeric_or_zero(_column(df, 'views_count', 0))
+        # Followers field is named 'followers' in the table; fall back if older name exists
+        if 'followers' in df.columns:
+            followers = df['followers']
+            if 'followers_count' in df.columns:
+                followers = followers.where(followers.notna(), df['followers_count'])
+        else:
+            followers = _column(df, 'followers_count', 0)
+        X[:, dim + 3] = _numeric_or_zero(followers)
+
+        # 3. Post type (one-hot encoded)
+        _fill_one_hot(X, dim + 4, _column(df, 'post_type', 'image'), POST_TYPES)
+
+        # 4-6. Theme, tone, color (multi-hot encoding for comma-separated values)
+        for name, column in MULTI_HOT_COLUMNS:
+            vocabulary = list(self.vocabularies[name])
+            offset = self._offsets[name] - shift
+            other = offset + len(vocabulary) if self.unknown_bucket else None
+            _fill_multi_hot(X, offset, _exploded_values(_column(df, column)), vocabulary, other)
+
+        # 7. Boolean features
+        X[:, self._bool_col - shift] = _truthy(_column(df, 'cta_present', False))
+        X[:, self._bool_col - shift + 1] = _truthy(_column(df, 'paid', False))
+
+        # 8. Posting hour (if available)
+        X[:, self._hour_col - shift] = _posting_hours(_column(df, 'posting_time'))
+
+        # 9. Language (one-hot)
+        _fill_one_hot(X, self._language_col - shift, _column(df, 'language', 'English'), LANGUAGES)
+
+    def transform_one(self, row: dict, embedding=None) -> np.ndarray:
+        """Transform a single post (dict) without pandas, in O(features)."""
+        x = np.zeros(self.n_features, dtype=np.float32)
+        dim = self.embedding_features
+
+        if embedding is None and self.featurizer is not None:
+            embedding = self.featurizer.transform_one(row.get('caption'))
+        elif embedding is None:
+            stored = row.get('caption_embedding_bin')
+            if _is_missing(stored):
+                stored = row.get('caption_embedding')
+            if not _is_missing(stored) and len(stored) > 0:
+                embedding = decode_embedding(stored)
+        if embedding is not None:
+            x[:dim] = self.reducer.transform_one(embedding) if self.reducer else embedding
+
+        x[dim] = _to_float(row.get('likes_count', 0))
+        x[dim + 1] = _to_float(row.get('comments_count', 0))
+        views = row.get('views_count', 0)
+        x[dim + 2] = 0.0 if _is_missing(views) else np.nan_to_num(_to_float(views))
+        followers = row.get('followers')
+        if _is_missing(followers):
+            followers = row.get('followers_count', 0)
+        x[dim + 3] = 0.0 if _is_missing(followers) else np.nan_to_num(_to_float(followers))
+
+        post_type = self._post_types.get(row.get('post_type', 'image'))
+        if post_type is not None:
+            x[dim + 4 + post_type] = 1.0
+
+        for name, column in MULTI_HOT_COLUMNS:
+            vocabulary = self.vocabularies[name]
+            offset = self._offsets[name]
+            for value in split_comma_separated(row.get(column)):
+                index = vocabulary.get(value)
+                if index is not None:
+                    x[offset + index] = 1.0
+                elif self.unknown_bucket:
+                    x[offset + len(vocabulary)] = 1.0
+
+        for i, column in enumerate(('cta_present', 'paid')):
+            value = row.get(column, False)
+            x[self._bool_col + i] = 0.0 if _is_missing(value) else float(bool(value))
+
+        x[self._hour_col] = 0.5
+        posting_time = row.get('posting_time')
+        if not _is_missing(posting_time) and str(posting_time) != "":
+            match = _HOUR.match(str(posting_time).split(':')[0])
+            if match:
+                x[self._hour_col] = int(match.group(1)) / 24.0
+
+        language = self._languages.get(row.get('language', 'English'))
+        if language is not None:
+            x[self._language_col + language] = 1.0
+
+        return x
+
+    def to_dict(self) -> dict:
+        return {
+            "version": TRANSFORMER_VERSION,
+            "embedding_dim": self.embedding_dim,
+            "unknown_bucket": self.unknown_bucket,
+            "min_count": self.min_count,
+            "post_types": POST_TYPES,
+            "languages": LANGUAGES,
+            "themes": self.themes,
+            "tones": self.tones,
+            "colors": self.colors,
+            "n_features": self.n_features,
+            "embedding_reducer": self.reducer.to_dict() if self.reducer else None,
+            "caption_featurizer": self.featurizer.to_dict() if self.featurizer else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        reducer = data.get("embedding_reducer")
+        featurizer = data.get("caption_featurizer")
+        return cls(
+            themes=data.get("themes", []),
+            tones=data.get("tones", []),
+            colors=data.get("colors", []),
+            embedding_dim=data.get("embedding_dim", EMBEDDING_DIM),
+            unknown_bucket=data.get("unknown_bucket", False),
+            min_count=data.get("min_count", 1),
+            reducer=EmbeddingReducer.from_dict(reducer) if reducer else None,
+            featurizer=CaptionFeaturizer.from_dict(featurizer) if featurizer else None,
+        )
+
+    @classmethod
+    def from_metadata(cls, metadata: dict):
+        """Transformer saved in model metadata, or rebuilt from the legacy vocabulary lists."""
+        if "feature_transformer" in metadata:
+            return cls.from_dict(metadata["feature_transformer"])
+        return cls(
+            themes=metadata.get("themes", []),
+            tones=metadata.get("tones", []),
+            colors=metadata.get("colors", []),
+            unknown_bucket=False,
+        )
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,194 @@
+"""
+Local snapshot of engagement_training_data for training runs.
+Rows are synced incrementally from Supabase using the updated_at watermark
+and stored as:
+
+    <dir>/rows.parquet     every column except the embeddings
+    <dir>/embeddings.npy   float32 (n_rows, dim) matrix, row-aligned with rows.parquet
+    <dir>/state.json       watermark, dim, row count
+
+Training memory-maps embeddings.npy, so it starts without a network fetch and
+without decoding embeddings again.
+
+Rows deleted in Supabase are not detected by an incremental sync; run a full
+resync (sync(full=True)) to drop them.
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from embedding_codec import EMBEDDING_DIMENSIONS, coalesce_embedding_columns, decode_embeddings
+from supabase_reader import DEFAULT_PAGE_SIZE, iter_pages
+
+DEFAULT_SNAPSHOT_DIR = os.getenv("FEATURE_SNAPSHOT_DIR", ".cache/snapshot")
+EMBEDDING_COLUMNS = ("caption_embedding", "caption_embedding_bin")
+SYNC_OVERLAP = pd.Timedelta(minutes=10)
+
+class RowSubset:
+    """Selected rows of a (memory-mapped) matrix, read only when indexed."""
+
+    def __init__(self, base, index: np.ndarray):
+        self.base = base
+        self.index = np.asarray(index)
+        self.shape = (len(self.index), base.shape[1])
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return np.asarray(self.base[self.index[rows]])
+
+class FeatureSnapshot:
+    """Incrementally synced local copy of engagement_training_data."""
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_DIR, dim: int = EMBEDDING_DIMENSIONS):
+        self.path = path
+        self.dim = dim
+        self.rows_path = os.path.join(path, "rows.parquet")
+        self.embeddings_path = os.path.join(path, "embeddings.npy")
+        self.state_path = os.path.join(path, "state.json")
+
+    def exists(self) -> bool:
+        return all(os.path.exists(p) for p in (self.rows_path, self.embeddings_path, self.state_path))
+
+    def state(self) -> dict:
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def load(self, mmap_mode: str = "r"):
+        """Return (rows DataFrame, memory-mapped embedding matrix)."""
+        if not self.exists():
+            raise FileNotFoundError(f"No feature snapshot at {self.path}; run a sync first")
+        rows = pd.read_parquet(self.rows_path)
+        embeddings = np.load(self.embeddings_path, mmap_mode=mmap_mode)
+        if embeddings.shape[0] != len(rows):
+            raise ValueError(f"Snapshot at {self.path} is inconsistent "
+                             f"({len(rows)} rows, {embeddings.shape[0]} embeddings); resync with full=True")
+        return rows, embeddings
+
+    def sync(self, client, table: str = "engagement_training_data",
+             page_size: int = DEFAULT_PAGE_SIZE, full: bool = False) -> int:
+        """Pull rows changed since the last watermark. Returns rows fetched."""
+        state = {} if full else self.state()
+        watermark = state.get("watermark")
+        if state.get("dim", self.dim) != self.dim:
+            print(f"   ⚠️  Snapshot dim {state['dim']} != {self.dim}, doing a full resync")
+            watermark = None
+            full = True
+
+        since = None
+        if watermark:
+            # Re-read a small window before the watermark: rows updated while
+            # the previous sync was paging may carry slightly older timestamps.
+            # Overlapping rows are de-duplicated by id during the merge.
+            since = (pd.Timestamp(watermark) - SYNC_OVERLAP).isoformat()
+
+        def changed_rows():
+            query = client.table(table).select("*")
+            if since:
+                query = query.gte("updated_at", since)
+            return query
+
+        frames, matrices = [], []
+        fetched = 0
+        for page in iter_pages(changed_rows, page_size):
+            frame = pd.DataFrame(page)
+            matrices.append(decode_embeddings(coalesce_embedding_columns(frame), self.dim))
+            frame["has_embedding"] = coalesce_embedding_columns(frame).notna().to_numpy()
+            frames.append(frame.drop(columns=[c for c in EMBEDDING_COLUMNS if c in frame.columns]))
+            fetched += len(frame)
+            print(f"   📥 Synced {fetched} changed rows...")
+
+        if fetched == 0 and self.exists() and not full:
+            return 0
+
+        changed = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({"id": []})
+        changed_embeddings = (np.concatenate(matrices) if matrices
+                              else np.zeros((0, self.dim), dtype=np.float32))
+
+        if full or not self.exists():
+            self._write(changed, changed_embeddings)
+        else:
+            self._merge(changed, changed_embeddings)
+
+        new_watermark = watermark
+        if "updated_at" in changed.columns and changed["updated_at"].notna().any():
+            latest = str(changed["updated_at"].dropna().max())
+            new_watermark = max(latest, watermark) if watermark else latest
+
+        rows = len(pd.read_parquet(self.rows_path, columns=["id"]))
+        self._save_state({"watermark": new_watermark, "dim": self.dim, "n_rows": rows})
+        return fetched
+
+    def _merge(self, changed: pd.DataFrame, changed_embeddings: np.ndarray):
+        rows, embeddings = self.load(mmap_mode="r")
+        position = pd.Series(np.arange(len(rows)), index=rows["id"].to_numpy())
+
+        # Later pages win if a row changed twice during the sync
+        keep = ~changed["id"].duplicated(keep="last").to_numpy()
+        changed = changed[keep].reset_index(drop=True)
+        changed_embeddings = changed_embeddings[keep]
+
+        existing_pos = position.reindex(changed["id"].to_numpy()).to_numpy()
+        is_update = ~np.isnan(existing_pos)
+        update_pos = existing_pos[is_update].astype(np.int64)
+
+        rows = pd.concat([rows, changed[~is_update]], ignore_index=True)
+        if is_update.any():
+            updates = changed[is_update]
+            rows = rows.astype({c: object for c in updates.columns
+                                if c in rows.columns and rows[c].dtype != updates[c].dtype})
+            for column in updates.columns:
+                if column not in rows.columns:
+                    rows[column] = None
+                rows.loc[update_pos, column] = updates[column].to_numpy()
+
+        n_old = embeddings.shape[0]
+        n_new = int((~is_update).sum())
+        del embeddings
+
+        if n_new == 0:
+            # Same shape: patch changed rows in place
+            matrix = np.load(self.embeddings_path, mmap_mode="r+")
+            matrix[update_pos] = changed_embeddings
+            matrix.flush()
+            del matrix
+            self._write_rows(rows)
+            return
+
+        # Grow the matrix into a new file, then swap it in
+        old = np.load(self.embeddings_path, mmap_mode="r")
+        tmp_path = f"{self.embeddings_path}.tmp.npy"
+        merged = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32,
+                                           shape=(n_old + n_new, self.dim))
+        merged[:n_old] = old
+        merged[update_pos] = changed_embeddings[is_update]
+        merged[n_old:] = changed_embeddings[~is_update]
+        merged.flush()
+        del merged, old
+
+        self._write_rows(rows)
+        os.replace(tmp_path, self.embeddings_path)
+
+    def _write(self, rows: pd.DataFrame, embeddings: np.ndarray):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+        self._write_rows(rows)
+        np.save(self.embeddings_path, embeddings.astype(np.float32, copy=False))
+
+    def _write_rows(self, rows: pd.DataFrame):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{self.rows_path}.tmp"
+        rows.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.rows_path)
+
+    def _save_state(self, state: dict):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
@@ -2,36 +2,130 @@
 """
 Generate OpenAI embeddings for engagement training data captions.
 Run this before training the model.
+
+Captions are sent in batches (many inputs per embeddings request) and several
+requests run concurrently, throttled to the account's request/token budget.
+New embeddings are also added to the similar-post index (similarity_index.py)
+when one has been built.
 """
 
 import os
 import sys
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from openai import OpenAI
-from supabase import create_client, Client
+from embedding_cache import EmbeddingCache, cache_key
+from embedding_inputs import MAX_INPUT_CHARS, estimate_tokens
+from embedding_codec import (BINARY_COLUMN, DEFAULT_STORAGE, EMBEDDING_DIMENSIONS, NATIVE_DIMENSIONS,
+                             STORAGE_FORMATS, embedding_columns)
+from supabase_writer import BulkWriter
+from supabase_reader import DEFAULT_PAGE_SIZE, count_rows, iter_pages
+from similarity_index import open_index
+from near_duplicates import COPY_COLUMN
+import instrumentation
+import storage
+from storage import get_client, has_column
 import json
 import time
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    print("❌ OPENAI_API_KEY not found in environment variables")
-    sys.exit(1)
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Batching / concurrency defaults (override with CLI flags or env)
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_WORKERS = 4
+DEFAULT_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+DEFAULT_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+MAX_RETRIES = 6
+DEFAULT_WRITE_CHUNK_SIZE = 500
+CHECKPOINT_PATH = ".cache/embeddings_checkpoint.json"
+
+_openai_client = None
+
+def get_openai():
+    """Create the OpenAI client on first use."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            print("❌ OPENAI_API_KEY not found in environment variables")
+            sys.exit(1)
+        _openai_client = OpenAI(api_key=openai_api_key)
+    return _openai_client
+
+class RateLimiter:
+    """Thread-safe requests-per-minute / tokens-per-minute budget.
+
+    Both budgets refill continuously. A 429 from the API halves the effective
+    rate for a cool-down period; successful calls slowly restore it.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0
+        self.request_allowance = float(rpm)
+        self.token_allowance = float(tpm)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
 
-openai_client = OpenAI(api_key=openai_api_key)
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_allowance = min(
+            self.rpm, self.request_allowance + elapsed * self.rpm * self.scale / 60.0
+        )
+        self.token_allowance = min(
+            self.tpm, self.token_allowance + elapsed * self.tpm * self.scale / 60.0
+        )
+
+    def acquire(self, tokens: int):
+        """Block until one request carrying `tokens` tokens fits in the budget."""
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.request_allowance >= 1 and self.token_allowance >= tokens:
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return
+                missing_requests = max(0.0, 1 - self.request_allowance)
+                missing_tokens = max(0.0, tokens - self.token_allowance)
+                wait = max(
+                    missing_requests * 60.0 / (self.rpm * self.scale),
+                    missing_tokens * 60.0 / (self.tpm * self.scale),
+                )
+            time.sleep(min(max(wait, 0.01), 5.0))
+
+    def backoff(self):
+        """Called on a 429: shrink the rate and drain the current allowance."""
+        with self.lock:
+            self.scale = max(0.1, self.scale * 0.5)
+            self.request_allowance = 0
+            self.token_allowance = 0
 
-# Initialize Supabase client
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    def recover(self):
+        """Called on success: creep back towards the full budget."""
+        with self.lock:
+            self.scale = min(1.0, self.scale * 1.05)
 
-if not supabase_url or not supabase_key:
-    print("❌ Supabase credentials not found in environment variables")
-    sys.exit(1)
+def embedding_model_tag(dimensions: int = EMBEDDING_DIMENSIONS) -> str:
+    """Model name used for cache keys; reduced sizes get their own entries."""
+    if dimensions == NATIVE_DIMENSIONS:
+        return EMBEDDING_MODEL
+    return f"{EMBEDDING_MODEL}@{dimensions}"
 
-supabase: Client = create_client(supabase_url, supabase_key)
+def embedding_request(inputs, dimensions: int = EMBEDDING_DIMENSIONS) -> dict:
+    """Keyword arguments for get_openai().embeddings.create."""
+    request = {"model": EMBEDDING_MODEL, "input": inputs}
+    if dimensions != NATIVE_DIMENSIONS:
+        request["dimensions"] = dimensions
+    return request
 
 def generate_embedding(text: str) -> list:
     """Generate embedding for a text using OpenAI."""
@@ -39,76 +133,336 @@ def generate_embedding(text: str) -> list:
         return None
     
     try:
-        response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text[:8000]  # Limit to 8000 chars (OpenAI limit)
-        )
+        response = get_openai().embeddings.create(**embedding_request(text[:MAX_INPUT_CHARS]))
         return response.data[0].embedding
     except Exception as e:
         print(f"⚠️  Error generating embedding: {e}")
         return None
 
-def update_embeddings():
-    """Fetch posts without embeddings and generate them."""
-    print("🔍 Fetching posts without embeddings...")
+def generate_embeddings_batch(texts: list, limiter: RateLimiter, dimensions: int = EMBEDDING_DIMENSIONS):
+    """Embed a batch of non-empty texts in one request.
+
+    Returns (embeddings, tokens_used). Retries 429s with exponential backoff;
+    other errors propagate to the caller.
+    """
+    from openai import RateLimitError
+
+    inputs = [t[:MAX_INPUT_CHARS] for t in texts]
+    estimated = sum(estimate_tokens(t) for t in inputs)
+    delay = 1.0
     
-    # Fetch posts where caption_embedding is null
-    response = supabase.table("engagement_training_data") \
-        .select("id, post_url, caption") \
+    for attempt in range(MAX_RETRIES):
+        with instrumentation.stage("rate_limit_wait"):
+            limiter.acquire(estimated)
+        try:
+            instrumentation.count("api_calls")
+            instrumentation.count("caption_bytes_sent", sum(len(t.encode("utf-8")) for t in inputs))
+            with instrumentation.stage("embed_request"):
+                response = get_openai().embeddings.create(**embedding_request(inputs, dimensions))
+        except RateLimitError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            instrumentation.count("retries")
+            limiter.backoff()
+            print(f"   ⏳ Rate limited, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            continue
+        
+        limiter.recover()
+        # Results carry an index; order them back to match the inputs
+        ordered = sorted(response.data, key=lambda d: d.index)
+        tokens_used = response.usage.total_tokens if response.usage else estimated
+        instrumentation.count("tokens", tokens_used)
+        instrumentation.count("rows_embedded", len(ordered))
+        return [d.embedding for d in ordered], tokens_used
+
+def embedding_patch(post_id, embedding: list, storage: str = DEFAULT_STORAGE) -> dict:
+    """Row patch for BulkWriter carrying one embedding."""
+    return {"id": post_id, **embedding_columns(embedding, storage)}
+
+def pending_embeddings_query(count: str = None, updated_since: str = None, storage: str = DEFAULT_STORAGE):
+    """Posts with a caption but no embedding yet (updated at or after updated_since).
+
+    caption_embedding_bin is only checked when writing blobs or when the
+    column exists, so JSON storage works without its migration. Flagged
+    near-duplicates (near_duplicate_of set) are never embedded.
+    """
+    query = get_client().table("engagement_training_data") \
+        .select("id, post_url, caption, engagement_score", count=count) \
         .is_("caption_embedding", "null") \
-        .not_.is_("caption", "null") \
-        .execute()
+        .not_.is_("caption", "null")
+    if storage != "json" or has_column("engagement_training_data", BINARY_COLUMN):
+        query = query.is_(BINARY_COLUMN, "null")
+    if has_column("engagement_training_data", COPY_COLUMN):
+        query = query.is_(COPY_COLUMN, "null")
+    if updated_since:
+        query = query.gte("updated_at", updated_since)
+    return query
+
+def load_checkpoint() -> dict:
+    if not os.path.exists(CHECKPOINT_PATH):
+        return {}
+    with open(CHECKPOINT_PATH) as f:
+        return json.load(f)
+
+def save_checkpoint(data: dict):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+
+def checkpoint_resume_id(dimensions: int = EMBEDDING_DIMENSIONS):
+    """The saved last_id, or None when the checkpoint was written for another model.
+
+    A checkpoint from another model or size would skip rows that still need
+    this one, so it is discarded and the run starts from the first id.
+    """
+    checkpoint = load_checkpoint()
+    if not checkpoint:
+        return None
+    model_tag = embedding_model_tag(dimensions)
+    if checkpoint.get("model") != model_tag:
+        print(f"   ⚠️  Checkpoint was saved for {checkpoint.get('model') or 'an unknown model'}, "
+              f"not {model_tag}; starting from the first id")
+        clear_checkpoint()
+        return None
+    return checkpoint.get("last_id")
+
+def embed_page(posts: list, stats: dict, executor, limiter: RateLimiter,
+               writer: BulkWriter, cache, batch_size: int, storage: str = DEFAULT_STORAGE,
+               dimensions: int = EMBEDDING_DIMENSIONS, embedded: list = None):
+    """Embed one page of posts and queue the results on the writer.
+
+    embedded: if given, collects (post, embedding) for every queued post.
+    """
+    model_tag = embedding_model_tag(dimensions)
+    # Empty captions never reach the API; identical captions share one key
+    groups = {}
+    for post in posts:
+        caption = post.get("caption") or ""
+        if not caption.strip():
+            stats["failed"] += 1
+            continue
+        key = cache_key(caption, model_tag)
+        groups.setdefault(key, {"caption": caption, "posts": []})["posts"].append(post)
+    
+    stats["non_empty"] += sum(len(g["posts"]) for g in groups.values())
+    stats["unique"] += len(groups)
     
-    posts = response.data
-    total = len(posts)
+    def save_group(key, embedding):
+        for post in groups[key]["posts"]:
+            patch = embedding_patch(post["id"], embedding, storage)
+            instrumentation.count("embedding_bytes_written",
+                                  sum(len(value) for column, value in patch.items() if column != "id"))
+            writer.add(patch)
+            stats["queued"] += 1
+            if embedded is not None:
+                embedded.append((post, embedding))
+    
+    with instrumentation.stage("cache_lookup"):
+        cached = cache.get_many(list(groups)) if cache else {}
+    for key, embedding in cached.items():
+        save_group(key, embedding)
+    
+    pending = [key for key in groups if key not in cached]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    
+    def process_batch(keys):
+        embeddings, tokens_used = generate_embeddings_batch(
+            [groups[key]["caption"] for key in keys], limiter, dimensions
+        )
+        return keys, embeddings, tokens_used
+    
+    futures = {executor.submit(process_batch, b): b for b in batches}
+    
+    for future in as_completed(futures):
+        try:
+            keys, embeddings, tokens_used = future.result()
+        except Exception as e:
+            print(f"   ❌ Batch failed: {str(e)[:100]}")
+            lost = sum(len(groups[key]["posts"]) for key in futures[future])
+            stats["failed"] += lost
+            stats["errors"] += lost
+            continue
+        
+        stats["tokens"] += tokens_used
+        
+        if cache:
+            cache.put_many(dict(zip(keys, embeddings)), model_tag)
+        
+        for key, embedding in zip(keys, embeddings):
+            save_group(key, embedding)
+
+def open_embedding_index(dimensions: int = EMBEDDING_DIMENSIONS):
+    """The similar-post index to feed new embeddings into, or None."""
+    index = open_index()
+    if index is not None and index.dim != dimensions:
+        print(f"   ⚠️  Similarity index holds {index.dim}-dim embeddings, not updating it")
+        index.close()
+        return None
+    return index
+
+def write_page(page: list, stats: dict, executor, limiter: RateLimiter, writer: BulkWriter, cache,
+               batch_size: int, storage: str = DEFAULT_STORAGE, dimensions: int = EMBEDDING_DIMENSIONS,
+               index=None) -> int:
+    """Embed one page, flush its writes and add them to the index; returns rows indexed."""
+    embedded = [] if index is not None else None
+    with instrumentation.stage("embed_page"):
+        embed_page(page, stats, executor, limiter, writer, cache, batch_size, storage, dimensions, embedded)
+    
+    failed_before = writer.failed
+    with instrumentation.stage("write_flush"):
+        writer.flush()
+    # Index only pages whose writes all landed; failed rows are retried next run
+    if not embedded or writer.failed != failed_before:
+        return 0
+    with instrumentation.stage("index_add"):
+        return index.add([post["id"] for post, _ in embedded],
+                         [embedding for _, embedding in embedded],
+                         [post for post, _ in embedded])
+
+def update_embeddings(batch_size: int = DEFAULT_BATCH_SIZE,
+                      workers: int = DEFAULT_WORKERS,
+                      rpm: int = DEFAULT_RPM,
+                      tpm: int = DEFAULT_TPM,
+                      use_cache: bool = True,
+                      write_chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+                      page_size: int = DEFAULT_PAGE_SIZE,
+                      resume: bool = True,
+                      storage: str = DEFAULT_STORAGE,
+                      dimensions: int = EMBEDDING_DIMENSIONS,
+                      update_index: bool = True):
+    """Stream posts without embeddings page by page and embed them in concurrent batches."""
+    print("🔍 Counting posts without embeddings...")
+    
+    with instrumentation.stage("count"):
+        total = count_rows(lambda: pending_embeddings_query(count="exact", storage=storage))
     
     if total == 0:
         print("✅ No posts need embeddings!")
+        clear_checkpoint()
         return
     
     print(f"📊 Found {total} posts needing embeddings")
+    print(f"   ⚙️  batch_size={batch_size}, workers={workers}, rpm={rpm}, tpm={tpm}, "
+          f"page_size={page_size}, storage={storage}, dimensions={dimensions}")
     
-    updated = 0
-    failed = 0
+    after_id = checkpoint_resume_id(dimensions) if resume else None
+    if after_id:
+        print(f"   ↪️  Resuming after id {after_id}")
     
-    for i, post in enumerate(posts, 1):
-        post_id = post["id"]
-        caption = post.get("caption", "")
-        post_url = post.get("post_url", "")[:50]
-        
-        print(f"\n[{i}/{total}] Processing: {post_url}...")
-        
-        embedding = generate_embedding(caption)
-        
-        if embedding:
-            try:
-                # Update the post with embedding
-                supabase.table("engagement_training_data") \
-                    .update({"caption_embedding": json.dumps(embedding)}) \
-                    .eq("id", post_id) \
-                    .execute()
-                
-                updated += 1
-                print(f"   ✅ Embedding generated and saved")
-                
-                # Rate limiting: OpenAI allows 3000 requests/min
-                time.sleep(0.02)  # ~50 requests/second
-                
-            except Exception as e:
-                print(f"   ❌ Failed to save embedding: {e}")
-                failed += 1
-        else:
-            failed += 1
-            print(f"   ⚠️  Skipped (empty caption or error)")
+    stats = {"queued": 0, "failed": 0, "errors": 0, "tokens": 0, "non_empty": 0, "unique": 0}
+    
+    # Writes run on the writer's thread, overlapping with embedding requests
+    writer = BulkWriter(get_client(), mode="update", chunk_size=write_chunk_size)
+    cache = EmbeddingCache() if use_cache else None
+    limiter = RateLimiter(rpm, tpm)
+    index = open_embedding_index(dimensions) if update_index else None
+    indexed = 0
+    started = time.monotonic()
+    pages = 0
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages_fetched = instrumentation.timed(iter_pages(lambda: pending_embeddings_query(storage=storage), page_size, after_id), "fetch_page")
+        for page in pages_fetched:
+            pages += 1
+            indexed += write_page(page, stats, executor, limiter, writer, cache, batch_size, storage,
+                                  dimensions, index)
+            # Only advance the checkpoint while every earlier row is committed,
+            # so a resumed run never skips rows that failed
+            if stats["errors"] == 0 and writer.failed == 0:
+                save_checkpoint({"last_id": page[-1]["id"], "model": embedding_model_tag(dimensions)})
+            
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(f"   [page {pages}] ✅ {stats['queued']}/{total} embedded, {writer.written} saved "
+                  f"({stats['queued'] / elapsed:.1f} captions/s, {stats['tokens'] / elapsed:.0f} tokens/s)")
+    
+    with instrumentation.stage("write_flush"):
+        writer.close()
+    updated = writer.written
+    failed = stats["failed"] + writer.failed
+    tokens_total = stats["tokens"]
+    elapsed = max(time.monotonic() - started, 1e-6)
+    
+    # A clean full pass needs no resume point
+    if stats["errors"] == 0 and writer.failed == 0:
+        clear_checkpoint()
     
     print(f"\n{'='*60}")
     print(f"✅ Complete! Updated: {updated}, Failed: {failed}, Total: {total}")
+    print(f"   📝 {writer.chunks} write chunks, {writer.retries} retries, {pages} pages")
+    print(f"   ⏱️  {elapsed:.1f}s, {updated / elapsed:.1f} captions/s, {tokens_total / elapsed:.0f} tokens/s")
+    if cache:
+        instrumentation.count("cache_hits", cache.hits)
+        instrumentation.count("cache_misses", cache.misses)
+        print(f"   💾 Cache hit rate: {cache.hit_rate():.1%} "
+              f"({cache.hits} hits, {cache.misses} misses, {len(cache)} entries), "
+              f"in-run duplicates: {stats['non_empty'] - stats['unique']}")
+        cache.close()
+    if index is not None:
+        print(f"   🧭 Similarity index: {indexed} posts added ({index.n_live} indexed)")
+        index.close()
     print(f"{'='*60}")
 
-if __name__ == "__main__":
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Generate caption embeddings")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="captions per embeddings request")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="concurrent embeddings requests")
+    parser.add_argument("--rpm", type=int, default=DEFAULT_RPM,
+                        help="requests-per-minute budget")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_TPM,
+                        help="tokens-per-minute budget")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="skip the local embedding cache")
+    parser.add_argument("--write-chunk-size", type=int, default=DEFAULT_WRITE_CHUNK_SIZE,
+                        help="rows per bulk database write")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="rows fetched per page")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the saved checkpoint and start from the first id")
+    parser.add_argument("--storage", choices=STORAGE_FORMATS, default=DEFAULT_STORAGE,
+                        help="json writes caption_embedding; f16/f32 write compact "
+                             "blobs to caption_embedding_bin (needs add_caption_embedding_bin_column.sql)")
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS,
+                        help="embedding size requested from the API (default: EMBEDDING_DIMENSIONS "
+                             "or 1536). Training and scoring read EMBEDDING_DIMENSIONS, so set "
+                             "it to match; rows embedded at another size must be re-embedded")
+    parser.add_argument("--no-index", action="store_true",
+                        help="don't add new embeddings to the similar-post index")
+    instrumentation.add_arguments(parser)
+    storage.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
+    
     print("╔══════════════════════════════════════════════════════╗")
     print("║  OpenAI Embedding Generator for Engagement Model    ║")
     print("╚══════════════════════════════════════════════════════╝\n")
     
-    update_embeddings()
+    storage.configure(args.backend, args.sqlite_path)
+    with instrumentation.run("generate_embeddings", vars(args), args.run_log, args.profile, args.profiler):
+        update_embeddings(
+            batch_size=args.batch_size,
+            workers=args.workers,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            use_cache=not args.no_cache,
+            write_chunk_size=args.write_chunk_size,
+            page_size=args.page_size,
+            resume=not args.restart,
+            storage=args.storage,
+            dimensions=args.dimensions,
+            update_index=not args.no_index,
+        )
 
+if __name__ == "__main__":
+    main()
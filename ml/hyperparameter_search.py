@@ -0,0 +1,148 @@
+"""
+Parallel hyperparameter search for the engagement model.
+Each candidate configuration is scored with k-fold cross-validation in a
+process pool. Workers memory-map one shared copy of the feature matrix
+instead of receiving it pickled per task, every fold uses early stopping on
+its validation split, and a configuration whose running CV MAE is clearly
+worse than the best finished one is pruned before its remaining folds.
+"""
+
+import os
+import time
+import random
+import itertools
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 6, 8],
+    "learning_rate": [0.03, 0.05, 0.1],
+    "subsample": [0.7, 0.8, 1.0],
+    "colsample_bytree": [0.5, 0.8, 1.0],
+    "min_child_weight": [1.0, 3.0, 5.0],
+    "reg_lambda": [1.0, 5.0],
+}
+DEFAULT_TRIALS = 20
+DEFAULT_FOLDS = 5
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 30
+PRUNE_MARGIN = 0.10  # prune when running CV MAE is >10% worse than the best
+
+# Per-worker state, set by _init_worker
+_X = None
+_y = None
+_best = None
+_threads = 1
+
+def sample_configs(trials: int, seed: int = 42) -> list:
+    """Up to `trials` distinct configurations drawn from SEARCH_SPACE."""
+    keys = list(SEARCH_SPACE)
+    grid = list(itertools.product(*(SEARCH_SPACE[k] for k in keys)))
+    random.Random(seed).shuffle(grid)
+    return [dict(zip(keys, values)) for values in grid[:trials]]
+
+def _init_worker(x_path: str, y_path: str, best, threads: int):
+    global _X, _y, _best, _threads
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path, mmap_mode="r")
+    _best = best
+    _threads = threads
+
+def _evaluate(params: dict, folds: int, seed: int) -> dict:
+    """Cross-validate one configuration inside a worker process."""
+    import xgboost as xgb
+    from sklearn.model_selection import KFold
+    from sklearn.metrics import mean_absolute_error
+
+    started = time.monotonic()
+    splitter = KFold(n_splits=folds, shuffle=True, random_state=seed)
+    maes, rounds = [], []
+    pruned = False
+
+    for train_idx, val_idx in splitter.split(_X):
+        model = xgb.XGBRegressor(
+            n_estimators=MAX_ROUNDS,
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+            eval_metric="mae",
+            random_state=seed,
+            n_jobs=_threads,
+            **params,
+        )
+        X_train, y_train = _X[train_idx], _y[train_idx]
+        X_val, y_val = _X[val_idx], _y[val_idx]
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+        maes.append(float(mean_absolute_error(y_val, model.predict(X_val))))
+        rounds.append(int(model.best_iteration) + 1)
+
+        best = _best.value
+        if len(maes) < folds and best > 0 and np.mean(maes) > best * (1 + PRUNE_MARGIN):
+            pruned = True
+            break
+
+    cv_mae = float(np.mean(maes))
+    if not pruned:
+        with _best.get_lock():
+            if _best.value <= 0 or cv_mae < _best.value:
+                _best.value = cv_mae
+
+    return {
+        "params": params,
+        "cv_mae": cv_mae,
+        "cv_mae_std": float(np.std(maes)),
+        "folds_run": len(maes),
+        "best_iterations": rounds,
+        "pruned": pruned,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+def search(X: np.ndarray, y: np.ndarray, trials: int = DEFAULT_TRIALS, folds: int = DEFAULT_FOLDS,
+           workers: int = None, seed: int = 42) -> dict:
+    """Run the search and return the best params plus every trial's result.
+
+    best_params includes n_estimators, set from the mean early-stopping round
+    of the winning configuration's folds.
+    """
+    workers = workers or min(os.cpu_count() or 1, trials)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    configs = sample_configs(trials, seed)
+    best = mp.Value("d", 0.0)
+
+    print(f"🔬 Hyperparameter search: {len(configs)} configs x {folds} folds, "
+          f"{workers} workers x {threads} threads")
+
+    results = []
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp:
+        # One on-disk copy of the features, memory-mapped by every worker
+        x_path = os.path.join(tmp, "X.npy")
+        y_path = os.path.join(tmp, "y.npy")
+        np.save(x_path, np.ascontiguousarray(X, dtype=np.float32))
+        np.save(y_path, np.asarray(y, dtype=np.float64))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(x_path, y_path, best, threads)) as executor:
+            futures = [executor.submit(_evaluate, params, folds, seed) for params in configs]
+            for n, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results.append(result)
+                status = "pruned" if result["pruned"] else f"rounds={int(np.mean(result['best_iterations']))}"
+                print(f"   [{n}/{len(configs)}] CV MAE {result['cv_mae']:.2f} ({status}) {result['params']}")
+
+    complete = [r for r in results if not r["pruned"]] or results
+    winner = min(complete, key=lambda r: r["cv_mae"])
+    best_params = dict(winner["params"])
+    best_params["n_estimators"] = int(np.mean(winner["best_iterations"]))
+
+    print(f"   🏆 Best CV MAE {winner['cv_mae']:.2f} with {best_params} "
+          f"({time.monotonic() - started:.1f}s)")
+
+    return {
+        "folds": folds,
+        "trials": len(configs),
+        "pruned": sum(r["pruned"] for r in results),
+        "best_params": best_params,
+        "best_cv_mae": winner["cv_mae"],
+        "results": sorted(results, key=lambda r: (r["pruned"], r["cv_mae"])),
+    }
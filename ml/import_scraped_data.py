@@ -1,28 +1,71 @@
 #!/usr/bin/env python3
 """
 Import scraped Instagram data into engagement_training_data table.
-Reads CSV files from scraper and inserts into Supabase.
+Reads CSV (or JSONL, optionally .gz) exports from the scraper and inserts
+into Supabase.
 Supports comma-separated values for theme, tone, and color.
+Rows whose caption nearly copies an earlier post's are flagged or skipped
+per --near-duplicates (see near_duplicates.py).
 """
 
 import os
-import sys
 import csv
+import gzip
 import json
+import sys
+import argparse
+from itertools import chain, islice
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from dotenv import load_dotenv
-from supabase import create_client, Client
 from datetime import datetime
+import instrumentation
+import near_duplicates
+import storage
+from storage import get_client, has_column
 
 load_dotenv()
 
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+DEFAULT_CHUNK_SIZE = 1000  # CSV rows per import chunk
+DEFAULT_WORKERS = 4  # chunks imported concurrently
+INSERT_BATCH_SIZE = 500  # rows per insert request
+EXISTS_QUERY_SIZE = 200  # URLs per in_ existence query (keeps the query string short)
 
-if not supabase_url or not supabase_key:
-    print("❌ Supabase credentials not found")
-    sys.exit(1)
+# Common date formats, tried in order
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%d %B %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%b %d, %Y",
+    "%d-%m-%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+]
+DATE_SAMPLE_SIZE = 200  # rows used to detect a file's date format
+DATE_DETECT_SHARE = 0.9  # share of those rows the detected format must parse
 
-supabase: Client = create_client(supabase_url, supabase_key)
+# Header aliases per field, in priority order
+FIELD_ALIASES = {
+    "url": ['URL', 'Url'],
+    "type": ['Type'],
+    "posted_date": ['Posted Date', 'Date', 'Posted_Date', 'posted_at', 'Post Date'],
+    "likes": ['Likes'],
+    "comments": ['Comments'],
+    "caption": ['Caption'],
+    "language": ['Language'],
+    "followers": ['Followers', 'followers', 'FOLLOWERS', 'Follower Count', 'follower_count'],
+    "views": ['Views', 'views', 'VIEWS', 'View Count', 'view_count'],
+    "theme": ['Theme', 'theme', 'THEME'],
+    "tone": ['Tone', 'tone', 'TONE'],
+    "dominant_color": ['Dominant Color', 'dominant_color', 'Dominant_Color', 'Color', 'color', 'Color Palette', 'color_palette'],
+    "cta_present": ['CTA Present', 'cta_present', 'CTA_Present', 'cta', 'CTA'],
+    "paid": ['Paid', 'paid', 'PAID', 'Boosted', 'boosted'],
+    "music_type": ['Music Type', 'music_type', 'Music_Type', 'Music', 'music'],
+    "keyword": ['Keyword', 'keyword', 'KEYWORD', 'Search Keyword', 'search_keyword'],
+}
 
 def detect_post_type(url: str) -> str:
     """Detect post type from URL."""
@@ -39,22 +82,7 @@ def parse_date(date_str: str) -> str:
     
     date_str = date_str.strip()
     
-    # Try common date formats
-    date_formats = [
-        "%Y-%m-%d",
-        "%m/%d/%Y",
-        "%d/%m/%Y",
-        "%d %B %Y",
-        "%d %b %Y",
-        "%B %d, %Y",
-        "%b %d, %Y",
-        "%d-%m-%Y",
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%dT%H:%M:%S",
-        "%Y-%m-%d %H:%M:%S.%f",
-    ]
-    
-    for fmt in date_formats:
+    for fmt in DATE_FORMATS:
         try:
             dt = datetime.strptime(date_str, fmt)
             return dt.strftime("%Y-%m-%d")
@@ -107,188 +135,497 @@ def parse_int(value, default=0):
     except Exception:
         return default
 
-def import_csv(csv_path: str, user_id: str = None):
-    """Import CSV data into training table."""
+class DateParser:
+    """Per-file date parsing: one detected format, with parse_date() for outliers."""
+
+    def __init__(self, date_format: str = None):
+        self.date_format = date_format
+        self.cache = {}
+        self.fallbacks = 0
+
+    @staticmethod
+    def detect(samples: list):
+        """Format in DATE_FORMATS that parses the most samples, or None.
+
+        It must parse at least DATE_DETECT_SHARE of them; ties go to the
+        earlier format. The outliers go through parse_date().
+        """
+        samples = [v.strip() for v in samples if v and v.strip()]
+        if not samples:
+            return None
+        best, best_parsed = None, 0
+        for fmt in DATE_FORMATS:
+            parsed = 0
+            for value in samples:
+                try:
+                    datetime.strptime(value, fmt)
+                    parsed += 1
+                except ValueError:
+                    pass
+            if parsed > best_parsed:
+                best, best_parsed = fmt, parsed
+        if best_parsed < DATE_DETECT_SHARE * len(samples):
+            return None
+        return best
+
+    def __call__(self, value: str):
+        cached = self.cache.get(value)
+        if cached is not None or value in self.cache:
+            return cached
+        parsed = None
+        if self.date_format:
+            try:
+                parsed = datetime.strptime(value.strip(), self.date_format).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        if parsed is None:
+            self.fallbacks += 1
+            parsed = parse_date(value)
+        self.cache[value] = parsed
+        return parsed
+
+def _present(row, columns):
+    """First value in columns that is non-empty after stripping."""
+    for col in columns:
+        value = row[col]
+        if value and str(value).strip():
+            return value
+    return None
+
+class RowMapper:
+    """Maps rows to engagement_training_data inserts.
+
+    Header aliases are resolved once per header instead of once per row.
+    """
+
+    def __init__(self, header, user_id: str = None, date_parser: DateParser = None):
+        header = set(header)
+        self.user_id = user_id
+        self.parse_date = date_parser or DateParser()
+        self.columns = {
+            field: [col for col in aliases if col in header]
+            for field, aliases in FIELD_ALIASES.items()
+        }
+
+    def __call__(self, row: dict):
+        """Map one row (None if it has no URL)."""
+        columns = self.columns
+        post_url = (_present(row, columns["url"]) or '').strip()
+        
+        if not post_url:
+            return None
+        
+        # Extract post type from CSV if available
+        post_type = ((row[columns["type"][0]] or '') if columns["type"] else '').lower() \
+            or detect_post_type(post_url)
+        
+        # Parse posted date
+        posted_date = None
+        for col in columns["posted_date"]:
+            if row[col]:
+                posted_date = self.parse_date(row[col])
+                break
+        
+        keyword = _present(row, columns["keyword"])
+        caption = _present(row, columns["caption"])
+        
+        # Prepare data
+        data = {
+            "post_url": post_url,
+            "keyword": keyword.strip() if keyword else None,
+            "post_type": post_type,
+            "likes_count": parse_int(row[columns["likes"][0]] if columns["likes"] else 0),
+            "comments_count": parse_int(row[columns["comments"][0]] if columns["comments"] else 0),
+            "caption": caption.strip() if caption else None,
+            "language": (row[columns["language"][0]] if columns["language"] else None) or 'English',
+        }
+        
+        # Followers (optional - account followers count); table column is named 'followers'
+        followers_val = _present(row, columns["followers"])
+        if followers_val is not None:
+            followers_val = parse_int(followers_val, None)
+            if followers_val is not None:
+                data["followers"] = followers_val
+        
+        # Views (only for reels/videos - optional)
+        views_val = _present(row, columns["views"])
+        if views_val is not None:
+            views_val = parse_int(views_val, None)
+            if views_val is not None:
+                data["views_count"] = views_val
+        
+        # Add posted_at if available
+        if posted_date:
+            data["posted_at"] = posted_date
+        
+        # Add user_id if provided
+        if self.user_id:
+            data["user_id"] = self.user_id
+        
+        # Optional columns - import if present, ignore if not
+        # Theme, tone, dominant color (support comma-separated values)
+        theme = clean_comma_separated_value(_present(row, columns["theme"]) or '')
+        if theme:
+            data["theme"] = theme
+        
+        tone = clean_comma_separated_value(_present(row, columns["tone"]) or '')
+        if tone:
+            data["tone"] = tone
+        
+        dominant_color = clean_comma_separated_value(_present(row, columns["dominant_color"]) or '')
+        if dominant_color:
+            data["dominant_color"] = dominant_color
+        
+        # CTA Present / Paid (boolean) - first column present, even if empty
+        for field in ("cta_present", "paid"):
+            for col in columns[field]:
+                if row[col] is not None:
+                    value = parse_bool(row[col])
+                    if value is not None:
+                        data[field] = value
+                    break
+        
+        # Music Type
+        music_type = _present(row, columns["music_type"])
+        if music_type:
+            data["music_type"] = music_type.strip()
+        
+        # Auto-set is_labeled if theme or tone is provided
+        if theme or tone:
+            data["is_labeled"] = True
+            if self.user_id:
+                data["labeled_by"] = self.user_id
+        
+        return data
+
+def _jsonl_value(value) -> str:
+    """JSONL values as the strings a CSV export would contain."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ','.join(str(v) for v in value)
+    return str(value)
+
+def open_records(path: str):
+    """Yield raw records from .csv, .jsonl/.ndjson, optionally gzip-compressed."""
+    name = path[:-3] if path.endswith('.gz') else path
+    opener = gzip.open if path.endswith('.gz') else open
+    
+    with opener(path, 'rt', encoding='utf-8', newline='') as f:
+        if name.endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    yield {k: _jsonl_value(v) for k, v in record.items()}
+        else:
+            yield from csv.DictReader(f)
+
+def iter_import_rows(path: str, user_id: str = None, stats: dict = None):
+    """Parse a scraper export into insert rows (None for rows without a URL).
+
+    The date format is detected once from the first rows; a row mapper is
+    compiled once per distinct header (JSONL records may vary).
+    """
+    records = open_records(path)
+    head = list(islice(records, DATE_SAMPLE_SIZE))
+    
+    date_samples = []
+    for record in head:
+        for col in FIELD_ALIASES["posted_date"]:
+            if record.get(col):
+                date_samples.append(record[col])
+                break
+    date_parser = DateParser(DateParser.detect(date_samples))
+    if date_parser.date_format:
+        print(f"   📅 Detected date format: {date_parser.date_format}")
+    
+    mappers = {}
+    parsed = 0
+    for record in chain(head, records):
+        header = tuple(record)
+        mapper = mappers.get(header)
+        if mapper is None:
+            mapper = mappers[header] = RowMapper(header, user_id, date_parser)
+        parsed += 1
+        yield mapper(record)
+    
+    instrumentation.count("rows_parsed", parsed)
+    if stats is not None:
+        stats["date_fallbacks"] = date_parser.fallbacks
+
+def chunked(iterable, size: int):
+    """Yield lists of up to `size` items."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def existing_urls(urls: list) -> set:
+    """post_urls already in the table, checked with one in_ query per slice."""
+    found = set()
+    for i in range(0, len(urls), EXISTS_QUERY_SIZE):
+        response = get_client().table("engagement_training_data") \
+            .select("post_url") \
+            .in_("post_url", urls[i:i + EXISTS_QUERY_SIZE]) \
+            .execute()
+        instrumentation.count("api_calls")
+        found.update(r["post_url"] for r in response.data)
+    return found
+
+def insert_rows(rows: list, on_inserted=None, on_failed=None) -> tuple:
+    """Insert rows in batches; returns (imported, errors).
+
+    PostgREST bulk inserts need one key set per request, so rows are grouped
+    by their columns. A failed batch is retried row by row to isolate errors.
+    on_inserted: called with the stored rows (ids included) of each insert.
+    on_failed: called with the rows that could not be inserted.
+    """
+    imported = 0
+    errors = 0
+    
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    
+    for group in groups.values():
+        for batch in chunked(group, INSERT_BATCH_SIZE):
+            try:
+                instrumentation.count("api_calls")
+                response = get_client().table("engagement_training_data").insert(batch).execute()
+                imported += len(batch)
+                if on_inserted and response.data:
+                    on_inserted(response.data)
+                continue
+            except Exception as e:
+                print(f"   ⚠️  Batch insert failed ({str(e)[:50]}), retrying row by row")
+            
+            instrumentation.count("retries", len(batch))
+            for data in batch:
+                try:
+                    instrumentation.count("api_calls")
+                    response = get_client().table("engagement_training_data").insert(data).execute()
+                    imported += 1
+                    if on_inserted and response.data:
+                        on_inserted(response.data)
+                except Exception as e:
+                    errors += 1
+                    print(f"   ❌ Error: {data['post_url'][:50]} - {str(e)[:50]}")
+                    if on_failed:
+                        on_failed([data])
+    
+    instrumentation.count("rows_inserted", imported)
+    return imported, errors
+
+def import_chunk(rows: list, on_inserted=None, on_failed=None) -> tuple:
+    """Skip rows whose URL already exists and bulk insert the rest.
+
+    Returns (imported, skipped, errors).
+    """
+    urls = [r["post_url"] for r in rows]
+    try:
+        with instrumentation.stage("dedupe"):
+            existing = existing_urls(urls)
+    except Exception as e:
+        print(f"   ❌ Existence check failed for chunk: {str(e)[:50]}")
+        if on_failed:
+            on_failed(rows)
+        return 0, 0, len(rows)
+    
+    new_rows = [r for r in rows if r["post_url"] not in existing]
+    with instrumentation.stage("insert"):
+        imported, errors = insert_rows(new_rows, on_inserted, on_failed)
+    return imported, len(rows) - len(new_rows), errors
+
+def import_csv(csv_path: str, user_id: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               workers: int = DEFAULT_WORKERS, start_record: int = 0, on_progress=None,
+               on_inserted=None, near_duplicate_policy: str = "off",
+               similarity: float = near_duplicates.DEFAULT_SIMILARITY,
+               index_path: str = near_duplicates.DEFAULT_INDEX_PATH) -> dict:
+    """Import CSV data into training table.
+
+    The file is streamed in chunks; each chunk is de-duplicated against the
+    table with batched in_ queries and inserted in batches, with several
+    chunks in flight at once.
+
+    start_record: skip this many records (a resume point from on_progress).
+    on_progress: called with the number of records whose chunks have all been
+        imported without errors, in file order, so resuming there never skips
+        a row that failed.
+    on_inserted: called (from worker threads) with each batch of stored rows.
+    near_duplicate_policy: "flag" records caption near-duplicates in the
+        index at index_path and marks them with near_duplicate_of (skipped
+        by embedding and training), "collapse" skips them instead; checked while
+        parsing, in file order. Rows whose insert fails are dropped from
+        the index again (with their copies) so a rerun re-checks them.
+    Returns the imported/skipped/errors/collapsed counts and the records read.
+    """
     if not os.path.exists(csv_path):
         print(f"❌ File not found: {csv_path}")
-        return
+        return None
+    
+    # Fail fast on missing credentials (or open the local database) before any parsing
+    get_client()
     
     print(f"📂 Reading CSV: {csv_path}")
+    if start_record:
+        print(f"   ↪️  Resuming after record {start_record}")
+    instrumentation.count("bytes_read", os.path.getsize(csv_path))
     
     imported = 0
     skipped = 0
     errors = 0
+    collapsed = 0
+    records = start_record
+    seen_urls = set()
+    index = None
+    failed_urls = []  # appended by worker threads, drained into the index here
+    if near_duplicate_policy == "flag" and not has_column("engagement_training_data", near_duplicates.COPY_COLUMN):
+        print(f"❌ --near-duplicates flag records copies in {near_duplicates.COPY_COLUMN}; "
+              f"run add_near_duplicate_of_column.sql first")
+        sys.exit(1)
+    if near_duplicate_policy != "off":
+        index = near_duplicates.NearDuplicateIndex(index_path, similarity)
     
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
-            post_url = (row.get('URL') or row.get('Url') or '').strip()
-            
-            if not post_url:
+    def record_failed(rows):
+        failed_urls.extend(row["post_url"] for row in rows)
+    
+    def forget_failed():
+        if index is not None and failed_urls:
+            urls = failed_urls[:]
+            del failed_urls[:len(urls)]
+            index.forget(urls)
+    
+    def parsed_rows():
+        nonlocal skipped, collapsed, records
+        for data in islice(iter_import_rows(csv_path, user_id), start_record, None):
+            records += 1
+            if data is None:
                 skipped += 1
                 continue
-            
-            # Check if already exists
-            existing = supabase.table("engagement_training_data") \
-                .select("id") \
-                .eq("post_url", post_url) \
-                .execute()
-            
-            if existing.data:
+            # Duplicate URLs within the file: keep the first occurrence
+            if data["post_url"] in seen_urls:
                 skipped += 1
-                print(f"   ⏭️  Skipped (exists): {post_url[:50]}")
                 continue
+            seen_urls.add(data["post_url"])
+            if index is not None and data.get("caption"):
+                canonical = index.check(data["post_url"], data["caption"], near_duplicate_policy)
+                if canonical and near_duplicate_policy == "collapse":
+                    collapsed += 1
+                    continue
+                if canonical:
+                    data[near_duplicates.COPY_COLUMN] = canonical
+            yield data
+    
+    # Chunk ends (in records) in file order; progress stops at the first
+    # chunk that is still in flight or had errors
+    chunk_ends = []
+    finished = {}
+    progress = start_record
+    
+    def collect(done):
+        nonlocal imported, skipped, errors, progress
+        for future in done:
+            chunk_imported, chunk_skipped, chunk_errors = future.result()
+            imported += chunk_imported
+            skipped += chunk_skipped
+            errors += chunk_errors
+            finished[futures[future]] = chunk_errors == 0
+        forget_failed()
+        advanced = False
+        while chunk_ends and finished.get(chunk_ends[0][0]):
+            progress = chunk_ends.pop(0)[1]
+            advanced = True
+        if advanced and on_progress:
+            on_progress(progress)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            pending = set()
             
-            # Extract post type from CSV if available
-            post_type = row.get('Type', '').lower() or detect_post_type(post_url)
-            
-            # Parse posted date
-            posted_date = None
-            for date_col in ['Posted Date', 'Date', 'Posted_Date', 'posted_at', 'Post Date']:
-                if date_col in row and row[date_col]:
-                    posted_date = parse_date(row[date_col])
-                    break
-            
-            # Prepare data
-            data = {
-                "post_url": post_url,
-                "keyword": row.get('Keyword', '').strip() or None,
-                "post_type": post_type,
-                "likes_count": parse_int(row.get('Likes', 0)),
-                "comments_count": parse_int(row.get('Comments', 0)),
-                "caption": row.get('Caption', '').strip() or None,
-                "language": row.get('Language', 'English') or 'English',
-            }
-            
-            # Followers (optional - account followers count)
-            followers_val = None
-            for col in ['Followers', 'followers', 'FOLLOWERS', 'Follower Count', 'follower_count']:
-                if col in row and row[col] and str(row[col]).strip():
-                    followers_val = parse_int(row[col], None)
-                    break
-            
-            if followers_val is not None:
-                # Table column is named 'followers'
-                data["followers"] = followers_val
-            
-            # Views (only for reels/videos - optional)
-            views_val = None
-            for col in ['Views', 'views', 'VIEWS', 'View Count', 'view_count']:
-                if col in row and row[col] and str(row[col]).strip():
-                    views_val = parse_int(row[col], None)
-                    break
-            
-            if views_val is not None:
-                data["views_count"] = views_val
-            
-            # Add posted_at if available
-            if posted_date:
-                data["posted_at"] = posted_date
-            
-            # Add user_id if provided
-            if user_id:
-                data["user_id"] = user_id
-            
-            # Optional columns - import if present, ignore if not
-            # Theme (supports comma-separated values)
-            theme = None
-            for col in ['Theme', 'theme', 'THEME']:
-                if col in row and row[col] and row[col].strip():
-                    theme = clean_comma_separated_value(row[col])
-                    break
-            if theme:
-                data["theme"] = theme
-            
-            # Tone (supports comma-separated values)
-            tone = None
-            for col in ['Tone', 'tone', 'TONE']:
-                if col in row and row[col] and row[col].strip():
-                    tone = clean_comma_separated_value(row[col])
-                    break
-            if tone:
-                data["tone"] = tone
-            
-            # Dominant Color (supports comma-separated values)
-            dominant_color = None
-            for col in ['Dominant Color', 'dominant_color', 'Dominant_Color', 'Color', 'color', 'Color Palette', 'color_palette']:
-                if col in row and row[col] and row[col].strip():
-                    dominant_color = clean_comma_separated_value(row[col])
-                    break
-            if dominant_color:
-                data["dominant_color"] = dominant_color
-            
-            # CTA Present (boolean)
-            cta_present = None
-            for col in ['CTA Present', 'cta_present', 'CTA_Present', 'cta', 'CTA']:
-                if col in row and row[col] is not None:
-                    cta_present = parse_bool(row[col])
-                    break
-            if cta_present is not None:
-                data["cta_present"] = cta_present
-            
-            # Paid (boolean)
-            paid_val = None
-            for col in ['Paid', 'paid', 'PAID', 'Boosted', 'boosted']:
-                if col in row and row[col] is not None:
-                    paid_val = parse_bool(row[col])
-                    break
-            if paid_val is not None:
-                data["paid"] = paid_val
-
-            # Music Type
-            music_type = None
-            for col in ['Music Type', 'music_type', 'Music_Type', 'Music', 'music']:
-                if col in row and row[col] and row[col].strip():
-                    music_type = row[col].strip()
-                    break
-            if music_type:
-                data["music_type"] = music_type
-            
-            # Keyword
-            keyword = None
-            for col in ['Keyword', 'keyword', 'KEYWORD', 'Search Keyword', 'search_keyword']:
-                if col in row and row[col] and row[col].strip():
-                    keyword = row[col].strip()
-                    break
-            if keyword:
-                data["keyword"] = keyword
-            
-            # Auto-set is_labeled if theme or tone is provided
-            if theme or tone:
-                data["is_labeled"] = True
-                if user_id:
-                    data["labeled_by"] = user_id
+            # Only the time spent reading and parsing each chunk counts as "parse"
+            for sequence, chunk in enumerate(instrumentation.timed(chunked(parsed_rows(), chunk_size), "parse")):
+                future = executor.submit(import_chunk, chunk, on_inserted,
+                                         record_failed if index is not None else None)
+                futures[future] = sequence
+                chunk_ends.append((sequence, records))
+                pending.add(future)
+                # Bound the number of parsed chunks held in memory
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    print(f"   ✅ Imported: {imported}, Skipped: {skipped}, Errors: {errors}")
             
-            try:
-                supabase.table("engagement_training_data").insert(data).execute()
-                imported += 1
-                print(f"   ✅ Imported: {post_url[:50]}")
-            except Exception as e:
-                errors += 1
-                print(f"   ❌ Error: {post_url[:50]} - {str(e)[:50]}")
+            for future in as_completed(pending):
+                collect([future])
+    finally:
+        if index is not None:
+            forget_failed()
+            index.close()
+    
+    # Trailing records that never filled a chunk (invalid or duplicate rows)
+    if not chunk_ends and progress < records:
+        progress = records
+        if on_progress:
+            on_progress(progress)
     
     print(f"\n{'='*60}")
     print(f"✅ Import complete!")
     print(f"   Imported: {imported}")
     print(f"   Skipped: {skipped}")
     print(f"   Errors: {errors}")
+    if index is not None:
+        if collapsed:
+            print(f"   Collapsed near-duplicates: {collapsed}")
+        near_duplicates.print_import_report(index.stats, near_duplicate_policy)
+        instrumentation.count("near_duplicates", index.stats["copies"])
     print(f"{'='*60}")
+    result = {"imported": imported, "skipped": skipped, "errors": errors, "collapsed": collapsed,
+              "records": records}
+    if index is not None:
+        result["near_duplicates"] = index.stats
+    return result
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python import_scraped_data.py <csv_file> [user_id]")
-        print("\nExample:")
-        print("  python import_scraped_data.py ../instagram_jewellery_2025-11-03.csv")
-        print("  python import_scraped_data.py ../instagram_jewellery_2025-11-03.csv <user_uuid>")
-        sys.exit(1)
-    
-    csv_path = sys.argv[1]
-    user_id = sys.argv[2] if len(sys.argv) > 2 else None
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Import scraped Instagram data into engagement_training_data",
+        epilog="Example:\n"
+               "  python import_scraped_data.py ../instagram_jewellery_2025-11-03.csv\n"
+               "  python import_scraped_data.py ../instagram_jewellery_2025-11-03.csv <user_uuid>",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("csv_file")
+    parser.add_argument("user_id", nargs="?")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="CSV rows per import chunk")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="chunks imported concurrently")
+    near_duplicates.add_arguments(parser)
+    instrumentation.add_arguments(parser)
+    storage.add_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
     
     print("╔══════════════════════════════════════════════════════╗")
     print("║  Scraped Data Importer for Training                 ║")
     print("║  Supports comma-separated values for theme/tone/color║")
     print("╚══════════════════════════════════════════════════════╝\n")
     
-    import_csv(csv_path, user_id)
+    storage.configure(args.backend, args.sqlite_path)
+    with instrumentation.run("import_scraped_data", vars(args), args.run_log, args.profile, args.profiler):
+        import_csv(args.csv_file, args.user_id, chunk_size=args.chunk_size, workers=args.workers,
+                   near_duplicate_policy=args.near_duplicates, similarity=args.similarity,
+                   index_path=args.near_duplicate_index)
+
+if __name__ == "__main__":
+    main()
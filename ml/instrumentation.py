@@ -0,0 +1,283 @@
+"""
+Run instrumentation shared by the import, embedding and training scripts.
+A script opens one run; library code records into whichever run is active
+(and does nothing when none is, e.g. when imported by a benchmark):
+
+    with instrumentation.run("train_model", args=vars(args)):
+        with instrumentation.stage("fit"):
+            model.fit(X, y)
+        instrumentation.count("api_calls")
+
+Each stage records calls, wall and process CPU seconds and its peak RSS
+(sampled in the background). Stages entered from several threads add up
+their seconds, so a stage can exceed the run's wall time. Counters are free
+form; the scripts use rows_*, api_calls, retries, tokens and *_bytes.
+
+When the run ends its summary is appended as one JSON line to the run log
+(RUN_LOG_PATH, default .cache/run_log.jsonl); train_model.py also stores it
+in the model metadata. --profile STAGE records that stage with cProfile
+(a .prof file next to the log) or, with --profiler py-spy, a py-spy flame
+graph.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import cProfile
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+RUN_LOG_PATH = os.getenv("RUN_LOG_PATH", ".cache/run_log.jsonl")
+PROFILERS = ("cprofile", "py-spy")
+SAMPLE_INTERVAL = 0.05  # seconds between RSS samples
+
+def current_rss_mb() -> float:
+    """Resident set size right now (Linux /proc; peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class _StageProfile:
+    """cProfile or py-spy attached to one stage for the whole run."""
+
+    def __init__(self, stage: str, profiler: str, path_prefix: str):
+        if profiler == "py-spy" and not shutil.which("py-spy"):
+            print("   ⚠️  py-spy not found on PATH, profiling with cProfile instead")
+            profiler = "cprofile"
+        self.stage = stage
+        self.profiler = profiler
+        self.path = f"{path_prefix}_{stage.replace('/', '_')}" + (".prof" if profiler == "cprofile" else ".svg")
+        self._profile = cProfile.Profile() if profiler == "cprofile" else None
+        self._owner = None
+        self._spy = None
+
+    def start(self) -> bool:
+        """Attach to the calling thread unless another entry already holds it."""
+        if self._owner is not None:
+            return False
+        self._owner = threading.get_ident()
+        if self._profile is not None:
+            self._profile.enable()
+        else:
+            self._spy = subprocess.Popen(
+                ["py-spy", "record", "--pid", str(os.getpid()), "--output", self.path,
+                 "--format", "flamegraph", "--threads"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        return True
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.path)
+        elif self._spy is not None:
+            # py-spy writes its output when interrupted
+            self._spy.send_signal(signal.SIGINT)
+            try:
+                self._spy.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._spy.kill()
+            self._spy = None
+        self._owner = None
+
+class Run:
+    """Stage timings, counters and memory for one script run."""
+
+    def __init__(self, script: str, args: dict = None, log_path: str = RUN_LOG_PATH,
+                 profile_stage: str = None, profiler: str = "cprofile"):
+        self.script = script
+        self.args = args or {}
+        self.log_path = log_path
+        self.run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = {}
+        self.counters = {}
+        self.status = "running"
+
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._open = {}  # id -> [stage path, peak RSS while open]
+        self._profile = None
+        if profile_stage:
+            prefix = os.path.join(os.path.dirname(log_path) or ".", f"profile_{script}_{self.run_id}")
+            self._profile = _StageProfile(profile_stage, profiler, prefix)
+
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            with self._lock:
+                for entry in self._open.values():
+                    entry[1] = max(entry[1], rss)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block; nested stages are recorded as parent/child."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        path = "/".join(stack + [name])
+        stack.append(name)
+
+        entry = [path, current_rss_mb()]
+        key = id(entry)
+        with self._lock:
+            self._open[key] = entry
+        profiling = self._profile is not None and self._profile.stage in (path, name) and self._profile.start()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            cpu_seconds = time.process_time() - cpu_started
+            if profiling:
+                self._profile.stop()
+            stack.pop()
+            rss = current_rss_mb()
+            with self._lock:
+                peak = max(self._open.pop(key)[1], rss)
+                record = self.stages.setdefault(path, {"calls": 0, "seconds": 0.0, "cpu_seconds": 0.0,
+                                                       "peak_rss_mb": 0.0})
+                record["calls"] += 1
+                record["seconds"] += seconds
+                record["cpu_seconds"] += cpu_seconds
+                record["peak_rss_mb"] = max(record["peak_rss_mb"], peak)
+
+    def count(self, name: str, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> dict:
+        """JSON-ready snapshot of the run so far."""
+        with self._lock:
+            stages = {name: {"calls": s["calls"], "seconds": round(s["seconds"], 4),
+                             "cpu_seconds": round(s["cpu_seconds"], 4),
+                             "peak_rss_mb": round(s["peak_rss_mb"], 1)}
+                      for name, s in self.stages.items()}
+            counters = dict(self.counters)
+        summary = {
+            "run_id": self.run_id,
+            "script": self.script,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "cpu_seconds": round(time.process_time() - self._cpu_started, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "stages": stages,
+            "counters": counters,
+            "args": self.args,
+        }
+        if self._profile is not None:
+            summary["profile"] = {"stage": self._profile.stage, "profiler": self._profile.profiler,
+                                  "path": self._profile.path}
+        return summary
+
+    def finish(self, status: str = "ok") -> dict:
+        """Stop sampling and append the summary to the run log."""
+        self._done.set()
+        self._sampler.join()
+        self.status = status
+        summary = self.summary()
+        summary["finished_at"] = datetime.now(timezone.utc).isoformat()
+        if self.log_path:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(summary, default=str) + "\n")
+        return summary
+
+    def report(self):
+        """Print the stage table and counters."""
+        summary = self.summary()
+        print(f"\n⏱️  Run {self.run_id}: {summary['seconds']:.1f}s, peak RSS {summary['peak_rss_mb']:.0f} MB")
+        for name, s in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print(f"   {name:<36} {s['seconds']:>9.2f}s {s['calls']:>7}x  peak {s['peak_rss_mb']:>7.0f} MB")
+        if summary["counters"]:
+            print("   " + ", ".join(f"{k}={v}" for k, v in sorted(summary["counters"].items())))
+        if "profile" in summary:
+            print(f"   🔬 {summary['profile']['stage']} profile: {summary['profile']['path']}")
+
+_active: Run = None
+
+@contextmanager
+def run(script: str, args: dict = None, log_path: str = RUN_LOG_PATH,
+        profile_stage: str = None, profiler: str = "cprofile"):
+    """Make a Run active for the block; it is logged even if the script exits early."""
+    global _active
+    current = Run(script, args, log_path, profile_stage, profiler)
+    _active = current
+    status = "ok"
+    try:
+        yield current
+    except SystemExit as e:
+        status = "ok" if e.code in (None, 0) else "exit"
+        raise
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        current.report()
+        current.finish(status)
+        print(f"   📝 Run log: {log_path}")
+        _active = None
+
+def active() -> Run:
+    return _active
+
+@contextmanager
+def stage(name: str):
+    """Time a block in the active run (no-op without one)."""
+    if _active is None:
+        yield
+        return
+    with _active.stage(name):
+        yield
+
+def timed(iterable, name: str):
+    """Yield from iterable, timing only the time spent producing each item."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+_END = object()
+
+def count(name: str, n=1):
+    """Add n to a counter of the active run (no-op without one)."""
+    if _active is not None:
+        _active.count(name, n)
+
+def summary() -> dict:
+    """Summary of the active run, or None."""
+    return _active.summary() if _active is not None else None
+
+def add_arguments(parser):
+    """--profile/--profiler/--run-log flags shared by the instrumented scripts."""
+    parser.add_argument("--profile", metavar="STAGE",
+                        help="profile one stage by name, e.g. fit or train/fit (see the run log for names)")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile",
+                        help="cprofile writes a .prof file; py-spy (if installed) a flame graph")
+    parser.add_argument("--run-log", default=RUN_LOG_PATH,
+                        help="JSON-lines file each run's timings and counters are appended to")
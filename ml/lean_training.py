@@ -0,0 +1,170 @@
+"""
+Memory-lean training path for large labeled sets.
+A dense float32 feature matrix needs n_rows x n_features x 4 bytes; with the
+full 1536-dim embedding that is ~6 GB per million posts before XGBoost makes
+its own copy. Here the features stay in two blocks:
+
+    embeddings  float32 (n, embedding_dim), e.g. the snapshot's memmap
+    tabular     CSR matrix of every other column (the one-hot and
+                multi-hot blocks are mostly zeros)
+
+XGBoost reads them through a DataIter into a QuantileDMatrix, which keeps one
+quantized bin index per value, so only one row chunk is ever dense.
+xgboost itself is imported when training starts.
+"""
+
+import os
+import functools
+import numpy as np
+import scipy.sparse as sp
+from feature_store import RowSubset
+
+DEFAULT_MEMORY_BUDGET_MB = int(os.getenv("TRAIN_MEMORY_BUDGET_MB", "4096"))
+CHUNK_BUDGET_FRACTION = 0.05  # share of the budget one dense chunk may use
+MIN_CHUNK_ROWS = 1024
+MAX_BIN = 256
+
+def dense_nbytes(n_rows: int, n_features: int) -> int:
+    return n_rows * n_features * np.dtype(np.float32).itemsize
+
+def chunk_rows_for(n_features: int, budget_mb: int = DEFAULT_MEMORY_BUDGET_MB) -> int:
+    """Rows per dense chunk so one chunk stays within its share of the budget."""
+    rows = int(budget_mb * 1024 * 1024 * CHUNK_BUDGET_FRACTION / dense_nbytes(1, n_features))
+    return max(MIN_CHUNK_ROWS, rows)
+
+class FeatureBlocks:
+    """Feature matrix held as a dense embedding block plus a CSR tabular block."""
+
+    def __init__(self, transformer, embeddings, tabular: sp.csr_matrix):
+        self.transformer = transformer
+        self.embeddings = embeddings
+        self.tabular = tabular
+
+    @classmethod
+    def build(cls, transformer, df, embeddings, chunk_rows: int):
+        """Transform the tabular columns chunk by chunk straight into CSR."""
+        n_tabular = transformer.n_features - transformer.embedding_features
+        parts = [sp.csr_matrix(transformer.transform_tabular(df.iloc[start:start + chunk_rows]))
+                 for start in range(0, len(df), chunk_rows)]
+        tabular = sp.vstack(parts, format="csr") if parts else sp.csr_matrix((0, n_tabular), dtype=np.float32)
+        return cls(transformer, embeddings, tabular)
+
+    @property
+    def n_rows(self) -> int:
+        return self.tabular.shape[0]
+
+    @property
+    def n_features(self) -> int:
+        return self.transformer.n_features
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in RAM (a memory-mapped embedding block counts as zero)."""
+        tabular = self.tabular.data.nbytes + self.tabular.indices.nbytes + self.tabular.indptr.nbytes
+        lazy = isinstance(self.embeddings, (np.memmap, RowSubset))
+        embeddings = 0 if lazy else self.embeddings.nbytes
+        return tabular + embeddings
+
+    def dense(self, rows) -> np.ndarray:
+        """Dense float32 rows in the transformer's column layout."""
+        rows = np.asarray(rows)
+        split = self.transformer.embedding_features
+        X = np.empty((len(rows), self.n_features), dtype=np.float32)
+        embeddings = np.asarray(self.embeddings[rows], dtype=np.float32)
+        if self.transformer.reducer is not None:
+            embeddings = self.transformer.reducer.transform(embeddings)
+        X[:, :split] = embeddings
+        X[:, split:] = self.tabular[rows].toarray()
+        return X
+
+    def valid_rows(self, y: np.ndarray, chunk_rows: int) -> np.ndarray:
+        """Rows whose target and features are all non-NaN."""
+        valid = ~np.isnan(y)
+        nan_entries = np.isnan(self.tabular.data)
+        if nan_entries.any():
+            row_of_entry = np.repeat(np.arange(self.n_rows), np.diff(self.tabular.indptr))
+            valid[row_of_entry[nan_entries]] = False
+        for start in range(0, self.n_rows, chunk_rows):
+            chunk = np.asarray(self.embeddings[start:start + chunk_rows])
+            valid[start:start + len(chunk)] &= ~np.isnan(chunk).any(axis=1)
+        return np.nonzero(valid)[0]
+
+    def batches(self, rows, y: np.ndarray, chunk_rows: int):
+        """Factory of (X, y) chunk iterators over `rows` (sorted for memmap locality)."""
+        rows = np.sort(np.asarray(rows))
+
+        def make_batches():
+            for start in range(0, len(rows), chunk_rows):
+                chunk = rows[start:start + chunk_rows]
+                yield self.dense(chunk), y[chunk]
+        return make_batches
+
+@functools.lru_cache(maxsize=None)
+def _batch_iter_class():
+    """BatchIter subclasses xgb.DataIter, so it is defined on first use."""
+    import xgboost as xgb
+
+    class BatchIter(xgb.DataIter):
+        """Feeds XGBoost one (X, y) batch at a time; each pass starts a fresh iterator.
+
+        cache_prefix: spill XGBoost's pages to disk under this prefix (external memory).
+        """
+
+        def __init__(self, make_batches, cache_prefix: str = None):
+            self._make_batches = make_batches
+            self._batches = None
+            super().__init__(cache_prefix=cache_prefix)
+
+        def next(self, input_data) -> int:
+            if self._batches is None:
+                self._batches = iter(self._make_batches())
+            batch = next(self._batches, None)
+            if batch is None:
+                return 0
+            X, y = batch
+            input_data(data=X, label=y)
+            return 1
+
+        def reset(self):
+            self._batches = None
+
+    return BatchIter
+
+def booster_params(params: dict, seed: int = 42) -> tuple:
+    """XGBRegressor-style params -> (native params, boosting rounds)."""
+    native = {"objective": "reg:squarederror", "tree_method": "hist", "seed": seed,
+              "nthread": os.cpu_count() or 1}
+    native.update({k: v for k, v in params.items() if k != "n_estimators"})
+    return native, int(params.get("n_estimators", 100))
+
+def train_regressor(params: dict, make_batches, max_bin: int = MAX_BIN,
+                    cache_dir: str = None):
+    """Train from batches and return an XGBRegressor, like the in-memory training path.
+
+    Without cache_dir the quantized matrix is held in RAM (QuantileDMatrix).
+    With it, XGBoost keeps its pages in cache_dir and training memory no longer
+    grows with the number of rows (ExtMemQuantileDMatrix on xgboost >= 3.0,
+    an external-memory DMatrix before that).
+    """
+    import xgboost as xgb
+
+    if cache_dir is None:
+        dtrain = xgb.QuantileDMatrix(_batch_iter_class()(make_batches), max_bin=max_bin)
+    else:
+        batches = _batch_iter_class()(make_batches, cache_prefix=os.path.join(cache_dir, "xgb"))
+        if hasattr(xgb, "ExtMemQuantileDMatrix"):
+            dtrain = xgb.ExtMemQuantileDMatrix(batches, max_bin=max_bin)
+        else:
+            dtrain = xgb.DMatrix(batches)
+    native, rounds = booster_params(params)
+    native["max_bin"] = max_bin
+    booster = xgb.train(native, dtrain, num_boost_round=rounds)
+    del dtrain
+
+    model = xgb.XGBRegressor(**params, random_state=42, n_jobs=-1)
+    model.load_model(bytearray(booster.save_raw("ubj")))
+    return model
+
+def predict_batches(model, make_batches) -> np.ndarray:
+    predictions = [model.predict(X) for X, _ in make_batches()]
+    return np.concatenate(predictions) if predictions else np.zeros(0, dtype=np.float32)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Convert existing JSON caption embeddings to the compact binary column.
+Run add_caption_embedding_bin_column.sql first.
+"""
+
+import argparse
+from dotenv import load_dotenv
+from embedding_codec import decode_embedding, encode_embedding
+from supabase_reader import DEFAULT_PAGE_SIZE, count_rows, iter_pages
+from supabase_writer import BulkWriter
+import storage
+from storage import get_client
+
+load_dotenv()
+
+def json_only_query(count: str = None):
+    """Rows with a JSON embedding and no binary one yet."""
+    return get_client().table("engagement_training_data") \
+        .select("id, caption_embedding", count=count) \
+        .not_.is_("caption_embedding", "null") \
+        .is_("caption_embedding_bin", "null")
+
+def migrate(storage: str = "f16", drop_json: bool = False, page_size: int = DEFAULT_PAGE_SIZE):
+    """Encode every JSON-only embedding into caption_embedding_bin."""
+    total = count_rows(lambda: json_only_query(count="exact"))
+    
+    if total == 0:
+        print("✅ No JSON embeddings left to migrate!")
+        return
+    
+    print(f"📊 Migrating {total} embeddings to {storage} (drop_json={drop_json})")
+    
+    invalid = 0
+    with BulkWriter(get_client(), mode="update") as writer:
+        for page in iter_pages(json_only_query, page_size):
+            for row in page:
+                try:
+                    embedding = decode_embedding(row["caption_embedding"])
+                except ValueError:
+                    invalid += 1
+                    continue
+                patch = {"id": row["id"], "caption_embedding_bin": encode_embedding(embedding, storage)}
+                if drop_json:
+                    patch["caption_embedding"] = None
+                writer.add(patch)
+            print(f"   ✅ {writer.written} migrated")
+    
+    print(f"\n{'='*60}")
+    print(f"✅ Migration complete! Migrated: {writer.written}, Failed: {writer.failed}, Invalid: {invalid}")
+    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate caption embeddings to binary storage")
+    parser.add_argument("--storage", choices=["f16", "f32"], default="f16")
+    parser.add_argument("--drop-json", action="store_true",
+                        help="clear caption_embedding once the binary copy is written")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    storage.add_arguments(parser)
+    args = parser.parse_args()
+    
+    storage.configure(args.backend, args.sqlite_path)
+    migrate(args.storage, args.drop_json, args.page_size)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+One entry point for the engagement-model pipeline:
+
+  python ml.py import <csv> [user_id]   import scraped posts       (import_scraped_data.py)
+  python ml.py embed                    embed new captions         (generate_embeddings.py)
+  python ml.py train                    train the model            (train_model.py)
+  python ml.py predict batch|serve      score posts                (predict.py)
+  python ml.py index build|update|query similar-post index         (similarity_index.py)
+  python ml.py pipeline [files...]      incremental import+embed+train (pipeline.py)
+  python ml.py dedupe build|report      near-duplicate caption index   (near_duplicates.py)
+
+Everything after the subcommand goes to that script, so
+`python ml.py train --help` lists train_model.py's flags. Only the chosen
+script's module is imported, and xgboost, scikit-learn, openai and supabase
+load when the command first needs them rather than at startup
+(benchmark_cold_start.py measures this). The per-step scripts still run on
+their own.
+"""
+
+import argparse
+import importlib
+
+COMMANDS = {
+    "import": ("import_scraped_data", "import scraped Instagram posts from a CSV"),
+    "embed": ("generate_embeddings", "generate OpenAI caption embeddings"),
+    "train": ("train_model", "train the engagement model"),
+    "predict": ("predict", "score posts in batch or serve predictions"),
+    "index": ("similarity_index", "build, update or query the similar-post index"),
+    "pipeline": ("pipeline", "run import -> embed -> train incrementally from checkpoints"),
+    "dedupe": ("near_duplicates", "build or report the near-duplicate caption index"),
+}
+
+def parse_args(argv: list = None):
+    parser = argparse.ArgumentParser(
+        prog="ml.py",
+        description="Engagement model pipeline",
+        epilog="commands:\n" + "\n".join(f"  {name:<9} {help}" for name, (_, help) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the command")
+    return parser.parse_args(argv)
+
+def main(argv: list = None):
+    args = parse_args(argv)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(args.args, prog=f"ml.py {args.command}")
+
+if __name__ == "__main__":
+    main()
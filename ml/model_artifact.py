@@ -0,0 +1,132 @@
+"""
+Model files written by train_model.py and loaded by predict.py.
+
+The model is saved in XGBoost's native format (UBJSON by default; JSON with
+MODEL_FORMAT=json or train_model.py --model-format json). The fitted feature
+layout and model version are stored as booster attributes, so the one file
+is enough to score with and loading it never unpickles code:
+
+    <MODELS_DIR>/engagement_model_<timestamp>.ubj       (and engagement_model_latest.ubj)
+    <MODELS_DIR>/model_metadata_<timestamp>.json        metrics, params, run summary
+    <MODELS_DIR>/feature_transformer_<timestamp>.json   the layout again, for inspection
+
+Segment models (segmented_training.py) are saved next to it as
+engagement_model_<timestamp>.segment-<name>.<format> (labels whose names
+clash get a short hash of the label appended); the global model's
+"segments" attribute lists them with the columns that pick a segment.
+
+Models saved before this format (engagement_model_latest.pkl, joblib) still
+load. xgboost is imported on first load/save, not with this module.
+"""
+
+import os
+import json
+import hashlib
+
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+MODEL_FORMATS = ("ubj", "json")
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "ubj")
+METADATA_PATH = os.path.join(MODELS_DIR, "model_metadata_latest.json")
+TRANSFORMER_PATH = os.path.join(MODELS_DIR, "feature_transformer_latest.json")
+LEGACY_MODEL_PATH = os.path.join(MODELS_DIR, "engagement_model_latest.pkl")
+LAYOUT_ATTRIBUTE = "feature_transformer"
+VERSION_ATTRIBUTE = "model_version"
+SEGMENTS_ATTRIBUTE = "segments"
+
+def model_path(tag: str = "latest", model_format: str = MODEL_FORMAT) -> str:
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(f"Unknown model format: {model_format}")
+    return os.path.join(MODELS_DIR, f"engagement_model_{tag}.{model_format}")
+
+def latest_model_path() -> str:
+    """The latest model file (native formats before the legacy pickle), or None."""
+    for model_format in MODEL_FORMATS:
+        path = model_path("latest", model_format)
+        if os.path.exists(path):
+            return path
+    return LEGACY_MODEL_PATH if os.path.exists(LEGACY_MODEL_PATH) else None
+
+def save_booster(booster, transformer_dict: dict, version: str, model_format: str = MODEL_FORMAT,
+                 segments: dict = None) -> str:
+    """Write the booster as engagement_model_<version> and promote it to latest.
+
+    segments: {"keys": [...], "models": {label: file name}} from
+    save_segment_boosters, recorded on the booster.
+    Returns the versioned path. The latest file is replaced atomically, and
+    a latest file left in the other format is removed.
+    """
+    booster.set_attr(**{LAYOUT_ATTRIBUTE: json.dumps(transformer_dict), VERSION_ATTRIBUTE: version,
+                        SEGMENTS_ATTRIBUTE: json.dumps(segments) if segments else None})
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    path = model_path(version, model_format)
+    booster.save_model(path)
+
+    latest = model_path("latest", model_format)
+    # save_model picks the format from the extension, so keep it last
+    tmp_path = os.path.join(MODELS_DIR, f"engagement_model_latest.tmp.{model_format}")
+    booster.save_model(tmp_path)
+    os.replace(tmp_path, latest)
+    for other in MODEL_FORMATS:
+        if other != model_format and os.path.exists(model_path("latest", other)):
+            os.remove(model_path("latest", other))
+    return path
+
+def load_booster(path: str):
+    """(booster, transformer dict or None, version or None) from a model file."""
+    if path.endswith(".pkl"):
+        # Legacy pickled XGBRegressor; its layout lives in the transformer/metadata files
+        import joblib
+        return joblib.load(path).get_booster(), None, None
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(path)
+    layout = booster.attr(LAYOUT_ATTRIBUTE)
+    return booster, (json.loads(layout) if layout else None), booster.attr(VERSION_ATTRIBUTE)
+
+def save_segment_boosters(boosters: dict, keys, version: str, model_format: str = MODEL_FORMAT) -> dict:
+    """Write each segment's booster; returns the map save_booster records."""
+    from segmented_training import segment_slug
+
+    slugs = {label: segment_slug(label) for label in boosters}
+    shared = {slug for slug in slugs.values() if list(slugs.values()).count(slug) > 1}
+    for label, slug in slugs.items():
+        # "reel/gold" and "reel-gold" share a slug; the label's hash keeps their files apart
+        if slug in shared:
+            slugs[label] = f"{slug}-{hashlib.sha1(label.encode('utf-8')).hexdigest()[:8]}"
+    if len(set(slugs.values())) != len(slugs):
+        raise ValueError(f"Segment labels map to the same model file: {sorted(slugs)}")
+
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    models = {}
+    for label, booster in boosters.items():
+        name = f"engagement_model_{version}.segment-{slugs[label]}.{model_format}"
+        booster.save_model(os.path.join(MODELS_DIR, name))
+        models[label] = name
+    return {"keys": list(keys), "models": models}
+
+def segment_map(booster) -> dict:
+    """The segments recorded on a global booster, or None."""
+    segments = booster.attr(SEGMENTS_ATTRIBUTE)
+    return json.loads(segments) if segments else None
+
+def load_segments(booster) -> tuple:
+    """(segment keys, {label: booster}) for the segments recorded on a global booster."""
+    segments = segment_map(booster)
+    if not segments:
+        return (), {}
+    import xgboost as xgb
+    boosters = {}
+    for label, name in segments["models"].items():
+        path = os.path.join(MODELS_DIR, name)
+        if not os.path.exists(path):
+            print(f"⚠️  Segment model {path} is missing; its posts get the global model")
+            continue
+        boosters[label] = xgb.Booster()
+        boosters[label].load_model(path)
+    return tuple(segments["keys"]), boosters
+
+def load_metadata(path: str = METADATA_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate caption detection for the importer (MinHash LSH).
+
+Scraper exports repeat one caption under many URLs: reposts, and template
+captions that differ by a hashtag, an emoji or a price. Every copy costs an
+embedding request and adds a training row for what is really one post.
+import_scraped_data.py checks each new row against a persistent index of the
+captions it has already seen and, by --near-duplicates policy:
+
+    off       import every row (exact post_url de-duplication only)
+    flag      import every row; copies carry the first post's post_url in
+              near_duplicate_of, so embedding and training skip them
+              (needs add_near_duplicate_of_column.sql)
+    collapse  import the first post of a cluster and skip its copies
+
+  python near_duplicates.py build     index the captions already in the table
+  python near_duplicates.py report    clusters and embedding spend avoided so far
+
+Captions are normalized (NFKC, lowercase, emoji and punctuation dropped,
+hashtag words kept), cut into 5-byte shingles and summarized by a 128-value
+MinHash signature, split into 16 LSH bands of 8 values. A caption is only
+compared with indexed captions that share a band, and copies the most
+similar one whose estimated Jaccard similarity reaches --similarity. Only
+a cluster's first post is banded, so clusters never chain. One check is a
+signature plus one indexed SQLite lookup, well under a millisecond.
+
+The index (NEAR_DUPLICATE_INDEX_PATH, default .cache/near_duplicates.sqlite):
+
+    posts    post_url, signature, canonical post_url and similarity for
+             copies, caption hash, estimated tokens and the policy applied
+    buckets  LSH band hash -> canonical post_url
+    meta     shingle/signature parameters the index was built with
+
+A post whose insert fails is dropped from the index again, together with
+the copies recorded against it, so a rerun checks them afresh.
+
+Exact copies (same caption up to whitespace) are embedded once anyway
+through the embedding cache, so the spend report only counts the others.
+numpy loads on the first check, not with the importer.
+"""
+
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import unicodedata
+from functools import lru_cache
+from dotenv import load_dotenv
+from embedding_inputs import MAX_INPUT_CHARS, estimate_tokens, normalize_caption
+import storage
+from storage import get_client
+
+load_dotenv()
+
+POLICIES = ("off", "flag", "collapse")
+DEFAULT_POLICY = os.getenv("NEAR_DUPLICATE_POLICY", "off")
+DEFAULT_INDEX_PATH = os.getenv("NEAR_DUPLICATE_INDEX_PATH", ".cache/near_duplicates.sqlite")
+DEFAULT_SIMILARITY = 0.8
+COPY_COLUMN = "near_duplicate_of"  # engagement_training_data column naming a copy's first post
+SHINGLE_BYTES = 5
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+MIN_CAPTION_CHARS = 20  # shorter captions ("❤️", "new drop") are never clustered
+COMMIT_EVERY = 500
+SEED = 1
+# text-embedding-3-small, USD per 1M tokens
+EMBEDDING_PRICE_PER_M = float(os.getenv("OPENAI_EMBEDDING_PRICE_PER_M", "0.02"))
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    post_url TEXT PRIMARY KEY,
+    signature BLOB NOT NULL,
+    canonical TEXT,
+    similarity REAL,
+    caption_hash TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    action TEXT,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_canonical ON posts(canonical);
+CREATE TABLE IF NOT EXISTS buckets (key INTEGER NOT NULL, post_url TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_buckets_key ON buckets(key);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+PARAMETERS = {"shingle_bytes": SHINGLE_BYTES, "num_perm": NUM_PERM, "bands": BANDS, "seed": SEED,
+              "hash": "multiply-shift"}
+
+def normalize(caption: str) -> str:
+    """Caption text as compared: NFKC, lowercase, no emoji/punctuation, single spaces."""
+    text = unicodedata.normalize("NFKC", caption or "").lower()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+@lru_cache(maxsize=None)
+def _hash_parameters():
+    """Shingle weights and the NUM_PERM multiply-shift hash functions (a*x + b) >> 32."""
+    import numpy as np
+
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)  # odd
+    b = rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+    weights = np.array([257**i for i in range(SHINGLE_BYTES - 1, -1, -1)], dtype=np.uint64)
+    return a, b, weights
+
+def signature(text: str):
+    """MinHash signature (uint32[NUM_PERM]) of a normalized caption's shingles."""
+    import numpy as np
+
+    a, b, weights = _hash_parameters()
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+    if len(data) < SHINGLE_BYTES:
+        data = np.pad(data, (0, SHINGLE_BYTES - len(data)))
+    # Base-257 value of each shingle (exact, < 2**41); products wrap mod 2**64
+    count = len(data) - SHINGLE_BYTES + 1
+    shingles = data[:count] * weights[0]
+    for offset in range(1, SHINGLE_BYTES):
+        shingles += data[offset:offset + count] * weights[offset]
+    shingles = np.unique(shingles)
+    hashed = np.multiply(shingles[:, None], a)
+    hashed += b
+    # The shift is monotonic, so it can come after the min
+    return (hashed.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+def band_keys(sig) -> list:
+    """One signed 64-bit bucket key per LSH band."""
+    raw = sig.tobytes()
+    step = ROWS_PER_BAND * sig.itemsize
+    return [int.from_bytes(hashlib.blake2b(bytes([band]) + raw[band * step:(band + 1) * step],
+                                           digest_size=8).digest(), "little", signed=True)
+            for band in range(BANDS)]
+
+def caption_hash(caption: str) -> str:
+    """Hash of the caption as the embedding cache keys it (whitespace collapsed)."""
+    return hashlib.sha256(normalize_caption(caption).encode("utf-8")).hexdigest()[:16]
+
+def embedding_tokens(caption: str) -> int:
+    """Tokens generate_embeddings.py would send for this caption."""
+    return estimate_tokens(caption[:MAX_INPUT_CHARS])
+
+def spend(tokens: int) -> float:
+    """Embedding cost in USD of `tokens` tokens."""
+    return tokens * EMBEDDING_PRICE_PER_M / 1e6
+
+class NearDuplicateIndex:
+    """Persistent MinHash LSH index over imported captions. One writer at a time."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, similarity: float = DEFAULT_SIMILARITY):
+        self.path = path
+        self.similarity = similarity
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._check_parameters()
+        # Load numpy now rather than inside the first check
+        _hash_parameters()
+        self.pending = 0
+        self.stats = {"checked": 0, "short": 0, "known": 0, "canonical": 0, "copies": 0, "exact_copies": 0,
+                      "near_tokens": 0, "forgotten": 0, "check_seconds": 0.0}
+
+    def _check_parameters(self):
+        stored = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        expected = {key: str(value) for key, value in PARAMETERS.items()}
+        if not stored:
+            self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", expected.items())
+            self.conn.commit()
+        elif stored != expected:
+            raise ValueError(f"{self.path} was built with {stored}, expected {expected}; "
+                             f"rebuild it with `near_duplicates.py build`")
+
+    def match(self, sig, post_url: str = None) -> tuple:
+        """(canonical post_url, similarity) of the closest banded caption, or (None, best similarity)."""
+        import numpy as np
+
+        keys = band_keys(sig)
+        rows = self.conn.execute(
+            "SELECT DISTINCT p.post_url, p.signature FROM buckets b JOIN posts p ON p.post_url = b.post_url "
+            f"WHERE b.key IN ({','.join('?' * len(keys))})", keys).fetchall()
+        best, best_similarity = None, 0.0
+        for url, blob in rows:
+            if url == post_url:
+                continue
+            similarity = float(np.count_nonzero(np.frombuffer(blob, dtype=np.uint32) == sig)) / NUM_PERM
+            if similarity > best_similarity:
+                best, best_similarity = url, similarity
+        if best_similarity < self.similarity:
+            return None, best_similarity
+        return best, best_similarity
+
+    def check(self, post_url: str, caption: str, action: str = "flag") -> str:
+        """Record one post; returns the canonical post_url it copies, or None.
+
+        action: what the importer does with copies ("flag" or "collapse"),
+        stored with them for the report. A post_url already in the index
+        (e.g. from an interrupted import) keeps its earlier verdict.
+        """
+        started = time.perf_counter()
+        self.stats["checked"] += 1
+        text = normalize(caption)
+        if len(text) < MIN_CAPTION_CHARS:
+            self.stats["short"] += 1
+            return None
+
+        known = self.conn.execute("SELECT canonical FROM posts WHERE post_url = ?", (post_url,)).fetchone()
+        if known is not None:
+            self.stats["known"] += 1
+            return known[0]
+
+        sig = signature(text)
+        canonical, similarity = self.match(sig, post_url)
+        digest = caption_hash(caption)
+        tokens = embedding_tokens(caption)
+        self.conn.execute(
+            "INSERT INTO posts (post_url, signature, canonical, similarity, caption_hash, tokens, action, "
+            "added_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (post_url, sig.tobytes(), canonical, similarity if canonical else None, digest, tokens,
+             action if canonical else None, time.time()))
+        if canonical is None:
+            self.conn.executemany("INSERT INTO buckets (key, post_url) VALUES (?, ?)",
+                                  [(key, post_url) for key in band_keys(sig)])
+        else:
+            exact = self.conn.execute("SELECT caption_hash = ? FROM posts WHERE post_url = ?",
+                                      (digest, canonical)).fetchone()[0]
+            self.stats["exact_copies"] += int(exact)
+            if not exact:
+                self.stats["near_tokens"] += tokens
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.commit()
+
+        self.stats["copies" if canonical else "canonical"] += 1
+        self.stats["check_seconds"] += time.perf_counter() - started
+        return canonical
+
+    def forget(self, post_urls: list) -> int:
+        """Drop posts that were not imported, and the copies recorded against them.
+
+        Returns the number of index entries removed.
+        """
+        post_urls = list(post_urls)
+        removed = 0
+        for i in range(0, len(post_urls), COMMIT_EVERY):
+            part = post_urls[i:i + COMMIT_EVERY]
+            marks = ",".join("?" * len(part))
+            self.conn.execute(f"DELETE FROM buckets WHERE post_url IN ({marks})", part)
+            removed += self.conn.execute(
+                f"DELETE FROM posts WHERE post_url IN ({marks}) OR canonical IN ({marks})", part + part).rowcount
+        self.commit()
+        self.stats["forgotten"] += removed
+        return removed
+
+    def summary(self) -> dict:
+        """Totals over everything the index has recorded."""
+        posts, canonical = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(canonical IS NULL), 0) FROM posts").fetchone()
+        clusters = self.conn.execute("SELECT COUNT(DISTINCT canonical) FROM posts").fetchone()[0]
+        by_action = {}
+        for action, copies, exact, near_tokens in self.conn.execute(
+                "SELECT d.action, COUNT(*), SUM(d.caption_hash = c.caption_hash), "
+                "SUM(CASE WHEN d.caption_hash = c.caption_hash THEN 0 ELSE d.tokens END) "
+                "FROM posts d JOIN posts c ON c.post_url = d.canonical GROUP BY d.action"):
+            by_action[action] = {"copies": copies, "exact_copies": exact, "near_tokens": near_tokens,
+                                 "near_usd": spend(near_tokens)}
+        largest = self.conn.execute(
+            "SELECT canonical, COUNT(*) FROM posts WHERE canonical IS NOT NULL "
+            "GROUP BY canonical ORDER BY COUNT(*) DESC LIMIT 5").fetchall()
+        return {"posts": posts, "canonical": canonical, "clusters": clusters, "by_action": by_action,
+                "largest_clusters": [{"canonical": url, "copies": copies} for url, copies in largest]}
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+def add_arguments(parser):
+    """--near-duplicates/--similarity/--near-duplicate-index flags shared by the importers."""
+    parser.add_argument("--near-duplicates", choices=POLICIES, default=DEFAULT_POLICY,
+                        help=f"rows whose caption nearly copies an earlier post (default: NEAR_DUPLICATE_POLICY "
+                             f"or {DEFAULT_POLICY})")
+    parser.add_argument("--similarity", type=float, default=DEFAULT_SIMILARITY,
+                        help="estimated caption Jaccard similarity that makes a copy (default: %(default)s)")
+    parser.add_argument("--near-duplicate-index", default=DEFAULT_INDEX_PATH,
+                        help="persistent near-duplicate index file")
+
+def print_import_report(stats: dict, policy: str):
+    """One-run summary printed by the importer."""
+    checked = stats["canonical"] + stats["copies"]
+    if not stats["checked"]:
+        return
+    near = stats["copies"] - stats["exact_copies"]
+    avoided = "avoided" if policy == "collapse" else f"avoided (kept, marked in {COPY_COLUMN})"
+    print(f"   🧬 Near-duplicates ({policy}): {stats['copies']} of {checked} new captions copy an earlier post "
+          f"({stats['exact_copies']} exact, {near} near)")
+    if stats["known"]:
+        print(f"      {stats['known']} posts were already indexed and kept their earlier verdict")
+    if stats["forgotten"]:
+        print(f"      {stats['forgotten']} posts were dropped from the index after failed inserts")
+    if stats["copies"]:
+        print(f"      ~{stats['near_tokens']:,} embedding tokens (${spend(stats['near_tokens']):.4f}) and "
+              f"{stats['copies']} training rows {avoided}")
+    if checked:
+        print(f"      {stats['check_seconds'] / checked * 1e6:.0f} µs per check")
+
+def write_flags(flags: dict) -> int:
+    """Set near_duplicate_of on rows, as {row id: canonical post_url or None}."""
+    by_value = {}
+    for row_id, canonical in flags.items():
+        by_value.setdefault(canonical, []).append(row_id)
+    for canonical, ids in by_value.items():
+        for i in range(0, len(ids), COMMIT_EVERY):
+            get_client().table("engagement_training_data") \
+                .update({COPY_COLUMN: canonical}) \
+                .in_("id", ids[i:i + COMMIT_EVERY]) \
+                .execute()
+    return len(flags)
+
+def build_index(path: str = DEFAULT_INDEX_PATH, similarity: float = DEFAULT_SIMILARITY,
+                page_size: int = None):
+    """Rebuild the index from the captions in the table, oldest post first.
+
+    Rows are streamed page by page in (created_at, id) order. When the table
+    has near_duplicate_of, it is brought in line with the rebuilt clusters.
+    """
+    from supabase_reader import DEFAULT_PAGE_SIZE, iter_pages_by
+
+    flag_rows = storage.has_column("engagement_training_data", COPY_COLUMN)
+    columns = "id, post_url, caption, created_at" + (f", {COPY_COLUMN}" if flag_rows else "")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    started = time.perf_counter()
+    index = NearDuplicateIndex(path, similarity)
+    indexed = flagged = 0
+    print("🔍 Indexing captions from engagement_training_data...")
+    pages = iter_pages_by(lambda: get_client().table("engagement_training_data").select(columns),
+                          "created_at", page_size or DEFAULT_PAGE_SIZE)
+    for page in pages:
+        flags = {}
+        for row in page:
+            canonical = index.check(row["post_url"], row.get("caption"), "flag")
+            if flag_rows and row.get(COPY_COLUMN) != canonical:
+                flags[row["id"]] = canonical
+        index.commit()
+        if flags:
+            flagged += write_flags(flags)
+        indexed += len(page)
+        print(f"   🧬 Indexed {indexed} posts...")
+    print(f"\n{'='*60}")
+    print(f"✅ Indexed {indexed} posts in {time.perf_counter() - started:.1f}s -> {path}")
+    if flag_rows:
+        print(f"   🏷️  Updated {COPY_COLUMN} on {flagged} rows")
+    print_import_report(index.stats, "flag")
+    print(f"{'='*60}")
+    index.close()
+
+def report(path: str = DEFAULT_INDEX_PATH):
+    if not os.path.exists(path):
+        print(f"❌ No near-duplicate index at {path}; import with --near-duplicates or run `build`")
+        sys.exit(1)
+    index = NearDuplicateIndex(path)
+    summary = index.summary()
+    index.close()
+    print(f"\n{'='*60}")
+    print(f"🧬 Near-duplicate index: {summary['posts']} posts, {summary['canonical']} distinct captions, "
+          f"{summary['clusters']} clusters with copies")
+    for action, totals in sorted(summary["by_action"].items()):
+        verb = "avoided" if action == "collapse" else f"avoided (marked in {COPY_COLUMN})"
+        print(f"   {action:<9} {totals['copies']} copies ({totals['exact_copies']} exact); "
+              f"~{totals['near_tokens']:,} tokens (${totals['near_usd']:.4f}) {verb}")
+    for cluster in summary["largest_clusters"]:
+        print(f"   📎 {cluster['copies']:>4} copies of {cluster['canonical']}")
+    print(f"{'='*60}")
+    return summary
+
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Near-duplicate caption index for the importer")
+    parser.add_argument("--index-path", default=DEFAULT_INDEX_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="rebuild the index from the captions already in the table")
+    build.add_argument("--similarity", type=float, default=DEFAULT_SIMILARITY,
+                       help="estimated Jaccard similarity that makes a copy (default: %(default)s)")
+    build.add_argument("--page-size", type=int, default=None, help="rows fetched per page")
+    storage.add_arguments(build)
+    sub.add_parser("report", help="clusters and embedding spend avoided so far")
+    return parser.parse_args(argv)
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
+    if args.command == "build":
+        storage.configure(args.backend, args.sqlite_path)
+        build_index(args.index_path, args.similarity, args.page_size)
+    else:
+        report(args.index_path)
+
+if __name__ == "__main__":
+    main()
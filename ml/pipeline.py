@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Incremental import -> embed -> train pipeline.
+
+  python pipeline.py scraped_*.csv            import new files, embed new captions,
+                                              retrain when enough new labels arrived
+  python pipeline.py --stages embed train     without the import
+
+The stages form a graph (embed after import, train after embed); a stage
+whose dependency failed or was skipped in this run is skipped too. Each stage keeps its
+checkpoint in PIPELINE_STATE_PATH (.cache/pipeline_state.json), saved as
+soon as it advances, so rerunning after a crash picks up where it stopped:
+
+    import  per file: size, mtime and the records imported so far. A finished,
+            unchanged file is skipped and a partly imported one resumes (rows
+            are still de-duplicated by post_url, and near_duplicates.py keeps
+            each caption's earlier verdict, so re-reading is harmless)
+    embed   updated_at watermark: only captions without an embedding that
+            changed since the last clean pass are fetched
+    train   the model's labeled_at watermark: new labeled rows are counted
+            first, and below --min-new-labels the model is left alone
+
+While the import runs, the rows it inserts are embedded on a background
+thread in pages of --page-size, so embedding overlaps the import instead of
+waiting for it. The catch-up pass afterwards embeds anything else pending
+since the watermark (rows from other sources, earlier failures).
+"""
+
+import os
+import json
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import pandas as pd
+from dotenv import load_dotenv
+from caption_featurizer import FEATURIZERS
+from embedding_codec import DEFAULT_STORAGE, EMBEDDING_DIMENSIONS, STORAGE_FORMATS
+from supabase_reader import DEFAULT_PAGE_SIZE, count_rows, iter_pages
+from supabase_writer import BulkWriter
+import generate_embeddings
+import import_scraped_data
+import instrumentation
+import model_artifact
+import near_duplicates
+import storage
+import train_model
+from storage import get_client
+
+load_dotenv()
+
+PIPELINE_STATE_PATH = os.getenv("PIPELINE_STATE_PATH", ".cache/pipeline_state.json")
+STAGES = ("import", "embed", "train")
+DEPENDS_ON = {"import": (), "embed": ("import",), "train": ("embed",)}
+WATERMARK_OVERLAP = pd.Timedelta(minutes=10)  # same re-read window as the feature snapshot sync
+STREAM_QUEUE_BATCHES = 16  # inserted batches waiting for the embedder before the import blocks
+
+class PipelineState:
+    """Per-stage checkpoints, rewritten atomically on every save."""
+
+    def __init__(self, path: str = PIPELINE_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def stage(self, name: str) -> dict:
+        return self.data.setdefault(name, {})
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+class Embedder:
+    """The embedding side of generate_embeddings.py, fed one page at a time."""
+
+    def __init__(self, batch_size: int, workers: int, rpm: int, tpm: int, use_cache: bool,
+                 storage: str, dimensions: int, update_index: bool):
+        from embedding_cache import EmbeddingCache
+
+        self.batch_size = batch_size
+        self.storage = storage
+        self.dimensions = dimensions
+        self.stats = {"queued": 0, "failed": 0, "errors": 0, "tokens": 0, "non_empty": 0, "unique": 0}
+        self.indexed = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.limiter = generate_embeddings.RateLimiter(rpm, tpm)
+        self.writer = BulkWriter(get_client(), mode="update")
+        self.cache = EmbeddingCache() if use_cache else None
+        self.index = generate_embeddings.open_embedding_index(dimensions) if update_index else None
+
+    @property
+    def clean(self) -> bool:
+        """No embedding request or write has failed so far."""
+        return self.stats["errors"] == 0 and self.writer.failed == 0
+
+    def embed(self, page: list):
+        self.indexed += generate_embeddings.write_page(page, self.stats, self.executor, self.limiter,
+                                                       self.writer, self.cache, self.batch_size, self.storage,
+                                                       self.dimensions, self.index)
+
+    def close(self):
+        self.executor.shutdown()
+        self.writer.close()
+        if self.cache:
+            instrumentation.count("cache_hits", self.cache.hits)
+            instrumentation.count("cache_misses", self.cache.misses)
+            self.cache.close()
+        if self.index is not None:
+            self.index.close()
+
+class EmbeddingStream:
+    """Embeds rows as the import inserts them, on a background thread."""
+
+    def __init__(self, embedder: Embedder, page_size: int):
+        self.embedder = embedder
+        self.page_size = page_size
+        self.rows = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=STREAM_QUEUE_BATCHES)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, rows: list):
+        """on_inserted hook for import_csv (called from its worker threads)."""
+        # Flagged near-duplicates are not embedded
+        captioned = [{key: row.get(key) for key in ("id", "post_url", "caption", "engagement_score")}
+                     for row in rows if isinstance(row.get("caption"), str) and row["caption"].strip()
+                     and not row.get(near_duplicates.COPY_COLUMN)]
+        # Once the embedder has failed, rows are left for the catch-up pass of the next run
+        while captioned and self.error is None:
+            try:
+                self._queue.put(captioned, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        page = []
+        while True:
+            try:
+                rows = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                rows = []
+            done = rows is None
+            page.extend(rows or [])
+            # A full page, or whatever is buffered once the import pauses or ends
+            if page and (done or not rows or len(page) >= self.page_size):
+                try:
+                    self.embedder.embed(page)
+                except Exception as e:
+                    self.error = e
+                    return
+                self.rows += len(page)
+                page = []
+            if done:
+                return
+
+    def close(self):
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1.0)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+def file_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def run_import(files: list, state: PipelineState, user_id: str, chunk_size: int, workers: int,
+               stream: EmbeddingStream = None, near_duplicate_policy: str = "off",
+               similarity: float = near_duplicates.DEFAULT_SIMILARITY,
+               index_path: str = near_duplicates.DEFAULT_INDEX_PATH) -> dict:
+    """Import each file from its checkpoint; returns the summed counts."""
+    checkpoints = state.stage("import").setdefault("files", {})
+    totals = {"imported": 0, "skipped": 0, "errors": 0, "collapsed": 0, "files_skipped": 0}
+    for path in files:
+        key = os.path.abspath(path)
+        if not os.path.exists(path):
+            print(f"❌ File not found: {path}")
+            totals["errors"] += 1
+            continue
+        signature = file_signature(path)
+        checkpoint = checkpoints.get(key)
+        if checkpoint and {k: checkpoint.get(k) for k in signature} != signature:
+            print(f"   🔄 {path} changed since it was imported, reading it again")
+            checkpoint = None
+        if checkpoint and checkpoint.get("complete"):
+            print(f"   ⏭️  {path} already imported ({checkpoint['records']} records)")
+            totals["files_skipped"] += 1
+            continue
+        checkpoint = checkpoints[key] = {**signature, "records": (checkpoint or {}).get("records", 0),
+                                         "complete": False}
+
+        def save_progress(records):
+            checkpoint["records"] = records
+            state.save()
+
+        result = import_scraped_data.import_csv(path, user_id, chunk_size=chunk_size, workers=workers,
+                            start_record=checkpoint["records"], on_progress=save_progress,
+                            on_inserted=stream.add if stream else None,
+                            near_duplicate_policy=near_duplicate_policy, similarity=similarity,
+                            index_path=index_path)
+        checkpoint["complete"] = result["errors"] == 0
+        checkpoint["imported_at"] = datetime.now(timezone.utc).isoformat()
+        state.save()
+        for name in ("imported", "skipped", "errors", "collapsed"):
+            totals[name] += result[name]
+    return totals
+
+def latest_update() -> str:
+    """Newest updated_at in the table (the database's clock, not ours)."""
+    rows = get_client().table("engagement_training_data") \
+        .select("updated_at") \
+        .order("updated_at", desc=True) \
+        .limit(1) \
+        .execute().data
+    instrumentation.count("api_calls")
+    return rows[0]["updated_at"] if rows else None
+
+def run_embed(embedder: Embedder, state: PipelineState, page_size: int) -> int:
+    """Embed captions still pending since the watermark; returns rows queued."""
+    checkpoint = state.stage("embed")
+    watermark = checkpoint.get("watermark")
+    since = (pd.Timestamp(watermark) - WATERMARK_OVERLAP).isoformat() if watermark else None
+    latest = latest_update()
+    print(f"🔍 Captions without embeddings{f' updated since {since}' if since else ''}...")
+
+    queued = embedder.stats["queued"]
+    pages = iter_pages(lambda: generate_embeddings.pending_embeddings_query(updated_since=since,
+                                                                             storage=embedder.storage), page_size)
+    for page in instrumentation.timed(pages, "fetch_page"):
+        embedder.embed(page)
+        print(f"   ✅ {embedder.stats['queued'] - queued} embedded, {embedder.writer.written} saved")
+
+    # Rows that failed keep their updated_at, so the watermark waits for a clean pass
+    if embedder.clean:
+        checkpoint["watermark"] = latest or watermark
+        checkpoint["embedded_at"] = datetime.now(timezone.utc).isoformat()
+        state.save()
+    else:
+        print("   ⚠️  Some embeddings failed; the watermark stays put so they are retried")
+    return embedder.stats["queued"] - queued
+
+def retrain_settings(metadata: dict) -> dict:
+    """train_model() caption settings that rebuild the current model's layout.
+
+    A local featurizer keeps its method and size; stored OpenAI embeddings
+    keep their reduced dimension and reducer (refitted on the new rows).
+    """
+    method = metadata.get("caption_featurizer", {}).get("method", "openai")
+    if method != "openai":
+        return {"featurizer": method, "embedding_dim": metadata["caption_featurizer"].get("dim")}
+    embedding = metadata.get("embedding") or {}
+    source_dim = embedding.get("source_dim", train_model.EMBEDDING_DIM)
+    if source_dim != train_model.EMBEDDING_DIM:
+        raise ValueError(f"Model {metadata.get('timestamp')} was trained on {source_dim}-dim embeddings but "
+                         f"EMBEDDING_DIMENSIONS is {train_model.EMBEDDING_DIM}; set it to match")
+    dim = embedding.get("dim", source_dim)
+    return {"featurizer": "openai", "embedding_dim": dim if dim < source_dim else None,
+            "reducer": embedding.get("reducer") or "truncate"}
+
+def run_train(state: PipelineState, min_new_labels: int, retrain: bool, use_snapshot: bool,
+              rounds: int, featurizer: str, model_format: str) -> bool:
+    """Retrain (incrementally unless `retrain`) when enough new labeled rows arrived.
+
+    Returns False when the model was left alone.
+    """
+    checkpoint = state.stage("train")
+    metadata = model_artifact.load_metadata()
+    if not metadata or model_artifact.latest_model_path() is None:
+        print("🧠 No model yet, running a full training")
+        train_model.train_model(use_snapshot=use_snapshot, featurizer=featurizer, model_format=model_format)
+        new_labels = None
+    else:
+        since = train_model.previous_watermark(metadata)
+        method = metadata.get("caption_featurizer", {}).get("method", "openai")
+        with instrumentation.stage("count_new_labels"):
+            new_labels = count_rows(lambda: train_model.labeled_rows_query(
+                since, require_embeddings=method == "openai", columns="id", count="exact"))
+        print(f"🧠 Model {metadata['timestamp']}: {new_labels} posts labeled since {since}")
+        checkpoint.update({"checked_at": datetime.now(timezone.utc).isoformat(), "new_labels": new_labels})
+        if new_labels < min_new_labels:
+            print(f"   ⏭️  Fewer than {min_new_labels} new labels, not retraining")
+            state.save()
+            return False
+        if retrain:
+            train_model.train_model(use_snapshot=use_snapshot, model_format=model_format,
+                                    **retrain_settings(metadata))
+        else:
+            train_model.train_incremental(use_snapshot=use_snapshot, rounds=rounds, model_format=model_format)
+
+    checkpoint.update({"model": model_artifact.load_metadata().get("timestamp"), "new_labels": new_labels,
+                       "trained_at": datetime.now(timezone.utc).isoformat()})
+    state.save()
+    return True
+
+def run_pipeline(args) -> dict:
+    """Run the selected stages in dependency order; returns {stage: status}."""
+    state = PipelineState(args.state_path)
+    status = {}
+
+    def ready(stage: str) -> bool:
+        if stage not in args.stages:
+            return False
+        blocked = [d for d in DEPENDS_ON[stage] if status.get(d) in ("failed", "skipped")]
+        if blocked:
+            print(f"\n⏭️  Skipping {stage}: {', '.join(blocked)} did not finish")
+            status[stage] = "skipped"
+        return not blocked
+
+    embedder = None
+    if "embed" in args.stages:
+        embedder = Embedder(args.batch_size, args.embed_workers, args.rpm, args.tpm, not args.no_cache,
+                            args.storage, args.dimensions, not args.no_index)
+    try:
+        if ready("import"):
+            print(f"\n{'='*60}\n📥 Import\n{'='*60}")
+            stream = EmbeddingStream(embedder, args.page_size) if embedder else None
+            try:
+                with instrumentation.stage("import"):
+                    totals = run_import(args.files, state, args.user_id, args.chunk_size, args.import_workers,
+                                        stream, args.near_duplicates, args.similarity, args.near_duplicate_index)
+                status["import"] = "partial" if totals["errors"] else "ok"
+            except Exception as e:
+                print(f"❌ Import failed: {str(e)[:200]}")
+                status["import"] = "failed"
+            if stream is not None:
+                try:
+                    stream.close()
+                except Exception as e:
+                    print(f"❌ Embedding during the import failed: {str(e)[:200]}")
+                    status["embed"] = "failed"
+                print(f"   🔤 {stream.rows} imported captions embedded while importing")
+
+        if status.get("embed") != "failed" and ready("embed"):
+            print(f"\n{'='*60}\n🔤 Embed\n{'='*60}")
+            try:
+                with instrumentation.stage("embed"):
+                    run_embed(embedder, state, args.page_size)
+                status["embed"] = "ok" if embedder.clean else "partial"
+            except Exception as e:
+                print(f"❌ Embedding failed: {str(e)[:200]}")
+                status["embed"] = "failed"
+    finally:
+        if embedder is not None:
+            embedder.close()
+
+    if ready("train"):
+        print(f"\n{'='*60}\n🎯 Train\n{'='*60}")
+        try:
+            with instrumentation.stage("train"):
+                trained = run_train(state, args.min_new_labels, args.retrain, args.snapshot, args.rounds,
+                                    args.featurizer, args.model_format)
+            status["train"] = "ok" if trained else "up to date"
+        except (Exception, SystemExit) as e:
+            print(f"❌ Training failed: {str(e)[:200]}")
+            status["train"] = "failed"
+    return status
+
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Run the import -> embed -> train pipeline")
+    parser.add_argument("files", nargs="*", help="scraper exports (CSV/JSONL, optionally .gz) to import")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--state-path", default=PIPELINE_STATE_PATH)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE,
+                        help="captions per embedding page (streamed and catch-up)")
+    importing = parser.add_argument_group("import")
+    importing.add_argument("--chunk-size", type=int, default=import_scraped_data.DEFAULT_CHUNK_SIZE,
+                           help="records per import chunk")
+    importing.add_argument("--import-workers", type=int, default=import_scraped_data.DEFAULT_WORKERS)
+    near_duplicates.add_arguments(importing)
+    embedding = parser.add_argument_group("embed")
+    embedding.add_argument("--batch-size", type=int, default=generate_embeddings.DEFAULT_BATCH_SIZE,
+                           help="captions per embeddings request")
+    embedding.add_argument("--embed-workers", type=int, default=generate_embeddings.DEFAULT_WORKERS)
+    embedding.add_argument("--rpm", type=int, default=generate_embeddings.DEFAULT_RPM)
+    embedding.add_argument("--tpm", type=int, default=generate_embeddings.DEFAULT_TPM)
+    embedding.add_argument("--no-cache", action="store_true", help="skip the local embedding cache")
+    embedding.add_argument("--no-index", action="store_true",
+                           help="don't add new embeddings to the similar-post index")
+    embedding.add_argument("--storage", choices=STORAGE_FORMATS, default=DEFAULT_STORAGE)
+    embedding.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    training = parser.add_argument_group("train")
+    training.add_argument("--min-new-labels", type=int, default=train_model.MIN_INCREMENTAL_ROWS,
+                          help="newly labeled posts needed before retraining")
+    training.add_argument("--retrain", action="store_true",
+                          help="full retrain instead of continuing the latest model")
+    training.add_argument("--rounds", type=int, default=train_model.INCREMENTAL_ROUNDS,
+                          help="boosting rounds added when continuing the model")
+    training.add_argument("--snapshot", action="store_true", help="train from the local feature snapshot")
+    training.add_argument("--featurizer", choices=FEATURIZERS, default="openai",
+                          help="caption featurizer for a first model (later ones keep the model's)")
+    training.add_argument("--model-format", choices=model_artifact.MODEL_FORMATS,
+                          default=model_artifact.MODEL_FORMAT)
+    instrumentation.add_arguments(parser)
+    storage.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if "import" in args.stages and not args.files:
+        args.stages.remove("import")
+    return args
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  Engagement Model Pipeline                          ║")
+    print("╚══════════════════════════════════════════════════════╝")
+
+    storage.configure(args.backend, args.sqlite_path)
+    if "embed" in args.stages and not os.getenv("OPENAI_API_KEY"):
+        print("❌ OPENAI_API_KEY not found in environment variables (or leave out the embed stage)")
+        raise SystemExit(1)
+    with instrumentation.run("pipeline", vars(args), args.run_log, args.profile, args.profiler):
+        status = run_pipeline(args)
+
+    print(f"\n{'='*60}")
+    print("✅ Pipeline finished: " + ", ".join(f"{stage} {result}" for stage, result in status.items()))
+    print(f"{'='*60}")
+    if "failed" in status.values():
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Score posts with the trained engagement model.
+
+  python predict.py batch [--all]     fill predicted_score for unscored rows
+  python predict.py serve [--port N]  keep the model warm and answer HTTP
+                                      prediction requests from the dashboard
+
+Run train_model.py first.
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, cache_key
+from embedding_codec import BINARY_COLUMN, NATIVE_DIMENSIONS, has_embedding_filter, stored_columns
+from supabase_reader import DEFAULT_PAGE_SIZE, count_rows, iter_pages
+from supabase_writer import BulkWriter
+from feature_pipeline import FeatureTransformer
+from model_artifact import (METADATA_PATH, TRANSFORMER_PATH, latest_model_path, load_booster, load_metadata,
+                            load_segments)
+from segmented_training import route_predictions, segment_label, segment_labels
+import storage
+from storage import get_client, has_column
+
+load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_PORT = int(os.getenv("PREDICT_PORT", "8765"))
+SCORE_COLUMNS = (
+    "id, post_url, post_type, likes_count, comments_count, views_count, followers, "
+    "theme, tone, dominant_color, cta_present, paid, language, keyword, engagement_score"
+)
+CAPTION_SCORE_COLUMNS = "caption"  # models with a local caption featurizer
+# predicted_score is DECIMAL(5,2)
+MAX_SCORE = 999.99
+
+class EngagementPredictor:
+    """Trained booster plus the fitted feature transformer it was trained with.
+
+    Posts in a segment with its own model (train_model.py --segment-by) are
+    scored by that model, every other post by the global one.
+    """
+
+    def __init__(self, booster, metadata: dict, transformer: FeatureTransformer, version: str = None,
+                 segment_keys: tuple = (), segment_boosters: dict = None):
+        self.booster = booster
+        self.segment_keys = segment_keys
+        self.segment_boosters = segment_boosters or {}
+        self.metadata = metadata
+        self.transformer = transformer
+        self.version = version or metadata.get("timestamp", "unknown")
+        expected = metadata.get("n_features") or booster.num_features()
+        if expected and transformer.n_features != expected:
+            raise ValueError(f"Feature layout mismatch: transformer builds {transformer.n_features} "
+                             f"columns, model expects {expected}")
+
+    @property
+    def caption_source(self) -> str:
+        """Featurizer behind the caption block: "openai" or a local method."""
+        featurizer = self.transformer.featurizer
+        return featurizer.method if featurizer else "openai"
+
+    @classmethod
+    def load(cls, model_path: str = None, metadata_path: str = METADATA_PATH,
+             transformer_path: str = TRANSFORMER_PATH):
+        model_path = model_path or latest_model_path()
+        if not model_path or not os.path.exists(model_path):
+            print(f"❌ No trained model found at {model_path or os.path.dirname(METADATA_PATH)}")
+            print("   Run train_model.py first")
+            sys.exit(1)
+        booster, layout, version = load_booster(model_path)
+        metadata = load_metadata(metadata_path)
+        if layout is not None:
+            transformer = FeatureTransformer.from_dict(layout)
+        elif os.path.exists(transformer_path):
+            transformer = FeatureTransformer.load(transformer_path)
+        else:
+            # Models trained before the transformer was saved
+            transformer = FeatureTransformer.from_metadata(metadata)
+        segment_keys, segment_boosters = load_segments(booster)
+        return cls(booster, metadata, transformer, version, segment_keys, segment_boosters)
+
+    def predict(self, df: pd.DataFrame, embeddings=None) -> np.ndarray:
+        if len(df) == 0:
+            return np.zeros(0, dtype=np.float32)
+        X = self.transformer.transform(df, embeddings)
+        if not self.segment_boosters:
+            return self.booster.inplace_predict(X)
+        return route_predictions(X, segment_labels(df, self.segment_keys), self.booster, self.segment_boosters)
+
+    def predict_rows(self, rows: list, embeddings: list = None) -> np.ndarray:
+        """Score a few posts given as dicts, skipping pandas entirely."""
+        if not rows:
+            return np.zeros(0, dtype=np.float32)
+        embeddings = embeddings or [None] * len(rows)
+        X = np.stack([self.transformer.transform_one(row, emb) for row, emb in zip(rows, embeddings)])
+        if not self.segment_boosters:
+            return self.booster.inplace_predict(X)
+        labels = [segment_label(row, self.segment_keys) for row in rows]
+        return route_predictions(X, labels, self.booster, self.segment_boosters)
+
+def unscored_query(model_version: str = None, count: str = None, stored_embeddings: bool = True):
+    """Rows with no prediction (or one from another model).
+
+    stored_embeddings: only rows with an embedding, fetched with it; models
+    with a local caption featurizer need just the caption.
+    """
+    unscored = "has_prediction.is.null,has_prediction.is.false"
+    if model_version:
+        unscored += f",model_version.is.null,model_version.neq.{model_version}"
+    if not stored_embeddings:
+        return get_client().table("engagement_training_data") \
+            .select(f"{SCORE_COLUMNS}, {CAPTION_SCORE_COLUMNS}", count=count) \
+            .or_(unscored)
+    binary = has_column("engagement_training_data", BINARY_COLUMN)
+    has_embedding = f"or({has_embedding_filter(binary)})"
+    # Both conditions must hold; PostgREST takes one "or" filter, so nest them
+    return get_client().table("engagement_training_data") \
+        .select(f"{SCORE_COLUMNS}, {', '.join(stored_columns(binary))}", count=count) \
+        .or_(f"and({has_embedding},or({unscored}))")
+
+def prediction_patches(df: pd.DataFrame, scores: np.ndarray, version: str) -> list:
+    """Bulk-writer patches carrying predictions for one page."""
+    made_at = datetime.now(timezone.utc).isoformat()
+    scores = np.clip(np.round(scores.astype(np.float64), 2), -MAX_SCORE, MAX_SCORE)
+    if "engagement_score" in df.columns:
+        actual = pd.to_numeric(df["engagement_score"], errors="coerce").to_numpy(dtype=np.float64)
+    else:
+        actual = np.full(len(df), np.nan)
+    # Image/carousel targets are min-max normalized at training time, so their
+    # raw engagement_score is not on the predicted scale
+    if "post_type" in df.columns:
+        comparable = df["post_type"].isin(["reel", "video"]).to_numpy()
+    else:
+        comparable = np.zeros(len(df), dtype=bool)
+
+    patches = []
+    for i, post_id in enumerate(df["id"]):
+        patch = {
+            "id": post_id,
+            "predicted_score": float(scores[i]),
+            "has_prediction": True,
+            "prediction_made_at": made_at,
+            "model_version": version,
+        }
+        if comparable[i] and not np.isnan(actual[i]):
+            patch["prediction_accuracy"] = float(min(abs(scores[i] - actual[i]), MAX_SCORE))
+        patches.append(patch)
+    return patches
+
+def score_batch(rescore_all: bool = False, page_size: int = DEFAULT_PAGE_SIZE):
+    """Stream unscored rows, predict page by page and bulk-write predicted_score."""
+    predictor = EngagementPredictor.load()
+    version = predictor.version
+    model_version = version if rescore_all else None
+    stored_embeddings = predictor.transformer.uses_stored_embeddings
+
+    print(f"🧠 Loaded model {version} ({predictor.transformer.n_features} features, "
+          f"{predictor.caption_source} captions)")
+    if predictor.segment_boosters:
+        print(f"   🧩 {len(predictor.segment_boosters)} segment models by {'/'.join(predictor.segment_keys)}: "
+              f"{', '.join(sorted(predictor.segment_boosters))}")
+
+    total = count_rows(lambda: unscored_query(model_version, count="exact", stored_embeddings=stored_embeddings))
+    if total == 0:
+        print("✅ No posts need predictions!")
+        return
+
+    print(f"📊 Scoring {total} posts")
+
+    scored = 0
+    started = time.monotonic()
+    with BulkWriter(get_client(), mode="update") as writer:
+        for page in iter_pages(lambda: unscored_query(model_version, stored_embeddings=stored_embeddings),
+                               page_size):
+            df = pd.DataFrame(page)
+            scores = predictor.predict(df)
+            writer.add_many(prediction_patches(df, scores, version))
+            scored += len(df)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(f"   ✅ {scored}/{total} scored ({scored / elapsed:.0f} posts/s)")
+
+    print(f"\n{'='*60}")
+    print(f"✅ Scoring complete! Saved: {writer.written}, Failed: {writer.failed}, Total: {total}")
+    print(f"{'='*60}")
+
+class OnlineScorer:
+    """Keeps the model warm and scores single posts (or small lists) on demand.
+
+    Posts may carry caption_embedding / caption_embedding_bin; otherwise the
+    caption is embedded with OpenAI (through the local embedding cache) when
+    OPENAI_API_KEY is set. Models trained with a local caption featurizer
+    featurize the caption in-process and never call OpenAI.
+    """
+
+    def __init__(self, predictor: EngagementPredictor):
+        self.predictor = predictor
+        self.lock = threading.Lock()
+        self.cache = None
+        self.openai_client = None
+        if predictor.transformer.uses_stored_embeddings and os.getenv("OPENAI_API_KEY"):
+            from openai import OpenAI
+            self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            self.cache = EmbeddingCache()
+
+    def _embed(self, caption: str):
+        # Request the size the model's embeddings were stored at
+        dimensions = self.predictor.transformer.embedding_dim
+        request = {"model": EMBEDDING_MODEL, "input": caption[:8000]}
+        model_tag = EMBEDDING_MODEL
+        if dimensions != NATIVE_DIMENSIONS:
+            request["dimensions"] = dimensions
+            model_tag = f"{EMBEDDING_MODEL}@{dimensions}"
+        key = cache_key(caption, model_tag)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.openai_client.embeddings.create(**request)
+        embedding = response.data[0].embedding
+        self.cache.put_many({key: embedding}, model_tag)
+        return embedding
+
+    def score(self, posts: list) -> list:
+        embeddings = [None] * len(posts)
+        if self.openai_client:
+            for i, post in enumerate(posts):
+                has_embedding = post.get("caption_embedding") or post.get("caption_embedding_bin")
+                caption = post.get("caption")
+                if not has_embedding and isinstance(caption, str) and caption.strip():
+                    embeddings[i] = self._embed(caption)
+
+        with self.lock:
+            scores = self.predictor.predict_rows(posts, embeddings)
+        return [round(float(s), 2) for s in scores]
+
+def parse_request(body: bytes) -> list:
+    """Posts in a /predict body, {"post": {...}} or {"posts": [...]}.
+
+    Raises ValueError (or json.JSONDecodeError) for a malformed request.
+    """
+    request = json.loads(body or b"{}")
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    posts = request.get("posts") or ([request["post"]] if "post" in request else [])
+    if not isinstance(posts, list) or not posts:
+        raise ValueError("expected 'post' or 'posts'")
+    if not all(isinstance(post, dict) for post in posts):
+        raise ValueError("each post must be a JSON object")
+    return posts
+
+def make_handler(scorer: OnlineScorer):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "model_version": scorer.predictor.version})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                posts = parse_request(self.rfile.read(length))
+            except (ValueError, KeyError, TypeError) as e:
+                # Malformed JSON (json.JSONDecodeError is a ValueError) or request shape
+                self._send(400, {"error": str(e)[:200]})
+                return
+            try:
+                started = time.perf_counter()
+                predictions = scorer.score(posts)
+                self._send(200, {
+                    "predictions": predictions,
+                    "model_version": scorer.predictor.version,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                })
+            except Exception as e:
+                self._send(500, {"error": str(e)[:200]})
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+def serve(port: int = DEFAULT_PORT, host: str = "127.0.0.1"):
+    """Run the long-lived scoring server."""
+    predictor = EngagementPredictor.load()
+    scorer = OnlineScorer(predictor)
+    server = ThreadingHTTPServer((host, port), make_handler(scorer))
+
+    print(f"🧠 Model {predictor.version} loaded ({predictor.caption_source} captions)")
+    print(f"🚀 Serving predictions on http://{host}:{port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down")
+        server.server_close()
+
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Engagement model predictions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="score unscored rows in engagement_training_data")
+    batch.add_argument("--all", action="store_true",
+                       help="also rescore rows predicted by an older model")
+    batch.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    storage.add_arguments(batch)
+
+    server = sub.add_parser("serve", help="serve low-latency predictions over HTTP")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server.add_argument("--host", default="127.0.0.1")
+    return parser.parse_args(argv)
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
+
+    print("╔══════════════════════════════════════════════════════╗")
+    print("║  Engagement Prediction Scorer                       ║")
+    print("╚══════════════════════════════════════════════════════╝\n")
+
+    if args.command == "batch":
+        storage.configure(args.backend, args.sqlite_path)
+        score_batch(rescore_all=args.all, page_size=args.page_size)
+    else:
+        serve(port=args.port, host=args.host)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Per-segment specialist models next to the global engagement model.
+Labeled posts are partitioned by post_type and/or keyword, and one model per
+segment is trained concurrently in a process pool. Like the hyperparameter
+search, the workers memory-map one shared copy of the feature matrix
+instead of receiving it pickled per task; each one only reads its segment's
+rows.
+
+A segment gets its own model only if it has at least min_rows labeled
+posts and the specialist beats the global model on the segment's share of
+the global holdout split. Every other post (small, unseen or unlabeled
+segments) is scored by the global model. Targets stay on the global
+model's scale, so both kinds of prediction are comparable.
+"""
+
+import os
+import re
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+SEGMENT_KEYS = ("post_type", "keyword")
+DEFAULT_MIN_SEGMENT_ROWS = 200
+MIN_SEGMENT_TEST_ROWS = 10
+
+# Per-worker state, set by _init_worker
+_X = None
+_y = None
+_threads = 1
+
+def segment_label(row: dict, keys) -> str:
+    """Segment of one post, e.g. "reel" or "reel/gold"; None if a key is missing."""
+    parts = []
+    for key in keys:
+        value = row.get(key)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        parts.append(value.strip().lower())
+    return "/".join(parts)
+
+def segment_labels(df, keys) -> np.ndarray:
+    """segment_label for every row of a DataFrame (missing columns give None)."""
+    columns = [df[key].tolist() if key in df.columns else [None] * len(df) for key in keys]
+    return np.array([segment_label(dict(zip(keys, values)), keys) for values in zip(*columns)], dtype=object)
+
+def segment_slug(label: str) -> str:
+    """File-name-safe form of a segment label."""
+    return re.sub(r"[^a-z0-9]+", "-", label).strip("-") or "segment"
+
+def _init_worker(x_path: str, y_path: str, threads: int):
+    global _X, _y, _threads
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path, mmap_mode="r")
+    _threads = threads
+
+def _train_segment(label: str, train_rows: np.ndarray, test_rows: np.ndarray, params: dict, seed: int) -> dict:
+    """Fit one segment's model inside a worker; returns its raw UBJSON booster and holdout predictions."""
+    import xgboost as xgb
+
+    started = time.monotonic()
+    model = xgb.XGBRegressor(**params, random_state=seed, n_jobs=_threads)
+    model.fit(_X[train_rows], _y[train_rows])
+    return {
+        "label": label,
+        "booster": bytes(model.get_booster().save_raw("ubj")),
+        "train_predictions": model.predict(_X[train_rows]),
+        "test_predictions": model.predict(_X[test_rows]) if len(test_rows) else np.zeros(0),
+        "seconds": round(time.monotonic() - started, 2),
+    }
+
+def train_segments(X: np.ndarray, y: np.ndarray, labels: np.ndarray, train_rows: np.ndarray,
+                   test_rows: np.ndarray, params: dict, global_test_predictions: np.ndarray,
+                   min_rows: int = DEFAULT_MIN_SEGMENT_ROWS, workers: int = None, seed: int = 42) -> tuple:
+    """Train the eligible segments in parallel.
+
+    train_rows/test_rows: the global split (row positions into X), so every
+    specialist is judged on the same holdout as the global model, whose
+    predictions for test_rows are global_test_predictions.
+    Returns ({label: xgb.Booster} for the segments that beat the global
+    model, {label: metrics} for every segment seen).
+    """
+    import xgboost as xgb
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    test_position = {row: i for i, row in enumerate(test_rows)}
+    metrics, tasks = {}, {}
+    for label in sorted({label for label in labels if label is not None}):
+        segment_train = train_rows[labels[train_rows] == label]
+        segment_test = test_rows[labels[test_rows] == label]
+        metrics[label] = {"train_rows": int(len(segment_train)), "test_rows": int(len(segment_test))}
+        if len(segment_train) + len(segment_test) < min_rows:
+            metrics[label].update({"model": "global", "reason": f"fewer than {min_rows} posts"})
+        elif len(segment_test) < MIN_SEGMENT_TEST_ROWS:
+            metrics[label].update({"model": "global", "reason": f"fewer than {MIN_SEGMENT_TEST_ROWS} holdout posts"})
+        else:
+            tasks[label] = (segment_train, segment_test)
+
+    boosters = {}
+    if not tasks:
+        print(f"   🧩 No segment has {min_rows}+ labeled posts; the global model scores everything")
+        return boosters, metrics
+
+    workers = workers or min(os.cpu_count() or 1, len(tasks))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"🧩 Training {len(tasks)} segment models ({len(metrics) - len(tasks)} segments fall back "
+          f"to the global model), {workers} workers x {threads} threads")
+
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory() as tmp:
+        # One on-disk copy of the features, memory-mapped by every worker
+        x_path = os.path.join(tmp, "X.npy")
+        y_path = os.path.join(tmp, "y.npy")
+        np.save(x_path, np.ascontiguousarray(X, dtype=np.float32))
+        np.save(y_path, np.asarray(y, dtype=np.float64))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(x_path, y_path, threads)) as executor:
+            # Largest segments first, so the pool isn't left waiting on one at the end
+            order = sorted(tasks, key=lambda label: -len(tasks[label][0]))
+            futures = [executor.submit(_train_segment, label, *tasks[label], params, seed) for label in order]
+            for future in as_completed(futures):
+                result = future.result()
+                label = result["label"]
+                segment_train, segment_test = tasks[label]
+                global_mae = mean_absolute_error(
+                    y[segment_test], global_test_predictions[[test_position[row] for row in segment_test]])
+                test_mae = mean_absolute_error(y[segment_test], result["test_predictions"])
+                promote = test_mae < global_mae
+                metrics[label].update({
+                    "model": "segment" if promote else "global",
+                    "train_mae": float(mean_absolute_error(y[segment_train], result["train_predictions"])),
+                    "test_mae": float(test_mae),
+                    "test_r2": float(r2_score(y[segment_test], result["test_predictions"])),
+                    "global_test_mae": float(global_mae),
+                    "seconds": result["seconds"],
+                })
+                if promote:
+                    booster = xgb.Booster()
+                    booster.load_model(bytearray(result["booster"]))
+                    boosters[label] = booster
+                else:
+                    metrics[label]["reason"] = "no better than the global model"
+                print(f"   {'✅' if promote else '↩️ '} {label}: MAE {test_mae:.2f} vs global {global_mae:.2f} "
+                      f"({len(segment_train)} train / {len(segment_test)} test, {result['seconds']:.1f}s)")
+
+    print(f"   🧩 {len(boosters)} segment models kept ({time.monotonic() - started:.1f}s)")
+    return boosters, metrics
+
+def route_predictions(X: np.ndarray, labels, global_booster, boosters: dict) -> np.ndarray:
+    """Score rows with their segment's model, or the global model when there is none."""
+    predictions = global_booster.inplace_predict(X)
+    if not boosters:
+        return predictions
+    labels = np.asarray(labels, dtype=object)
+    for label, booster in boosters.items():
+        rows = np.nonzero(labels == label)[0]
+        if len(rows):
+            predictions[rows] = booster.inplace_predict(X[rows])
+    return predictions
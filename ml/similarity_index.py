@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Persistent approximate-nearest-neighbour index over caption embeddings, for
+"posts like this caption" lookups without scanning the table or decoding
+JSON embeddings per query.
+
+  python similarity_index.py build [--offline]        (re)build from the feature snapshot
+  python similarity_index.py update [--offline]       add rows embedded/changed since the last build/update
+  python similarity_index.py query --caption "..."    top-k similar posts (or --post-id ID)
+
+IVF (inverted file) layout: spherical k-means centroids partition the
+unit-normalized embeddings into lists; a query ranks the centroids and only
+scans the `nprobe` closest lists. Files under SIMILARITY_INDEX_DIR
+(default .cache/similarity_index):
+
+    vectors.f32    float32 (n, dim) rows, append-only, memory-mapped
+    centroids.npy  float32 (nlist, dim)
+    index.sqlite   per-row id, list, engagement_score, post_url, caption
+                   snippet and a deleted flag, plus build metadata
+
+Adds append to vectors.f32 and the row table, so generate_embeddings.py can
+feed new embeddings in as it writes them. A re-embedded post gets a new row
+and its old one is marked deleted; `build` compacts. Centroids are not
+re-trained on add, so rebuild after the data has grown several-fold. One
+writer at a time.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+from embedding_codec import EMBEDDING_DIMENSIONS
+import storage
+from storage import get_client
+
+load_dotenv()
+
+DEFAULT_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", ".cache/similarity_index")
+DEFAULT_NPROBE = 16
+DEFAULT_TOP_K = 10
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # training rows per centroid
+MAX_LISTS = 4096
+CHUNK_ROWS = 8192
+CAPTION_SNIPPET_CHARS = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    list INTEGER NOT NULL,
+    engagement_score REAL,
+    post_url TEXT,
+    caption TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_rows_id ON rows(id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+def default_nlist(n: int) -> int:
+    """About 4 * sqrt(n) lists, the usual IVF rule of thumb."""
+    return int(min(MAX_LISTS, n, max(1, 4 * np.sqrt(max(n, 1))))) or 1
+
+def _unit_rows(matrix) -> np.ndarray:
+    """float32 copy with unit-norm rows; all-zero rows stay zero."""
+    matrix = np.array(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def train_centroids(embeddings, nlist: int, seed: int = 42,
+                    iterations: int = KMEANS_ITERATIONS) -> np.ndarray:
+    """Spherical k-means on a row sample; returns (nlist, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    n = embeddings.shape[0]
+    sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+    # Sorted positions read a memory-mapped matrix sequentially
+    sample = _unit_rows(embeddings[np.sort(rng.choice(n, sample_size, replace=False))])
+    sample = sample[np.any(sample != 0, axis=1)]
+    if len(sample) < nlist:
+        raise ValueError(f"Need at least {nlist} embeddings to train {nlist} lists, got {len(sample)}")
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        # Reseed empty lists from random sample rows
+        empty = np.nonzero(counts == 0)[0]
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = _unit_rows(sums)
+    return centroids
+
+def assign_lists(embeddings, centroids: np.ndarray) -> np.ndarray:
+    """Closest centroid (by dot product) for each row, in chunks."""
+    assign = np.empty(embeddings.shape[0], dtype=np.int64)
+    for start in range(0, embeddings.shape[0], CHUNK_ROWS):
+        chunk = np.asarray(embeddings[start:start + CHUNK_ROWS], dtype=np.float32)
+        assign[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assign
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first."""
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+class SimilarityIndex:
+    """IVF index: centroids, posting lists in memory, vectors memory-mapped."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_DIR):
+        self.path = path
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.centroids_path = os.path.join(path, "centroids.npy")
+        self.db_path = os.path.join(path, "index.sqlite")
+        if not self.exists():
+            raise FileNotFoundError(f"No similarity index at {path}; run `similarity_index.py build` first")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.meta = {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM meta")}
+        self.dim = self.meta["dim"]
+        self.centroids = np.load(self.centroids_path)
+        self.n_rows = self.conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM rows").fetchone()[0]
+        # Drop vectors appended by an add that never committed its rows
+        row_bytes = self.dim * 4
+        if os.path.getsize(self.vectors_path) > self.n_rows * row_bytes:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(self.n_rows * row_bytes)
+        self._map_vectors()
+        self._load_lists()
+
+    @classmethod
+    def exists_at(cls, path: str = DEFAULT_INDEX_DIR) -> bool:
+        return all(os.path.exists(os.path.join(path, name))
+                   for name in ("vectors.f32", "centroids.npy", "index.sqlite"))
+
+    def exists(self) -> bool:
+        return self.exists_at(self.path)
+
+    def _map_vectors(self):
+        self.vectors = (np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.n_rows, self.dim))
+                        if self.n_rows else np.zeros((0, self.dim), dtype=np.float32))
+
+    def _load_lists(self):
+        pairs = np.array(self.conn.execute(
+            "SELECT list, position FROM rows WHERE deleted = 0 ORDER BY list, position").fetchall(),
+            dtype=np.int64).reshape(-1, 2)
+        lists, positions = pairs[:, 0], pairs[:, 1]
+        bounds = np.searchsorted(lists, np.arange(len(self.centroids) + 1))
+        self.lists = [positions[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def n_live(self) -> int:
+        return sum(len(l) for l in self.lists)
+
+    @classmethod
+    def build(cls, ids, embeddings, rows: list = None, path: str = DEFAULT_INDEX_DIR,
+              nlist: int = None, seed: int = 42):
+        """Write a fresh index over embeddings ((n, dim), may be memory-mapped).
+
+        rows: per-embedding dicts with engagement_score, post_url and caption.
+        Rows whose embedding is all zero are skipped.
+        """
+        n, dim = embeddings.shape
+        nlist = nlist or default_nlist(n)
+        centroids = train_centroids(embeddings, nlist, seed)
+
+        os.makedirs(path, exist_ok=True)
+        for name in ("vectors.f32", "centroids.npy", "index.sqlite", "index.sqlite-wal", "index.sqlite-shm"):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        open(os.path.join(path, "vectors.f32"), "wb").close()
+        conn = sqlite3.connect(os.path.join(path, "index.sqlite"))
+        conn.executescript(SCHEMA)
+        meta = {"dim": dim, "nlist": nlist, "seed": seed, "built_at": datetime.now(timezone.utc).isoformat(),
+                "built_rows": n, "watermark": None}
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                         [(key, json.dumps(value)) for key, value in meta.items()])
+        conn.commit()
+        conn.close()
+
+        index = cls(path)
+        for start in range(0, n, CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, n)
+            index.add(ids[start:stop], embeddings[start:stop], rows[start:stop] if rows is not None else None,
+                      replace=False)
+        return index
+
+    def add(self, ids, embeddings, rows: list = None, replace: bool = True) -> int:
+        """Append embeddings; returns rows added.
+
+        replace: an id already in the index has its old row marked deleted
+        (a re-embedded post); only its score/url/caption are updated when
+        the embedding is unchanged.
+        """
+        ids = [str(i) for i in ids]
+        vectors = _unit_rows(embeddings)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Index holds {self.dim}-dim embeddings, got {vectors.shape[1]}")
+        rows = rows if rows is not None else [{}] * len(ids)
+        present = np.any(vectors != 0, axis=1)
+
+        keep = present.copy()
+        if replace:
+            existing = self._positions(ids)
+            for i, post_id in enumerate(ids):
+                old = existing.get(post_id)
+                if old is None or not present[i]:
+                    continue
+                if np.allclose(self.vectors[old], vectors[i], atol=1e-6):
+                    # Same embedding: refresh the row's details in place
+                    self.conn.execute("UPDATE rows SET engagement_score = ?, post_url = ?, caption = ? "
+                                      "WHERE position = ?", (*self._details(rows[i]), old))
+                    keep[i] = False
+                    continue
+                self.conn.execute("UPDATE rows SET deleted = 1 WHERE position = ?", (old,))
+                lst = self._list_of(old)
+                self.lists[lst] = self.lists[lst][self.lists[lst] != old]
+
+        vectors = vectors[keep]
+        kept = np.nonzero(keep)[0]
+        if len(kept) == 0:
+            self.conn.commit()
+            return 0
+        assign = assign_lists(vectors, self.centroids)
+        positions = np.arange(self.n_rows, self.n_rows + len(kept), dtype=np.int64)
+
+        # Vectors first: an add interrupted before the commit is truncated on open
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+        self.conn.executemany(
+            "INSERT INTO rows (position, id, list, engagement_score, post_url, caption) VALUES (?, ?, ?, ?, ?, ?)",
+            [(int(p), ids[i], int(l), *self._details(rows[i])) for p, i, l in zip(positions, kept, assign)],
+        )
+        self.conn.commit()
+
+        self.n_rows += len(kept)
+        self._map_vectors()
+        for lst in np.unique(assign):
+            self.lists[lst] = np.concatenate([self.lists[lst], positions[assign == lst]])
+        return len(kept)
+
+    @staticmethod
+    def _details(row: dict) -> tuple:
+        score = row.get("engagement_score")
+        score = None if score is None or (isinstance(score, float) and np.isnan(score)) else float(score)
+        caption = row.get("caption")
+        return score, row.get("post_url"), caption[:CAPTION_SNIPPET_CHARS] if isinstance(caption, str) else None
+
+    def _positions(self, ids: list) -> dict:
+        """id -> live position for ids already in the index."""
+        found = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            found.update(self.conn.execute(
+                f"SELECT id, position FROM rows WHERE deleted = 0 AND id IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+        return found
+
+    def _list_of(self, position: int) -> int:
+        return self.conn.execute("SELECT list FROM rows WHERE position = ?", (position,)).fetchone()[0]
+
+    def vector(self, post_id) -> np.ndarray:
+        """Stored (unit) embedding of a post, or None."""
+        position = self._positions([str(post_id)]).get(str(post_id))
+        return None if position is None else np.array(self.vectors[position])
+
+    def search_positions(self, embedding, k: int = DEFAULT_TOP_K, nprobe: int = DEFAULT_NPROBE):
+        """(positions, cosine similarities) of the approximate top k, best first."""
+        query = _unit_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        probe = _top(self.centroids @ query, min(nprobe, self.nlist))
+        candidates = np.concatenate([self.lists[lst] for lst in probe])
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+        # Sorted positions keep the memory-mapped reads in file order
+        candidates.sort()
+        scores = self.vectors[candidates] @ query
+        top = _top(scores, k)
+        return candidates[top], scores[top]
+
+    def search(self, embedding, k: int = DEFAULT_TOP_K, nprobe: int = DEFAULT_NPROBE,
+               by_engagement: bool = False, candidates: int = None, exclude_id=None) -> list:
+        """Top-k similar posts as dicts with similarity and engagement_score.
+
+        by_engagement: take the `candidates` (default 5k) most similar posts
+        and return the k with the highest engagement_score among them.
+        """
+        wanted = (candidates or 5 * k) if by_engagement else k
+        positions, scores = self.search_positions(embedding, wanted + (1 if exclude_id is not None else 0), nprobe)
+        if len(positions) == 0:
+            return []
+        details = {row[0]: row[1:] for row in self.conn.execute(
+            f"SELECT position, id, engagement_score, post_url, caption FROM rows "
+            f"WHERE position IN ({','.join('?' * len(positions))})", [int(p) for p in positions])}
+        results = []
+        for position, similarity in zip(positions, scores):
+            post_id, engagement, post_url, caption = details[int(position)]
+            if exclude_id is not None and post_id == str(exclude_id):
+                continue
+            results.append({"id": post_id, "similarity": round(float(similarity), 4),
+                            "engagement_score": engagement, "post_url": post_url, "caption": caption})
+        if by_engagement:
+            results.sort(key=lambda r: -np.inf if r["engagement_score"] is None else r["engagement_score"],
+                         reverse=True)
+        return results[:k]
+
+    def set_meta(self, key: str, value):
+        self.meta[key] = value
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def open_index(path: str = DEFAULT_INDEX_DIR):
+    """The index at path, or None when none has been built."""
+    return SimilarityIndex(path) if SimilarityIndex.exists_at(path) else None
+
+def snapshot_rows(offline: bool = False):
+    """Rows with an embedding from the synced feature snapshot, and their embeddings.
+
+    The embeddings are a RowSubset of the memory-mapped matrix, read in chunks.
+    """
+    from feature_store import FeatureSnapshot, RowSubset
+
+    snapshot = FeatureSnapshot(dim=EMBEDDING_DIMENSIONS)
+    if not offline:
+        fetched = snapshot.sync(get_client())
+        print(f"   🔄 Snapshot sync: {fetched} changed rows")
+    elif not snapshot.exists():
+        print(f"❌ No feature snapshot at {snapshot.path}; run once without --offline")
+        sys.exit(1)
+    rows, embeddings = snapshot.load()
+    mask = rows["has_embedding"].astype(bool).to_numpy()
+    return rows[mask].reset_index(drop=True), RowSubset(embeddings, np.nonzero(mask)[0])
+
+def _row_details(rows) -> list:
+    columns = [c for c in ("engagement_score", "post_url", "caption") if c in rows.columns]
+    return rows[columns].to_dict("records")
+
+def _latest_update(rows):
+    if "updated_at" not in rows.columns or rows["updated_at"].isna().all():
+        return None
+    return str(rows["updated_at"].dropna().max())
+
+def build_index(path: str = DEFAULT_INDEX_DIR, offline: bool = False, nlist: int = None):
+    print("🔍 Loading embedded posts from the feature snapshot...")
+    rows, embeddings = snapshot_rows(offline)
+    if len(rows) == 0:
+        print("❌ No posts with embeddings found! Run generate_embeddings.py first")
+        sys.exit(1)
+    started = time.perf_counter()
+    nlist = nlist or default_nlist(len(rows))
+    print(f"🧭 Building IVF index: {len(rows)} posts, {nlist} lists...")
+    index = SimilarityIndex.build(rows["id"].tolist(), embeddings, _row_details(rows), path, nlist)
+    index.set_meta("watermark", _latest_update(rows))
+    sizes = np.array([len(l) for l in index.lists])
+    print(f"\n{'='*60}")
+    print(f"✅ Indexed {index.n_live} posts in {time.perf_counter() - started:.1f}s -> {path}")
+    print(f"   📊 List sizes: median {np.median(sizes):.0f}, max {sizes.max()}")
+    print(f"{'='*60}")
+    index.close()
+
+def update_index(path: str = DEFAULT_INDEX_DIR, offline: bool = False):
+    from feature_store import RowSubset
+
+    index = open_index(path)
+    if index is None:
+        print(f"⚠️  No index at {path}, building one")
+        return build_index(path, offline)
+    print("🔍 Loading embedded posts from the feature snapshot...")
+    rows, embeddings = snapshot_rows(offline)
+    watermark = index.meta.get("watermark")
+    changed = np.ones(len(rows), dtype=bool)
+    if watermark and "updated_at" in rows.columns:
+        changed = (rows["updated_at"].astype(str) >= watermark).to_numpy()
+    rows = rows[changed].reset_index(drop=True)
+    embeddings = RowSubset(embeddings.base, embeddings.index[changed])
+    added = 0
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows.iloc[start:start + CHUNK_ROWS]
+        added += index.add(chunk["id"].tolist(), embeddings[start:start + CHUNK_ROWS], _row_details(chunk))
+    if len(rows):
+        latest = _latest_update(rows)
+        index.set_meta("watermark", max(latest, watermark) if watermark and latest else latest or watermark)
+    print(f"✅ {len(rows)} changed posts, {added} new vectors; index holds {index.n_live} posts")
+    index.close()
+
+def embed_caption(caption: str, dim: int) -> np.ndarray:
+    """Caption embedding from the local cache or OpenAI, at the index's size."""
+    from embedding_cache import EmbeddingCache, cache_key
+    import generate_embeddings
+    model_tag = generate_embeddings.embedding_model_tag(dim)
+    cache = EmbeddingCache()
+    key = cache_key(caption, model_tag)
+    embedding = cache.get(key)
+    if embedding is None:
+        response = generate_embeddings.get_openai().embeddings.create(
+            **generate_embeddings.embedding_request(caption[:generate_embeddings.MAX_INPUT_CHARS], dim))
+        embedding = response.data[0].embedding
+        cache.put_many({key: embedding}, model_tag)
+    cache.close()
+    return np.asarray(embedding, dtype=np.float32)
+
+def query_index(path: str, caption: str = None, post_id: str = None, k: int = DEFAULT_TOP_K,
+                nprobe: int = DEFAULT_NPROBE, by_engagement: bool = False):
+    index = open_index(path)
+    if index is None:
+        print(f"❌ No similarity index at {path}; run `similarity_index.py build` first")
+        sys.exit(1)
+    if post_id is not None:
+        embedding = index.vector(post_id)
+        if embedding is None:
+            print(f"❌ Post {post_id} is not in the index")
+            sys.exit(1)
+    else:
+        embedding = embed_caption(caption, index.dim)
+    started = time.perf_counter()
+    results = index.search(embedding, k, nprobe, by_engagement=by_engagement, exclude_id=post_id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"🔎 {len(results)} similar posts in {elapsed_ms:.1f} ms (nprobe={nprobe}, {index.n_live} indexed)")
+    for r in results:
+        score = "-" if r["engagement_score"] is None else f"{r['engagement_score']:.1f}"
+        snippet = (r["caption"] or "").replace("\n", " ")[:70]
+        print(f"   {r['similarity']:.3f}  score {score:>6}  {r['post_url'] or r['id']}  {snippet}")
+    index.close()
+    return results
+
+def parse_args(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Similar-post lookup over caption embeddings")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="(re)build the index from the feature snapshot")
+    build.add_argument("--nlist", type=int, default=None, help="IVF lists (default: ~4*sqrt(rows))")
+    update = sub.add_parser("update", help="add posts embedded or changed since the last build/update")
+    for command in (build, update):
+        command.add_argument("--offline", action="store_true", help="use the snapshot without syncing it")
+        storage.add_arguments(command)
+    query = sub.add_parser("query", help="top-k posts similar to a caption or an indexed post")
+    target = query.add_mutually_exclusive_group(required=True)
+    target.add_argument("--caption", help="caption text (embedded via the cache or OpenAI)")
+    target.add_argument("--post-id", help="use an indexed post's embedding")
+    query.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    query.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="lists scanned per query")
+    query.add_argument("--by-engagement", action="store_true",
+                       help="highest engagement_score among the 5k most similar posts")
+    return parser.parse_args(argv)
+
+def main(argv: list = None, prog: str = None):
+    args = parse_args(argv, prog)
+    if args.command == "query":
+        query_index(args.index_dir, args.caption, args.post_id, args.k, args.nprobe, args.by_engagement)
+    else:
+        storage.configure(args.backend, args.sqlite_path)
+        if args.command == "build":
+            build_index(args.index_dir, args.offline, args.nlist)
+        else:
+            update_index(args.index_dir, args.offline)
+
+if __name__ == "__main__":
+    main()
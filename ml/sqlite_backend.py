@@ -0,0 +1,468 @@
+"""
+Local SQLite stand-in for the Supabase engagement_training_data table.
+SQLiteClient answers the subset of the supabase-py query builder the ml
+scripts use, so they run unchanged against a local file:
+
+    fetch page     table(t).select(cols, count=).eq/gt/gte/is_/in_/or_(...).order(key).limit(n)
+    bulk insert    table(t).insert(rows)           (fails on duplicate post_url, like PostgREST)
+    bulk upsert    table(t).upsert(rows, on_conflict="id")
+    update by id   rpc("bulk_update_engagement_training", {"rows": patches})
+                   or table(t).update(values).eq("id", id)
+
+The schema mirrors create_engagement_training_table.sql and the later
+migrations, including the triggers: engagement_score is recomputed from the
+metrics, updated_at moves on every update and labeled_at is stamped when a
+post's labels change. The score trigger calls calculate_engagement_score,
+which only SQLiteClient registers: change metrics through it, not through
+another SQLite tool.
+"""
+
+import json
+import math
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+TABLE = "engagement_training_data"
+UPDATE_RPC = "bulk_update_engagement_training"
+
+# column -> SQLite type; BOOLEAN columns come back as Python bools
+COLUMNS = {
+    "id": "TEXT PRIMARY KEY",
+    "post_url": "TEXT NOT NULL UNIQUE",
+    "keyword": "TEXT",
+    "post_type": "TEXT NOT NULL CHECK (post_type IN ('reel', 'video', 'image', 'carousel'))",
+    "likes_count": "INTEGER DEFAULT 0",
+    "comments_count": "INTEGER DEFAULT 0",
+    "views_count": "INTEGER DEFAULT 0",
+    "followers": "INTEGER",
+    "paid": "BOOLEAN DEFAULT 0",
+    "engagement_score": "REAL",
+    "predicted_score": "REAL",
+    "theme": "TEXT",
+    "tone": "TEXT",
+    "format": "TEXT",
+    "cta_present": "BOOLEAN DEFAULT 0",
+    "dominant_color": "TEXT",
+    "music_type": "TEXT",
+    "language": "TEXT DEFAULT 'English'",
+    "caption": "TEXT",
+    "user_id": "TEXT",
+    "caption_embedding": "TEXT",
+    "caption_embedding_bin": "TEXT",
+    "is_labeled": "BOOLEAN DEFAULT 0",
+    "labeled_at": "TEXT",
+    "labeled_by": "TEXT",
+    "has_prediction": "BOOLEAN DEFAULT 0",
+    "prediction_made_at": "TEXT",
+    "model_version": "TEXT",
+    "prediction_accuracy": "REAL",
+    "posted_at": "TEXT",
+    "near_duplicate_of": "TEXT",
+    "created_at": "TEXT",
+    "updated_at": "TEXT",
+}
+BOOLEAN_COLUMNS = {name for name, kind in COLUMNS.items() if kind.startswith("BOOLEAN")}
+# Columns bulk_update_engagement_training may change (see bulk_update_engagement_training.sql)
+UPDATABLE_COLUMNS = ("caption_embedding", "caption_embedding_bin", "predicted_score", "has_prediction",
+                     "prediction_made_at", "model_version", "prediction_accuracy")
+METRIC_COLUMNS = ("likes_count", "comments_count", "views_count", "post_type")
+LABEL_COLUMNS = ("theme", "tone", "dominant_color", "engagement_score")
+READ_BACK_CHUNK = 500  # keys per SELECT reading inserted rows back; under SQLite's 999-variable limit
+
+NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"  # same format as now_utc()
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+  {(',' + chr(10) + '  ').join(f'{name} {kind}' for name, kind in COLUMNS.items())}
+);
+CREATE INDEX IF NOT EXISTS idx_engagement_training_labeled ON {TABLE}(is_labeled);
+CREATE INDEX IF NOT EXISTS idx_engagement_training_updated_at ON {TABLE}(updated_at);
+CREATE INDEX IF NOT EXISTS idx_engagement_training_labeled_at ON {TABLE}(labeled_at);
+
+CREATE TRIGGER IF NOT EXISTS trg_engagement_training_insert AFTER INSERT ON {TABLE}
+BEGIN
+  UPDATE {TABLE} SET
+    engagement_score = calculate_engagement_score(NEW.likes_count, NEW.comments_count, NEW.views_count,
+                                                  NEW.post_type, NEW.followers, NEW.paid),
+    labeled_at = CASE WHEN NEW.is_labeled = 1 THEN {NOW} ELSE NEW.labeled_at END
+  WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trigger_update_engagement_score
+AFTER UPDATE OF {', '.join(METRIC_COLUMNS)} ON {TABLE}
+BEGIN
+  UPDATE {TABLE} SET
+    engagement_score = calculate_engagement_score(NEW.likes_count, NEW.comments_count, NEW.views_count,
+                                                  NEW.post_type, NEW.followers, NEW.paid)
+  WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_engagement_training_labeled_at AFTER UPDATE ON {TABLE}
+WHEN NEW.is_labeled = 1 AND (OLD.is_labeled IS NOT 1
+  OR {' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in LABEL_COLUMNS)})
+BEGIN
+  UPDATE {TABLE} SET labeled_at = {NOW} WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_engagement_training_updated_at AFTER UPDATE ON {TABLE}
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+  UPDATE {TABLE} SET updated_at = {NOW} WHERE rowid = NEW.rowid;
+END;
+"""
+
+class SQLiteAPIError(Exception):
+    """Raised where PostgREST would answer with an error."""
+
+def now_utc() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+def calculate_engagement_score(likes, comments, views, post_type, followers, paid):
+    """Port of calculate_engagement_score() from create_engagement_training_table.sql."""
+    likes = likes or 0
+    comments = comments or 0
+    views = views or None
+    followers = followers or None
+    wc, k, t = 3, 500, 50
+    wb = 0.05 if paid else 0.15
+    mb = 0.90 if paid else 1.00
+
+    if post_type in ("reel", "video") and views is not None:
+        ner = 100 * math.log(1 + k * (likes + wc * comments) / views) / math.log(1 + t)
+        ner = max(0.0, min(100.0, ner))
+        ve = 0.0
+        if followers is not None:
+            ve = max(0.0, min(100.0, 100 * math.log(1 + views / followers) / math.log(1 + 50)))
+        return round(mb * (0.9 * ner + wb * ve), 2)
+
+    nerf = 0.0
+    if followers is not None:
+        nerf = 100 * math.log(1 + k * (likes + wc * comments) / followers) / math.log(1 + t)
+        nerf = max(0.0, min(100.0, nerf))
+    vfl = max(0.0, min(100.0, 100 * math.log10(likes + 1) / math.log10(100000)))
+    return round(mb * (0.9 * nerf + 0.1 * vfl), 2)
+
+def _column(name: str) -> str:
+    if name not in COLUMNS:
+        raise SQLiteAPIError(f"column {TABLE}.{name} does not exist")
+    return name
+
+def _value(value):
+    """Python value -> SQLite parameter."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+def _literal(text: str):
+    """PostgREST filter literal (from an or_ expression) -> SQLite parameter."""
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1]
+    return {"true": 1, "false": 0}.get(text, text)
+
+def _split_top_level(expr: str) -> list:
+    """Split on commas that are not inside parentheses."""
+    parts, depth, current = [], 0, []
+    for char in expr:
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        depth += (char == "(") - (char == ")")
+        current.append(char)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+def _condition(column: str, operator: str, value, negate: bool = False) -> tuple:
+    """(sql, params) for one filter."""
+    column = _column(column)
+    if operator == "is":
+        target = {"null": "NULL", "true": "1", "false": "0"}.get(str(value).lower())
+        if target is None:
+            raise SQLiteAPIError(f"unsupported is value: {value}")
+        sql, params = f"{column} IS {target}", []
+    elif operator == "in":
+        values = list(value)
+        if not values:
+            sql, params = "0", []
+        else:
+            sql, params = f"{column} IN ({', '.join('?' * len(values))})", [_value(v) for v in values]
+    elif operator in _OPERATORS:
+        sql, params = f"{column} {_OPERATORS[operator]} ?", [_value(value)]
+    else:
+        raise SQLiteAPIError(f"unsupported filter operator: {operator}")
+    return (f"NOT ({sql})", params) if negate else (sql, params)
+
+def parse_logic(expr: str, joiner: str = "OR") -> tuple:
+    """PostgREST logic tree, e.g. 'a.is.null,and(b.gt.1,c.not.is.null)' -> (sql, params)."""
+    clauses, params = [], []
+    for term in _split_top_level(expr):
+        if term.startswith(("and(", "or(")) and term.endswith(")"):
+            name, body = term.split("(", 1)
+            sql, term_params = parse_logic(body[:-1], name.upper())
+        else:
+            column, rest = term.split(".", 1)
+            negate = rest.startswith("not.")
+            if negate:
+                rest = rest[4:]
+            operator, value = rest.split(".", 1)
+            if operator == "in":
+                value = [_literal(v.strip().strip('"')) for v in value.strip("()").split(",")]
+            elif operator != "is":
+                value = _literal(value)
+            sql, term_params = _condition(column, operator, value, negate)
+        clauses.append(f"({sql})")
+        params.extend(term_params)
+    return f" {joiner} ".join(clauses), params
+
+class APIResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class _Negated:
+    """query.not_.<filter>(...) negates the next filter."""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def negated(*args, **kwargs):
+            self._query._negate_next = True
+            return method(*args, **kwargs)
+        return negated
+
+class Query:
+    """Filter/order/limit builder shared by select, update and delete."""
+
+    def __init__(self, client, action: str, columns: str = "*", count: str = None, values: dict = None):
+        self.client = client
+        self.action = action
+        self.columns = columns
+        self.count = count
+        self.values = values
+        self.where, self.params = [], []
+        self._order, self._limit = None, None
+        self._negate_next = False
+
+    def _filter(self, column, operator, value):
+        sql, params = _condition(column, operator, value, self._negate_next)
+        self._negate_next = False
+        self.where.append(sql)
+        self.params.extend(params)
+        return self
+
+    def eq(self, column, value): return self._filter(column, "eq", value)
+    def neq(self, column, value): return self._filter(column, "neq", value)
+    def gt(self, column, value): return self._filter(column, "gt", value)
+    def gte(self, column, value): return self._filter(column, "gte", value)
+    def lt(self, column, value): return self._filter(column, "lt", value)
+    def lte(self, column, value): return self._filter(column, "lte", value)
+    def is_(self, column, value): return self._filter(column, "is", value)
+    def in_(self, column, values): return self._filter(column, "in", values)
+
+    @property
+    def not_(self):
+        return _Negated(self)
+
+    def or_(self, expr: str):
+        sql, params = parse_logic(expr, "OR")
+        if self._negate_next:
+            sql, self._negate_next = f"NOT ({sql})", False
+        self.where.append(sql)
+        self.params.extend(params)
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        # Chained calls add sort keys, as in postgrest-py
+        term = f"{_column(column)} {'DESC' if desc else 'ASC'}"
+        self._order = f"{self._order}, {term}" if self._order else term
+        return self
+
+    def limit(self, n: int):
+        self._limit = int(n)
+        return self
+
+    def _where_sql(self) -> str:
+        return f" WHERE {' AND '.join(f'({w})' for w in self.where)}" if self.where else ""
+
+    def execute(self) -> APIResponse:
+        if self.action == "select":
+            return self.client._select(self)
+        if self.action == "update":
+            return self.client._update(self)
+        return self.client._delete(self)
+
+class _Write:
+    def __init__(self, run):
+        self._run = run
+
+    def execute(self) -> APIResponse:
+        return self._run()
+
+class Table:
+    def __init__(self, client, name: str):
+        if name != TABLE:
+            raise SQLiteAPIError(f"relation {name} does not exist in the local database")
+        self.client = client
+
+    def select(self, columns: str = "*", count: str = None) -> Query:
+        return Query(self.client, "select", columns, count)
+
+    def insert(self, rows) -> _Write:
+        return _Write(lambda: self.client._insert(rows))
+
+    def upsert(self, rows, on_conflict: str = "id") -> _Write:
+        return _Write(lambda: self.client._insert(rows, on_conflict))
+
+    def update(self, values: dict) -> Query:
+        return Query(self.client, "update", values=values)
+
+    def delete(self) -> Query:
+        return Query(self.client, "delete")
+
+class SQLiteClient:
+    """supabase-py shaped client over a local SQLite file (thread-safe)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.create_function("calculate_engagement_score", 6, calculate_engagement_score,
+                                   deterministic=True)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Files created before a column was added get it now, like the SQL migrations
+        existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({TABLE})")}
+        for name, kind in COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {name} {kind}")
+
+    def table(self, name: str) -> Table:
+        return Table(self, name)
+
+    def rpc(self, name: str, params: dict) -> _Write:
+        if name != UPDATE_RPC:
+            raise SQLiteAPIError(f"function {name} does not exist in the local database")
+        return _Write(lambda: self._bulk_update(params.get("rows") or []))
+
+    def close(self):
+        self._conn.close()
+
+    def _row(self, row: sqlite3.Row) -> dict:
+        return {key: (bool(row[key]) if key in BOOLEAN_COLUMNS and row[key] is not None else row[key])
+                for key in row.keys()}
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                raise SQLiteAPIError(str(e)) from e
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _select(self, query: Query) -> APIResponse:
+        columns = "*" if query.columns.strip() == "*" else \
+            ", ".join(_column(c.strip()) for c in query.columns.split(","))
+        sql = f"SELECT {columns} FROM {TABLE}{query._where_sql()}"
+        if query._order:
+            sql += f" ORDER BY {query._order}"
+        if query._limit is not None:
+            sql += f" LIMIT {query._limit}"
+        with self._lock:
+            try:
+                rows = [self._row(r) for r in self._conn.execute(sql, query.params)]
+                count = None
+                if query.count:
+                    count = self._conn.execute(f"SELECT COUNT(*) FROM {TABLE}{query._where_sql()}",
+                                               query.params).fetchone()[0]
+            except sqlite3.Error as e:
+                raise SQLiteAPIError(str(e)) from e
+        return APIResponse(rows, count)
+
+    def _insert(self, rows, on_conflict: str = None) -> APIResponse:
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        if not rows:
+            return APIResponse([])
+        stamp = now_utc()
+        prepared = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", stamp)
+            row.setdefault("updated_at", stamp)
+            prepared.append(row)
+
+        groups = {}
+        for row in prepared:
+            groups.setdefault(tuple(row), []).append(row)
+
+        def work(conn):
+            for keys, group in groups.items():
+                columns = [_column(k) for k in keys]
+                sql = f"INSERT INTO {TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                if on_conflict:
+                    target = _column(on_conflict)
+                    updates = [c for c in columns if c not in (target, "created_at")]
+                    sql += f" ON CONFLICT({target}) DO " + (
+                        "UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in updates) if updates else "NOTHING")
+                conn.executemany(sql, [[_value(row[k]) for k in keys] for row in group])
+            # Read the rows back, as PostgREST returns them: with trigger-computed
+            # columns (engagement_score, labeled_at) and column defaults filled in
+            key = _column(on_conflict or "id")
+            values = list(dict.fromkeys(row[key] for row in prepared))
+            stored = {}
+            for start in range(0, len(values), READ_BACK_CHUNK):
+                chunk = values[start:start + READ_BACK_CHUNK]
+                for row in conn.execute(f"SELECT * FROM {TABLE} WHERE {key} IN ({', '.join('?' * len(chunk))})",
+                                        [_value(v) for v in chunk]):
+                    stored[row[key]] = self._row(row)
+            return [stored[value] for value in values if value in stored]
+        return APIResponse(self._transaction(work))
+
+    def _update(self, query: Query) -> APIResponse:
+        columns = [_column(c) for c in query.values]
+        assignments = ", ".join(f"{c} = ?" for c in columns)
+        params = [_value(query.values[c]) for c in columns] + query.params
+
+        def work(conn):
+            return conn.execute(f"UPDATE {TABLE} SET {assignments}{query._where_sql()}", params).rowcount
+        return APIResponse([], self._transaction(work))
+
+    def _delete(self, query: Query) -> APIResponse:
+        def work(conn):
+            return conn.execute(f"DELETE FROM {TABLE}{query._where_sql()}", query.params).rowcount
+        return APIResponse([], self._transaction(work))
+
+    def _bulk_update(self, patches: list) -> APIResponse:
+        """Partial-row updates by id; columns missing from a patch keep their value."""
+        groups = {}
+        for patch in patches:
+            keys = tuple(c for c in UPDATABLE_COLUMNS if c in patch)
+            groups.setdefault(keys, []).append(patch)
+
+        def work(conn):
+            updated = 0
+            for keys, group in groups.items():
+                # Setting updated_at explicitly matches the RPC and skips the trigger's extra write
+                assignments = ", ".join([f"{c} = ?" for c in keys] + [f"updated_at = {NOW}"])
+                cursor = conn.executemany(f"UPDATE {TABLE} SET {assignments} WHERE id = ?",
+                                          [[_value(p[c]) for c in keys] + [p["id"]] for p in group])
+                updated += cursor.rowcount
+            return updated
+        return APIResponse(self._transaction(work))
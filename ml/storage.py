@@ -0,0 +1,87 @@
+"""
+Storage backend selection for the ml scripts.
+Every script reads and writes engagement_training_data through a client
+with the supabase-py query builder interface (fetch pages, bulk insert,
+bulk upsert, update by id through the bulk_update_engagement_training RPC).
+Two backends provide it:
+
+    supabase  the hosted database (NEXT_PUBLIC_SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY)
+    sqlite    a local file mirroring the table's schema (sqlite_backend.py), so
+              imports, training and benchmarks can run offline without network latency
+
+Pick one with STORAGE_BACKEND / SQLITE_PATH or the scripts' --backend and
+--sqlite-path flags. The client is created on first use, so importing a
+script never needs credentials.
+"""
+
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKENDS = ("supabase", "sqlite")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", ".cache/engagement_training.sqlite3")
+
+_config = {"backend": STORAGE_BACKEND, "sqlite_path": SQLITE_PATH}
+_client = None
+_columns = {}
+
+def configure(backend: str = None, sqlite_path: str = None):
+    """Override the configured backend; resets the cached client."""
+    global _client
+    if backend:
+        if backend not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage backend: {backend}")
+        _config["backend"] = backend
+    if sqlite_path:
+        _config["sqlite_path"] = sqlite_path
+    _client = None
+    _columns.clear()
+
+def backend() -> str:
+    return _config["backend"]
+
+def get_client():
+    """Client for the configured backend, created on first use."""
+    global _client
+    if _client is None:
+        if _config["backend"] == "sqlite":
+            from sqlite_backend import SQLiteClient
+            path = _config["sqlite_path"]
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            print(f"   💽 Using local SQLite storage: {path}")
+            _client = SQLiteClient(path)
+        else:
+            from supabase import create_client
+            supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+            supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+            if not supabase_url or not supabase_key:
+                print("❌ Supabase credentials not found (or use --backend sqlite for local storage)")
+                sys.exit(1)
+
+            _client = create_client(supabase_url, supabase_key)
+    return _client
+
+def has_column(table: str, column: str, client=None) -> bool:
+    """Whether table has column, e.g. one added by an optional migration.
+
+    Probed once with an empty select and remembered until configure().
+    """
+    key = (table, column)
+    if key not in _columns:
+        try:
+            (client or get_client()).table(table).select(column).limit(0).execute()
+            _columns[key] = True
+        except Exception:
+            _columns[key] = False
+    return _columns[key]
+
+def add_arguments(parser):
+    """--backend/--sqlite-path flags shared by the scripts."""
+    parser.add_argument("--backend", choices=STORAGE_BACKENDS, default=None,
+                        help=f"where engagement_training_data lives (default: STORAGE_BACKEND or {STORAGE_BACKEND})")
+    parser.add_argument("--sqlite-path", default=None,
+                        help=f"database file for --backend sqlite (default: {SQLITE_PATH})")
@@ -0,0 +1,150 @@
+"""
+Page sources and running metrics for out-of-core training.
+train_model.py --stream never holds the labeled table or the feature matrix
+in memory. It makes three passes over pages of labeled rows:
+
+  1. scan: vocabularies, image score range, labeled_at watermark (no
+     embeddings transferred unless a PCA reducer has to be fitted)
+  2. train: pages are transformed and fed to XGBoost's external-memory matrix
+  3. evaluate: predictions are accumulated into running MAE / R²
+
+The holdout is picked by a hash of the row id rather than a shuffled split,
+so every pass agrees on it without remembering row positions.
+"""
+
+import zlib
+import numpy as np
+import pandas as pd
+from embedding_codec import (BINARY_COLUMN, coalesce_embedding_columns, decode_embeddings,
+                             has_embedding_filter, stored_columns)
+from supabase_reader import DEFAULT_PAGE_SIZE, iter_pages
+from storage import has_column
+from near_duplicates import COPY_COLUMN
+
+# Columns the feature transformer and the training run read
+TRAINING_COLUMNS = (
+    "id, post_type, likes_count, comments_count, views_count, followers, "
+    "theme, tone, dominant_color, cta_present, paid, language, engagement_score, labeled_at"
+)
+EMBEDDING_COLUMNS = ("caption_embedding", "caption_embedding_bin")
+HOLDOUT_BUCKETS = 5  # 1 row in 5 is held out
+
+def holdout_mask(ids) -> np.ndarray:
+    """Stable ~20% holdout keyed on the row id."""
+    return np.fromiter((zlib.crc32(str(i).encode("utf-8")) % HOLDOUT_BUCKETS == 0 for i in ids),
+                       dtype=bool, count=len(ids))
+
+class SnapshotPages:
+    """Labeled snapshot rows in pages; embeddings are read from the memmap per page."""
+
+    def __init__(self, df: pd.DataFrame, embeddings, page_size: int = DEFAULT_PAGE_SIZE):
+        self.df = df
+        self.embeddings = embeddings
+        self.page_size = page_size
+
+    def pages(self, with_embeddings: bool = True):
+        for start in range(0, len(self.df), self.page_size):
+            page = self.df.iloc[start:start + self.page_size].reset_index(drop=True)
+            embeddings = self.embeddings[start:start + self.page_size] if with_embeddings else None
+            yield page, embeddings
+
+class SupabasePages:
+    """Labeled rows with embeddings, streamed from Supabase by keyset pagination."""
+
+    def __init__(self, client, page_size: int = DEFAULT_PAGE_SIZE, dim: int = None,
+                 table: str = "engagement_training_data"):
+        self.client = client
+        self.page_size = page_size
+        self.dim = dim
+        self.table = table
+
+    def pages(self, with_embeddings: bool = True):
+        binary = has_column(self.table, BINARY_COLUMN, self.client)
+        flagged = has_column(self.table, COPY_COLUMN, self.client)
+        columns = TRAINING_COLUMNS
+        if with_embeddings:
+            columns += ", " + ", ".join(stored_columns(binary))
+
+        def labeled_query():
+            query = self.client.table(self.table) \
+                .select(columns) \
+                .eq("is_labeled", True) \
+                .or_(has_embedding_filter(binary))
+            # Flagged near-duplicates are not trained on
+            return query.is_(COPY_COLUMN, "null") if flagged else query
+
+        for rows in iter_pages(labeled_query, self.page_size):
+            page = pd.DataFrame(rows)
+            embeddings = None
+            if with_embeddings:
+                embeddings = decode_embeddings(coalesce_embedding_columns(page), self.dim)
+                page = page.drop(columns=[c for c in EMBEDDING_COLUMNS if c in page.columns])
+            yield page, embeddings
+
+def scan(source, transformer) -> dict:
+    """First pass: fit the transformer's vocabularies (and PCA reducer) in place.
+
+    Returns row count, raw image score range and labeled_at watermark.
+    """
+    fit_reducer = transformer.reducer is not None and transformer.reducer.method == "pca"
+    counts = {}
+    rows = 0
+    score_min, score_max = np.inf, -np.inf
+    watermark = None
+
+    for page, embeddings in source.pages(with_embeddings=fit_reducer):
+        rows += len(page)
+        for name, block in transformer.value_counts(page).items():
+            counts[name] = block if name not in counts else counts[name].add(block, fill_value=0)
+        if fit_reducer:
+            transformer.reducer.partial_fit(embeddings)
+
+        images = page["post_type"].isin(["image", "carousel"])
+        scores = pd.to_numeric(page.loc[images, "engagement_score"], errors="coerce").dropna()
+        if len(scores):
+            score_min = min(score_min, float(scores.min()))
+            score_max = max(score_max, float(scores.max()))
+        if "labeled_at" in page.columns:
+            labeled_at = pd.to_datetime(page["labeled_at"], utc=True, errors="coerce").max()
+            if pd.notna(labeled_at) and (watermark is None or labeled_at > watermark):
+                watermark = labeled_at
+        print(f"   🔎 Scanned {rows} rows...")
+
+    if fit_reducer and rows:
+        transformer.reducer.finish_fit()
+    transformer.fit_counts(counts)
+    return {
+        "rows": rows,
+        "score_range": (score_min, score_max) if score_min <= score_max else None,
+        "watermark": watermark.isoformat() if watermark is not None else None,
+    }
+
+class RunningMetrics:
+    """MAE and R² accumulated batch by batch."""
+
+    def __init__(self):
+        self.n = 0
+        self.abs_error = 0.0
+        self.squared_error = 0.0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        error = y_true - np.asarray(y_pred, dtype=np.float64)
+        self.n += len(y_true)
+        self.abs_error += float(np.abs(error).sum())
+        self.squared_error += float((error ** 2).sum())
+        self.total += float(y_true.sum())
+        self.total_sq += float((y_true ** 2).sum())
+
+    @property
+    def mae(self) -> float:
+        return self.abs_error / self.n if self.n else float("nan")
+
+    @property
+    def r2(self) -> float:
+        if not self.n:
+            return float("nan")
+        variance = self.total_sq - self.total ** 2 / self.n
+        return 1.0 - self.squared_error / variance if variance > 0 else float("nan")
@@ -0,0 +1,69 @@
+"""
+Streaming reads from Supabase tables.
+Keyset pagination (ORDER BY id, WHERE id > last_id) instead of one unbounded
+select, which PostgREST silently caps at its max-rows setting and which holds
+the whole result in memory.
+"""
+
+import instrumentation
+
+DEFAULT_PAGE_SIZE = 1000  # PostgREST's default max-rows
+
+def iter_pages(build_query, page_size: int = DEFAULT_PAGE_SIZE,
+               after_id=None, key: str = "id"):
+    """Yield pages (lists of rows) ordered by `key`.
+
+    build_query: callable returning a fresh filtered select query, e.g.
+        lambda: supabase.table("t").select("id, caption").is_("x", "null")
+    after_id: resume strictly after this key value.
+    """
+    last = after_id
+    while True:
+        query = build_query()
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.order(key).limit(page_size).execute().data or []
+        instrumentation.count("api_calls")
+        instrumentation.count("rows_fetched", len(rows))
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][key]
+        if len(rows) < page_size:
+            return
+
+def iter_rows(build_query, page_size: int = DEFAULT_PAGE_SIZE,
+              after_id=None, key: str = "id"):
+    """Yield individual rows from iter_pages."""
+    for page in iter_pages(build_query, page_size, after_id, key):
+        yield from page
+
+def iter_pages_by(build_query, order: str, page_size: int = DEFAULT_PAGE_SIZE, key: str = "id"):
+    """Yield pages ordered by (order, key), e.g. oldest rows first.
+
+    Keyset pagination on the pair, so rows sharing an `order` value are
+    neither skipped nor repeated across pages. Rows whose `order` is null
+    come first, paged by `key` alone.
+    """
+    yield from iter_pages(lambda: build_query().is_(order, "null"), page_size, key=key)
+    last = None
+    while True:
+        query = build_query().not_.is_(order, "null")
+        if last is not None:
+            value, tie = last
+            query = query.or_(f'{order}.gt."{value}",and({order}.eq."{value}",{key}.gt."{tie}")')
+        rows = query.order(order).order(key).limit(page_size).execute().data or []
+        instrumentation.count("api_calls")
+        instrumentation.count("rows_fetched", len(rows))
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][order], rows[-1][key]
+        if len(rows) < page_size:
+            return
+
+def count_rows(build_query) -> int:
+    """Exact row count for a filtered select (no rows transferred)."""
+    response = build_query().limit(1).execute()
+    instrumentation.count("api_calls")
+    return response.count or 0
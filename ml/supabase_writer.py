@@ -0,0 +1,144 @@
+"""
+Buffered bulk writer for Supabase tables.
+Collects rows and flushes them in chunks on a background thread, so callers
+(embedding, scoring, importing) keep working while earlier chunks are written.
+
+Two write modes:
+  - "update": partial-row patches by id through the
+    bulk_update_engagement_training RPC (see bulk_update_engagement_training.sql)
+  - "upsert": full rows through PostgREST upsert with an on_conflict column
+"""
+
+import queue
+import threading
+import time
+import instrumentation
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_MAX_RETRIES = 3
+UPDATE_RPC = "bulk_update_engagement_training"
+
+class BulkWriter:
+    """Buffer rows and write them in chunks of `chunk_size`.
+
+    Usage:
+        with BulkWriter(supabase, mode="update") as writer:
+            writer.add({"id": post_id, "caption_embedding": ...})
+        print(writer.written, writer.failed)
+    """
+
+    def __init__(self, client, table: str = "engagement_training_data",
+                 mode: str = "update", chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_retries: int = DEFAULT_MAX_RETRIES, on_conflict: str = "id",
+                 rpc_name: str = UPDATE_RPC, max_pending_chunks: int = 4,
+                 on_chunk_written=None):
+        if mode not in ("update", "upsert"):
+            raise ValueError(f"Unknown write mode: {mode}")
+
+        self.client = client
+        self.table = table
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.on_conflict = on_conflict
+        self.rpc_name = rpc_name
+        self.on_chunk_written = on_chunk_written
+
+        self.buffer = []
+        self.written = 0
+        self.failed = 0
+        self.chunks = 0
+        self.retries = 0
+        self.failed_rows = []
+        self.errors = []
+
+        self.lock = threading.Lock()
+        # Bounded so a slow database applies backpressure to producers
+        self.pending = queue.Queue(maxsize=max_pending_chunks)
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        self.closed = False
+
+    def add(self, row: dict):
+        """Queue one row; flushes automatically when a chunk is full."""
+        chunk = None
+        with self.lock:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.chunk_size:
+                chunk, self.buffer = self.buffer, []
+        if chunk:
+            self.pending.put(chunk)
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """Hand any buffered rows to the writer thread and wait for them."""
+        with self.lock:
+            chunk, self.buffer = self.buffer, []
+        if chunk:
+            self.pending.put(chunk)
+        self.pending.join()
+
+    def close(self):
+        """Flush remaining rows and stop the writer thread."""
+        if self.closed:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.worker.join()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _run(self):
+        while True:
+            chunk = self.pending.get()
+            try:
+                if chunk is None:
+                    return
+                self._write_with_retry(chunk)
+            finally:
+                self.pending.task_done()
+
+    def _write_with_retry(self, chunk: list):
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            try:
+                instrumentation.count("api_calls")
+                self._write(chunk)
+                instrumentation.count("rows_written", len(chunk))
+                with self.lock:
+                    self.written += len(chunk)
+                    self.chunks += 1
+                if self.on_chunk_written:
+                    self.on_chunk_written(chunk)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"   ❌ Failed to write chunk of {len(chunk)} rows: {str(e)[:100]}")
+                    with self.lock:
+                        self.failed += len(chunk)
+                        self.failed_rows.extend(chunk)
+                        self.errors.append(str(e))
+                    return
+                with self.lock:
+                    self.retries += 1
+                instrumentation.count("retries")
+                print(f"   ⏳ Chunk write failed ({str(e)[:60]}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+
+    def _write(self, chunk: list):
+        if self.mode == "update":
+            self.client.rpc(self.rpc_name, {"rows": chunk}).execute()
+        else:
+            self.client.table(self.table) \
+                .upsert(chunk, on_conflict=self.on_conflict) \
+                .execute()
@@ -0,0 +1,194 @@
+"""
+Synthetic engagement data for benchmarks.
+Generates posts shaped like the scraper exports and the engagement_training_data
+table: captions, themes/tones/colors (some comma-separated), metrics with
+realistic skew, and unit-norm fake caption embeddings. Engagement scores depend
+on the metrics, a few labels and one embedding direction, so models have a
+real signal to fit. Everything is seeded and reproducible.
+
+    python synthetic_data.py --rows 100000 --csv synthetic.csv
+    python synthetic_data.py --rows 100000 --sqlite .cache/engagement_training.sqlite3
+"""
+
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+from embedding_codec import encode_embedding
+
+KEYWORDS = ['Jewellery', 'Jewelry', 'Necklace', 'Gold', 'Rings', 'Earrings', 'Bridal Jewellery',
+            'Wholesale Jewellery', 'Gold plated jewellery', 'Silver', 'Jhumka', 'Bangles']
+POST_TYPES = (['Reel', 'Image', 'Carousel', 'Video'], [0.78, 0.10, 0.08, 0.04])
+LANGUAGES = (['English', 'Hindi', 'Hinglish', 'Bengali', 'Other'], [0.84, 0.07, 0.05, 0.02, 0.02])
+THEMES = ['Traditional', 'Minimal', 'Contemporary', 'Bridal', 'Casual', 'Luxury', 'Festive',
+          'Statement', 'Vintage', 'Other']
+TONES = ['Professional', 'Playful', 'Luxury', 'Affordable', 'Modern', 'Emotional', 'Informative']
+COLORS = ['Warm', 'Neutral', 'Cool', 'Vibrant', 'Dark', 'Pastel', 'Gold', 'Silver']
+MUSIC = ['Bollywood', 'Null', 'Instrumental', 'Regional', 'Western', 'Other']
+WORDS = ("jewellery gold silver necklace earrings bangles ring bridal festive collection new "
+         "arrival handcrafted shop now order dm link bio limited stock sale offer kundan polki "
+         "jhumka temple antique oxidised pearl stone wedding season style look gift trending "
+         "elegant everyday wear minimal statement luxury affordable price free shipping").split()
+CSV_HEADER = ['Keyword', 'URL', 'Likes', 'Comments', 'Type', 'Caption', 'Views', 'Language',
+              'Posted Date', 'Theme', 'Tone', 'CTA Present', 'Paid', 'Color', 'Music', 'Followers']
+
+def _multi_label(rng, values, n, second_prob):
+    """One label per row, plus a second one (comma-separated) with second_prob."""
+    first = rng.choice(values, n)
+    second = rng.choice(values, n)
+    both = (rng.random(n) < second_prob) & (first != second)
+    return np.where(both, np.char.add(np.char.add(first.astype(str), ','), second.astype(str)), first)
+
+def _captions(rng, n, mean_words: int = 55):
+    lengths = np.clip(rng.poisson(mean_words, n), 3, 250)
+    words = np.asarray(WORDS)
+    return [' '.join(words[rng.integers(0, len(words), k)]) for k in lengths]
+
+def generate_posts(n: int, seed: int = 42, start_id: int = 0) -> pd.DataFrame:
+    """n posts with the scraper's fields under engagement_training_data column names."""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(start_id, start_id + n)
+    post_type = rng.choice(POST_TYPES[0], n, p=POST_TYPES[1])
+    followers = np.round(np.exp(rng.normal(11, 1.3, n))).astype(np.int64)
+    likes = np.round(followers * np.exp(rng.normal(-3.2, 1.1, n))).astype(np.int64)
+    comments = np.round(likes * np.exp(rng.normal(-4.0, 0.9, n))).astype(np.int64)
+    is_video = np.isin(post_type, ['Reel', 'Video'])
+    views = np.where(is_video, np.round(likes * np.exp(rng.normal(2.6, 0.8, n))), np.nan)
+    posted = pd.Timestamp('2024-11-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D')
+
+    return pd.DataFrame({
+        'id': [f"{i:08d}-0000-4000-8000-{i:012d}" for i in ids],
+        'keyword': rng.choice(KEYWORDS, n),
+        'post_url': [f"https://www.instagram.com/{'reel' if v else 'p'}/SYN{i:010d}/"
+                     for i, v in zip(ids, is_video)],
+        'post_type': post_type,
+        'likes_count': likes,
+        'comments_count': comments,
+        'views_count': views,
+        'followers': followers,
+        'caption': _captions(rng, n),
+        'language': rng.choice(LANGUAGES[0], n, p=LANGUAGES[1]),
+        'posted_at': posted.strftime('%Y-%m-%d'),
+        'theme': _multi_label(rng, THEMES, n, 0.15),
+        'tone': _multi_label(rng, TONES, n, 0.2),
+        'dominant_color': _multi_label(rng, COLORS, n, 0.1),
+        'cta_present': rng.random(n) < 0.6,
+        'paid': rng.random(n) < 0.2,
+        'music_type': rng.choice(MUSIC, n),
+    })
+
+def generate_embeddings(n: int, dim: int = 1536, seed: int = 42, out=None,
+                        chunk_rows: int = 50_000) -> np.ndarray:
+    """Unit-norm float32 embeddings, written chunk by chunk into `out` when given
+    (e.g. a np.lib.format.open_memmap for sizes that don't fit in RAM)."""
+    rng = np.random.default_rng(seed + 1)
+    matrix = out if out is not None else np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, chunk_rows):
+        chunk = rng.standard_normal((min(chunk_rows, n - start), dim), dtype=np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        matrix[start:start + len(chunk)] = chunk
+    return matrix
+
+def engagement_scores(posts: pd.DataFrame, embeddings, seed: int = 42,
+                      chunk_rows: int = 50_000) -> np.ndarray:
+    """0-100 scores from the metrics, labels and the first embedding direction."""
+    rng = np.random.default_rng(seed + 2)
+    followers = posts['followers'].to_numpy(dtype=np.float64)
+    rate = (posts['likes_count'].to_numpy() + 3 * posts['comments_count'].to_numpy()) / np.maximum(followers, 1)
+    score = 35 + 12 * np.log1p(rate * 50)
+    score += np.where(posts['theme'].str.contains('Bridal|Festive'), 8, 0)
+    score += np.where(posts['cta_present'], 3, 0) - np.where(posts['paid'], 4, 0)
+    signal = np.concatenate([np.asarray(embeddings[s:s + chunk_rows, 0], dtype=np.float64)
+                             for s in range(0, len(posts), chunk_rows)]) if len(posts) else np.zeros(0)
+    score += 400 * signal + rng.normal(0, 6, len(posts))
+    return np.clip(score, 0, 100).round(2)
+
+def table_rows(posts: pd.DataFrame, scores: np.ndarray, labeled_fraction: float = 1.0,
+               seed: int = 42) -> pd.DataFrame:
+    """engagement_training_data rows (embeddings kept separately, snapshot-style)."""
+    rng = np.random.default_rng(seed + 3)
+    rows = posts.copy()
+    rows['post_type'] = rows['post_type'].str.lower()
+    rows['engagement_score'] = scores
+    rows['is_labeled'] = rng.random(len(rows)) < labeled_fraction
+    rows['labeled_at'] = pd.Timestamp('2025-11-20', tz='UTC').isoformat()
+    rows['has_embedding'] = True
+    return rows
+
+def write_csv(posts: pd.DataFrame, path: str):
+    """Write posts in the scraper's CSV export format."""
+    frame = pd.DataFrame({
+        'Keyword': posts['keyword'],
+        'URL': posts['post_url'],
+        'Likes': posts['likes_count'],
+        'Comments': posts['comments_count'],
+        'Type': posts['post_type'],
+        'Caption': posts['caption'],
+        'Views': posts['views_count'].astype('Int64'),
+        'Language': posts['language'],
+        'Posted Date': posts['posted_at'],
+        'Theme': posts['theme'],
+        'Tone': posts['tone'],
+        'CTA Present': posts['cta_present'],
+        'Paid': posts['paid'],
+        'Color': posts['dominant_color'],
+        'Music': posts['music_type'],
+        'Followers': posts['followers'],
+    }, columns=CSV_HEADER)
+    frame.to_csv(path, index=False, quoting=csv.QUOTE_MINIMAL)
+
+def load_sqlite(posts: pd.DataFrame, embeddings, path: str, storage: str = "f16",
+                chunk_rows: int = 5000) -> int:
+    """Insert labeled posts with embeddings into a local SQLite database.
+
+    The database computes engagement_score from the metrics, as Supabase does.
+    """
+    from sqlite_backend import SQLiteClient
+    client = SQLiteClient(path)
+    table = client.table("engagement_training_data")
+    inserted = 0
+    for start in range(0, len(posts), chunk_rows):
+        chunk = posts.iloc[start:start + chunk_rows].copy()
+        chunk['post_type'] = chunk['post_type'].str.lower()
+        chunk['views_count'] = chunk['views_count'].astype('Int64')
+        rows = chunk.astype(object).where(chunk.notna(), None).to_dict('records')
+        for row, embedding in zip(rows, embeddings[start:start + chunk_rows]):
+            row['is_labeled'] = True
+            row['caption_embedding_bin'] = encode_embedding(embedding, storage)
+        table.insert(rows).execute()
+        inserted += len(rows)
+    client.close()
+    return inserted
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic engagement data")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--csv", help="write a scraper-style CSV export here")
+    parser.add_argument("--parquet", help="write table rows (with engagement_score) here")
+    parser.add_argument("--embeddings", help="write a float32 .npy embedding matrix here")
+    parser.add_argument("--sqlite", help="insert labeled rows with embeddings into this local database")
+    parser.add_argument("--dim", type=int, default=1536)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    posts = generate_posts(args.rows, args.seed)
+    if args.csv:
+        write_csv(posts, args.csv)
+        print(f"✅ {args.rows} rows -> {args.csv}")
+    if args.parquet or args.embeddings or args.sqlite:
+        if args.embeddings:
+            embeddings = np.lib.format.open_memmap(args.embeddings, mode="w+", dtype=np.float32,
+                                                   shape=(args.rows, args.dim))
+            generate_embeddings(args.rows, args.dim, args.seed, out=embeddings)
+            embeddings.flush()
+            print(f"✅ {args.rows} x {args.dim} embeddings -> {args.embeddings}")
+        else:
+            embeddings = generate_embeddings(args.rows, args.dim, args.seed)
+        if args.parquet:
+            table_rows(posts, engagement_scores(posts, embeddings, args.seed)).to_parquet(args.parquet, index=False)
+            print(f"✅ {args.rows} table rows -> {args.parquet}")
+        if args.sqlite:
+            inserted = load_sqlite(posts, embeddings, args.sqlite)
+            print(f"✅ {inserted} labeled rows -> {args.sqlite}")
@@ -0,0 +1,69 @@
+"""
+Tests for the ml scripts. Run from ml/:
+
+    python -m pytest tests
+
+The scripts import their siblings by module name, so ml/ goes on sys.path.
+Every test runs against the local SQLite backend and a temporary working
+directory, so nothing touches Supabase, OpenAI or the real .cache/.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_DIR not in sys.path:
+    sys.path.insert(0, ML_DIR)
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """Run in tmp_path with a fresh local SQLite database."""
+    import storage
+
+    monkeypatch.chdir(tmp_path)
+    storage.configure("sqlite", str(tmp_path / "engagement.sqlite3"))
+    yield tmp_path
+    storage.configure(storage.STORAGE_BACKEND, storage.SQLITE_PATH)
+
+def make_sample_posts(n: int = 60, seed: int = 0, themes=("festive", "bridal", "minimal", "luxury")) -> pd.DataFrame:
+    """Posts covering every shape a column arrives in: JSON and list embeddings,
+    missing values, blank and comma-only multi-value fields, unknown types."""
+    from feature_pipeline import EMBEDDING_DIM
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        embedding = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+        kind = i % 4
+        rows.append({
+            # JSON text, a list, no embedding, an empty string
+            "caption_embedding": [json.dumps(embedding.tolist()), embedding.tolist(), None, ""][kind],
+            "likes_count": int(rng.integers(0, 5000)),
+            "comments_count": int(rng.integers(0, 300)),
+            "views_count": [int(rng.integers(0, 10**5)), None][i % 2],
+            "followers": [int(rng.integers(100, 10**6)), None, None][i % 3],
+            "followers_count": [None, 1234, None][i % 3],
+            "post_type": ["reel", "video", "image", "carousel", "story"][i % 5],
+            "theme": [", ".join(rng.choice(themes, 2, replace=False)), "", None, " , "][kind],
+            "tone": ["warm,bold", "bold", "", "calm, warm"][i % 4],
+            "dominant_color": [None, "gold", "gold,silver", "rose gold"][i % 4],
+            "cta_present": [True, False, None][i % 3],
+            "paid": [False, True][i % 2],
+            "posting_time": ["18:30", "7", "", None, "late"][i % 5],
+            "language": ["English", "Hindi", "Tamil", "Hinglish"][i % 4],
+        })
+    df = pd.DataFrame(rows)
+    # Keep None as None (not NaN), as the original iterrows builder expects
+    for column in ("views_count", "followers", "followers_count"):
+        df[column] = pd.Series([row[column] for row in rows], dtype=object)
+    return df
+
+@pytest.fixture
+def sample_posts():
+    """make_sample_posts, for tests building feature frames."""
+    return make_sample_posts
@@ -0,0 +1,28 @@
+"""
+Per-file date format detection in the importer.
+"""
+
+from import_scraped_data import DateParser
+
+def test_detects_the_format_every_sample_uses():
+    assert DateParser.detect(["2024-11-04", "2024-11-16", " 2024-12-01 ", ""]) == "%Y-%m-%d"
+
+def test_outliers_do_not_disable_detection():
+    samples = ["04/11/2024"] * 10 + [f"{day}/11/2024" for day in range(13, 31)] + ["Nov 4, 2024"]
+    fmt = DateParser.detect(samples)
+    assert fmt == "%d/%m/%Y"
+    parser = DateParser(fmt)
+    assert parser("25/11/2024") == "2024-11-25"
+    # The odd one out still parses, through the fallback
+    assert parser("Nov 4, 2024") == "2024-11-04"
+    assert parser.fallbacks == 1
+
+def test_no_format_below_threshold():
+    samples = ["2024-11-04"] * 5 + ["04 November 2024"] * 5
+    assert DateParser.detect(samples) is None
+
+def test_ambiguous_dates_prefer_earlier_format():
+    assert DateParser.detect(["04/11/2024", "05/11/2024"]) == "%m/%d/%Y"
+
+def test_no_samples():
+    assert DateParser.detect(["", None, "  "]) is None
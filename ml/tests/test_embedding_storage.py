@@ -0,0 +1,45 @@
+"""
+caption_embedding_bin is optional: JSON storage must work on a schema
+without add_caption_embedding_bin_column.sql. Resume checkpoints belong
+to the model and size they were written for.
+"""
+
+import generate_embeddings
+import storage
+from embedding_codec import BINARY_COLUMN, embedding_columns, has_embedding_filter, stored_columns
+from generate_embeddings import embedding_model_tag, pending_embeddings_query
+
+def referenced(query) -> str:
+    return " ".join(query.where) + " " + query.columns
+
+def test_has_column_probes_the_table():
+    assert storage.has_column("engagement_training_data", BINARY_COLUMN)
+    assert not storage.has_column("engagement_training_data", "no_such_column")
+
+def test_json_storage_writes_only_caption_embedding():
+    assert set(embedding_columns([0.5, 0.25], "json")) == {"caption_embedding"}
+    assert set(embedding_columns([0.5, 0.25], "f16")) == {BINARY_COLUMN}
+
+def test_pending_query_skips_missing_binary_column(monkeypatch):
+    monkeypatch.setitem(storage._columns, ("engagement_training_data", BINARY_COLUMN), False)
+    assert BINARY_COLUMN not in referenced(pending_embeddings_query(storage="json"))
+    # Blob storage always needs the column
+    assert BINARY_COLUMN in referenced(pending_embeddings_query(storage="f16"))
+
+def test_pending_query_checks_existing_binary_column():
+    # Rows already embedded as blobs are not re-embedded as JSON
+    assert BINARY_COLUMN in referenced(pending_embeddings_query(storage="json"))
+
+def test_embedding_filter_follows_schema():
+    assert stored_columns(False) == ("caption_embedding",)
+    assert has_embedding_filter(False) == "caption_embedding.not.is.null"
+    assert has_embedding_filter(True) == f"caption_embedding.not.is.null,{BINARY_COLUMN}.not.is.null"
+
+def test_checkpoint_from_another_model_is_discarded():
+    generate_embeddings.save_checkpoint({"last_id": "42", "model": embedding_model_tag(1536)})
+    assert generate_embeddings.checkpoint_resume_id(1536) == "42"
+    assert generate_embeddings.checkpoint_resume_id(256) is None
+    assert generate_embeddings.load_checkpoint() == {}
+    # Written before the model was recorded
+    generate_embeddings.save_checkpoint({"last_id": "42"})
+    assert generate_embeddings.checkpoint_resume_id(1536) is None
@@ -0,0 +1,69 @@
+"""
+FeatureTransformer: batch and single-post paths, persistence and the
+"other" bucket for values outside the fitted vocabularies.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from embedding_reducer import EmbeddingReducer
+from feature_pipeline import EMBEDDING_DIM, FeatureTransformer
+
+def records(df) -> list:
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+@pytest.mark.parametrize("unknown_bucket", [True, False])
+def test_transform_one_matches_transform(sample_posts, unknown_bucket):
+    train = sample_posts(40, seed=1)
+    scored = sample_posts(20, seed=2, themes=("festive", "streetwear", "vintage"))
+    transformer = FeatureTransformer(unknown_bucket=unknown_bucket).fit(train)
+    X = transformer.transform(scored)
+    single = np.stack([transformer.transform_one(row) for row in records(scored)])
+    np.testing.assert_array_equal(single, X)
+
+def test_transform_one_matches_transform_with_reducer(sample_posts):
+    df = sample_posts(24)
+    reducer = EmbeddingReducer("pca", 16, EMBEDDING_DIM)
+    transformer = FeatureTransformer(reducer=reducer).fit(df)
+    X = transformer.transform(df)
+    single = np.stack([transformer.transform_one(row) for row in records(df)])
+    np.testing.assert_allclose(single, X, rtol=1e-5, atol=1e-5)
+
+def test_round_trip_keeps_layout_and_output(sample_posts, tmp_path):
+    df = sample_posts(30)
+    transformer = FeatureTransformer(min_count=2, reducer=EmbeddingReducer("truncate", 32, EMBEDDING_DIM)).fit(df)
+    restored = FeatureTransformer.from_dict(json.loads(json.dumps(transformer.to_dict())))
+    assert restored.to_dict() == transformer.to_dict()
+    assert restored.feature_names() == transformer.feature_names()
+    np.testing.assert_array_equal(restored.transform(df), transformer.transform(df))
+
+    path = str(tmp_path / "transformer.json")
+    transformer.save(path)
+    np.testing.assert_array_equal(FeatureTransformer.load(path).transform(df), transformer.transform(df))
+
+def test_unseen_values_set_other_bucket(sample_posts):
+    train = sample_posts(20, seed=1, themes=("festive", "bridal"))
+    transformer = FeatureTransformer().fit(train)
+    scored = train.head(3).copy()
+    scored["theme"] = ["festive, vintage", "streetwear", "bridal"]
+    scored["tone"] = ["warm", "warm", "warm"]
+
+    assert transformer.unseen_values(scored) == {"themes": ["streetwear", "vintage"]}
+    X = transformer.transform(scored)
+    names = transformer.feature_names()
+    other = names.index("theme=<other>")
+    assert names.index("theme=bridal") < other < names.index(f"tone={transformer.tones[0]}")
+    assert X[:, other].tolist() == [1.0, 1.0, 0.0]
+    assert X[0, names.index("theme=festive")] == 1.0
+    assert not X[:, names.index("tone=<other>")].any()
+    assert X.shape[1] == len(names) == transformer.n_features
+
+def test_min_count_sends_rare_values_to_other_bucket(sample_posts):
+    train = sample_posts(8)
+    train["theme"] = ["common"] * 7 + ["rare"]
+    transformer = FeatureTransformer(min_count=2).fit(train)
+    assert transformer.themes == ["common"]
+    X = transformer.transform(train)
+    assert X[7, transformer.feature_names().index("theme=<other>")] == 1.0
@@ -0,0 +1,70 @@
+"""
+Chunked, de-duplicating import (import_scraped_data.import_csv).
+"""
+
+import csv
+
+import pytest
+
+import import_scraped_data
+from import_scraped_data import import_csv
+from storage import get_client
+
+def write_csv(path, urls):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["URL", "Caption", "Likes", "Comments", "Date"])
+        writer.writeheader()
+        for i, url in enumerate(urls):
+            writer.writerow({"URL": url, "Caption": f"post {i}", "Likes": i, "Comments": 1,
+                             "Date": "2024-11-04"})
+    return str(path)
+
+def stored() -> list:
+    rows = get_client().table("engagement_training_data").select("post_url, caption").execute().data
+    return sorted((row["post_url"], row["caption"]) for row in rows)
+
+@pytest.mark.parametrize("chunk_size, workers", [(1000, 1), (3, 1), (2, 3)])
+def test_duplicates_within_and_across_chunks(tmp_path, monkeypatch, chunk_size, workers):
+    # Small existence queries so one chunk needs several
+    monkeypatch.setattr(import_scraped_data, "EXISTS_QUERY_SIZE", 2)
+    urls = [f"https://x/p/{i}" for i in range(10)]
+    path = write_csv(tmp_path / "posts.csv", urls[:6] + [urls[1], "", urls[7], urls[1], urls[8], urls[9]])
+
+    result = import_csv(path, chunk_size=chunk_size, workers=workers)
+    assert result == {"imported": 9, "skipped": 3, "errors": 0, "collapsed": 0, "records": 12}
+    # The first occurrence of a repeated URL is the one kept
+    assert ("https://x/p/1", "post 1") in stored()
+    assert len(stored()) == 9
+
+    # A second import of an overlapping file skips what is already stored
+    path = write_csv(tmp_path / "more.csv", urls[5:] + ["https://x/p/10"])
+    result = import_csv(path, chunk_size=chunk_size, workers=workers)
+    assert (result["imported"], result["skipped"]) == (2, 4)
+    assert [url for url, _ in stored()] == sorted(urls + ["https://x/p/10"])
+
+def test_progress_and_resume(tmp_path):
+    path = write_csv(tmp_path / "posts.csv", [f"https://x/p/{i}" for i in range(10)])
+    progress = []
+    import_csv(path, chunk_size=3, workers=2, on_progress=progress.append)
+    assert progress == sorted(progress)
+    assert progress[-1] == 10
+
+    result = import_csv(path, chunk_size=3, start_record=7)
+    assert result["records"] == 10
+    assert (result["imported"], result["skipped"]) == (0, 3)
+
+def test_progress_stops_at_failed_chunk(tmp_path, monkeypatch):
+    path = write_csv(tmp_path / "posts.csv", [f"https://x/p/{i}" for i in range(9)])
+    real_insert_rows = import_scraped_data.insert_rows
+
+    def insert_rows(rows, on_inserted=None, on_failed=None):
+        if any(row["post_url"] == "https://x/p/4" for row in rows):
+            return 0, len(rows)
+        return real_insert_rows(rows, on_inserted, on_failed)
+
+    monkeypatch.setattr(import_scraped_data, "insert_rows", insert_rows)
+    progress = []
+    result = import_csv(path, chunk_size=3, workers=1, on_progress=progress.append)
+    assert result["errors"] == 3
+    # Only the chunk before the failed one counts as done
+    assert progress == [3]
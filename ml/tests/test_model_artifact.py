@@ -0,0 +1,27 @@
+"""
+Segment model files (model_artifact.save_segment_boosters).
+"""
+
+import os
+
+import model_artifact
+
+class FakeBooster:
+    def __init__(self, label):
+        self.label = label
+
+    def save_model(self, path):
+        with open(path, "w") as f:
+            f.write(self.label)
+
+def test_labels_with_the_same_slug_get_their_own_files():
+    labels = ["reel/gold", "reel-gold", "image/silver"]
+    segments = model_artifact.save_segment_boosters({label: FakeBooster(label) for label in labels},
+                                                    ["post_type", "dominant_color"], "v1", "json")
+    names = segments["models"]
+    assert len(set(names.values())) == 3
+    assert names["image/silver"] == "engagement_model_v1.segment-image-silver.json"
+    assert names["reel/gold"].startswith("engagement_model_v1.segment-reel-gold-")
+    for label, name in names.items():
+        with open(os.path.join(model_artifact.MODELS_DIR, name)) as f:
+            assert f.read() == label
@@ -0,0 +1,262 @@
+"""
+Near-duplicate caption index (MinHash LSH) and the importer's use of it.
+"""
+
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import import_scraped_data
+import near_duplicates
+from embedding_codec import embedding_columns
+from feature_pipeline import EMBEDDING_DIM
+from generate_embeddings import pending_embeddings_query
+from near_duplicates import COPY_COLUMN, NUM_PERM, SHINGLE_BYTES, NearDuplicateIndex, normalize, signature
+from storage import get_client
+from streaming_training import SupabasePages
+from train_model import labeled_rows_query, load_snapshot_training_data
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAPTION = "Festive bridal lehenga collection now live, shop the new drop before Diwali #bridal #festive"
+COPY = CAPTION + " #sale"
+OTHER = "Minimal gold hoops for everyday wear, handmade in small batches #jewellery"
+
+WORDS = [f"word{i}" for i in range(300)]
+
+def random_caption(rng, words: int = 40) -> str:
+    return " ".join(rng.choice(WORDS, words))
+
+def edited(rng, caption: str, edits: int) -> str:
+    words = caption.split()
+    for position in rng.choice(len(words), edits, replace=False):
+        words[position] = rng.choice(WORDS)
+    return " ".join(words)
+
+def jaccard(a: str, b: str) -> float:
+    def shingles(text):
+        data = normalize(text).encode("utf-8")
+        return {data[i:i + SHINGLE_BYTES] for i in range(len(data) - SHINGLE_BYTES + 1)}
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+def estimated(a: str, b: str) -> float:
+    return float(np.count_nonzero(signature(normalize(a)) == signature(normalize(b)))) / NUM_PERM
+
+def test_normalize_drops_emoji_and_punctuation():
+    assert normalize("  New DROP!! 💍✨ #Bridal,  #festive\n") == "new drop bridal festive"
+    assert normalize(None) == ""
+
+def test_signature_estimates_jaccard():
+    rng = np.random.default_rng(0)
+    errors = []
+    for edits in (1, 3, 6, 12, 20):
+        for _ in range(10):
+            a = random_caption(rng)
+            b = edited(rng, a, edits)
+            errors.append(abs(estimated(a, b) - jaccard(a, b)))
+    # 128 permutations: standard error <= 0.045
+    assert np.mean(errors) < 0.05
+    assert max(errors) < 0.2
+    sig = signature(normalize(CAPTION))
+    assert sig.dtype == np.uint32 and sig.shape == (NUM_PERM,)
+    np.testing.assert_array_equal(sig, signature(normalize(CAPTION)))
+
+def test_recall_above_threshold_and_precision_below(tmp_path):
+    rng = np.random.default_rng(1)
+    index = NearDuplicateIndex(str(tmp_path / "index.sqlite"), similarity=0.8)
+    originals = [random_caption(rng) for _ in range(200)]
+    for i, caption in enumerate(originals):
+        assert index.check(f"orig-{i}", caption) is None
+
+    found = near = 0
+    for i, caption in enumerate(originals[:100]):
+        copy = edited(rng, caption, 1)
+        if jaccard(caption, copy) >= 0.85:
+            near += 1
+            found += index.check(f"copy-{i}", copy) == f"orig-{i}"
+    assert near >= 50
+    assert found / near >= 0.95
+
+    false_matches = 0
+    for i, caption in enumerate(originals[100:150]):
+        rewrite = edited(rng, caption, 20)
+        assert jaccard(caption, rewrite) < 0.6
+        false_matches += index.check(f"rewrite-{i}", rewrite) is not None
+    assert false_matches == 0
+    index.close()
+
+def test_similarity_threshold(tmp_path):
+    copy = CAPTION.replace("shop", "buy")
+    similarity = estimated(CAPTION, copy)
+    assert 0.8 <= similarity < 1.0
+    loose = NearDuplicateIndex(str(tmp_path / "loose.sqlite"), similarity=similarity)
+    strict = NearDuplicateIndex(str(tmp_path / "strict.sqlite"), similarity=similarity + 0.01)
+    for index in (loose, strict):
+        index.check("a", CAPTION)
+    sig = signature(normalize(copy))
+    assert loose.match(sig) == ("a", similarity)
+    assert strict.match(sig) == (None, similarity)
+    # A post never matches itself
+    assert loose.match(sig, "a") == (None, 0.0)
+    loose.close()
+    strict.close()
+
+def test_copies_point_at_the_first_post(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.sqlite"))
+    assert index.check("a", CAPTION) is None
+    assert index.check("b", COPY) == "a"
+    # A copy of a copy joins the same cluster rather than chaining
+    assert index.check("c", COPY + " #offer") == "a"
+    assert index.check("d", OTHER) is None
+    # Already indexed: the earlier verdict, without a new entry
+    assert index.check("b", OTHER) == "a"
+    assert index.check("e", "❤️ new drop") is None
+    assert index.stats["copies"] == 2 and index.stats["canonical"] == 2
+    assert index.stats["known"] == 1 and index.stats["short"] == 1
+    assert index.stats["exact_copies"] == 0
+    summary = index.summary()
+    assert (summary["posts"], summary["canonical"]) == (4, 2)
+    assert summary["largest_clusters"] == [{"canonical": "a", "copies": 2}]
+
+    assert index.forget(["a"]) == 3
+    assert index.check("b", COPY) is None
+    index.close()
+
+def test_exact_copies_are_counted_separately(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.sqlite"))
+    index.check("a", CAPTION)
+    assert index.check("b", "  " + CAPTION.replace(" ", "  ")) == "a"
+    assert index.stats["exact_copies"] == 1
+    assert index.stats["near_tokens"] == 0
+    index.close()
+
+def test_index_rejects_other_parameters(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    NearDuplicateIndex(path).close()
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE meta SET value = '64' WHERE key = 'num_perm'")
+    conn.commit()
+    conn.close()
+    with pytest.raises(ValueError, match="rebuild"):
+        NearDuplicateIndex(path)
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["URL", "Caption", "Likes", "Comments", "Theme"])
+        writer.writeheader()
+        for url, caption in rows:
+            writer.writerow({"URL": url, "Caption": caption, "Likes": 10, "Comments": 1, "Theme": "festive"})
+    return str(path)
+
+def stored_urls() -> set:
+    rows = get_client().table("engagement_training_data").select("post_url").execute().data
+    return {row["post_url"] for row in rows}
+
+class FailingInserts:
+    """Client whose inserts of the given post_urls raise."""
+
+    def __init__(self, client, failing):
+        self.client = client
+        self.failing = set(failing)
+
+    def table(self, name):
+        table = self.client.table(name)
+        failing = self.failing
+
+        class Table:
+            def __getattr__(self, attr):
+                return getattr(table, attr)
+
+            def insert(self, rows):
+                batch = rows if isinstance(rows, list) else [rows]
+                if any(row["post_url"] in failing for row in batch):
+                    raise RuntimeError("insert failed")
+                return table.insert(rows)
+
+        return Table()
+
+def test_failed_insert_is_dropped_from_index(tmp_path, monkeypatch):
+    csv_path = write_csv(tmp_path / "posts.csv", [("https://x/p/a", CAPTION), ("https://x/p/b", COPY),
+                                                  ("https://x/p/c", OTHER)])
+    index_path = str(tmp_path / "index.sqlite")
+    client = get_client()
+    monkeypatch.setattr(import_scraped_data, "get_client", lambda: FailingInserts(client, {"https://x/p/a"}))
+
+    result = import_scraped_data.import_csv(csv_path, chunk_size=1, workers=1, near_duplicate_policy="collapse",
+                                            index_path=index_path)
+    assert result["errors"] == 1
+    assert stored_urls() == {"https://x/p/c"}
+    index = NearDuplicateIndex(index_path)
+    recorded = {url for (url,) in index.conn.execute("SELECT post_url FROM posts")}
+    index.close()
+    # The failed canonical and the copy collapsed onto it are both forgotten
+    assert recorded == {"https://x/p/c"}
+
+    monkeypatch.setattr(import_scraped_data, "get_client", lambda: client)
+    result = import_scraped_data.import_csv(csv_path, chunk_size=1, workers=1, near_duplicate_policy="collapse",
+                                            index_path=index_path)
+    assert result["errors"] == 0
+    assert result["collapsed"] == 1
+    assert stored_urls() == {"https://x/p/a", "https://x/p/c"}
+
+def urls(query) -> set:
+    return {row["post_url"] for row in query.execute().data}
+
+def test_flagged_copy_is_neither_embedded_nor_trained_on(tmp_path):
+    csv_path = write_csv(tmp_path / "posts.csv", [("https://x/p/a", CAPTION), ("https://x/p/b", COPY),
+                                                  ("https://x/p/c", OTHER)])
+    result = import_scraped_data.import_csv(csv_path, near_duplicate_policy="flag",
+                                            index_path=str(tmp_path / "index.sqlite"))
+    assert result["imported"] == 3
+    rows = get_client().table("engagement_training_data").select(f"post_url, is_labeled, {COPY_COLUMN}") \
+        .execute().data
+    assert {row["post_url"]: row[COPY_COLUMN] for row in rows} == \
+        {"https://x/p/a": None, "https://x/p/b": "https://x/p/a", "https://x/p/c": None}
+    assert all(row["is_labeled"] for row in rows)
+
+    originals = {"https://x/p/a", "https://x/p/c"}
+    assert urls(pending_embeddings_query()) == originals
+    # Embed everything the embedder would, then check every training source
+    table = get_client().table("engagement_training_data")
+    for row in pending_embeddings_query().execute().data:
+        table.update(embedding_columns([0.1] * EMBEDDING_DIM, "json")).eq("id", row["id"]).execute()
+    assert urls(pending_embeddings_query()) == set()
+    assert urls(labeled_rows_query(columns="post_url")) == originals
+    post_urls = {row["id"]: row["post_url"] for row in table.select("id, post_url").execute().data}
+    pages = SupabasePages(get_client(), dim=EMBEDDING_DIM).pages()
+    assert {post_urls[i] for page, _ in pages for i in page["id"]} == originals
+    df, _ = load_snapshot_training_data()
+    assert set(df["post_url"]) == originals
+
+@pytest.mark.parametrize("page_size", [1, 2, 1000])
+def test_build_flags_existing_rows(tmp_path, page_size):
+    # b and c share a timestamp; b's id sorts first, so it is indexed before c
+    get_client().table("engagement_training_data").insert([
+        {"id": row_id, "post_url": url, "post_type": "image", "caption": caption, "created_at": created_at}
+        for row_id, url, caption, created_at in [("3", "a", CAPTION, "2024-11-01T00:00:00+00:00"),
+                                                 ("1", "b", COPY, "2024-11-02T00:00:00+00:00"),
+                                                 ("2", "c", COPY + " #offer", "2024-11-02T00:00:00+00:00"),
+                                                 ("4", "d", OTHER, "2024-11-03T00:00:00+00:00")]]).execute()
+    get_client().table("engagement_training_data").update({COPY_COLUMN: "stale"}).eq("post_url", "d").execute()
+
+    near_duplicates.build_index(str(tmp_path / "index.sqlite"), page_size=page_size)
+    rows = get_client().table("engagement_training_data").select(f"post_url, {COPY_COLUMN}").execute().data
+    assert {row["post_url"]: row[COPY_COLUMN] for row in rows} == {"a": None, "b": "a", "c": "a", "d": None}
+
+def test_check_does_not_load_the_embedding_client(tmp_path):
+    # A fresh interpreter: other tests have imported generate_embeddings already
+    script = (
+        "import sys, near_duplicates\n"
+        f"index = near_duplicates.NearDuplicateIndex({str(tmp_path / 'index.sqlite')!r})\n"
+        f"index.check('a', {CAPTION!r})\n"
+        "print(sorted(m for m in ('generate_embeddings', 'embedding_cache', 'similarity_index', 'openai')"
+        " if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=ML_DIR, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip().splitlines()[-1] == "[]"
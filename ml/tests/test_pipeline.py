@@ -0,0 +1,41 @@
+"""
+The pipeline's train stage (pipeline.run_train).
+"""
+
+import pytest
+
+import model_artifact
+import pipeline
+import synthetic_data
+import train_model
+from feature_pipeline import EMBEDDING_DIM
+
+@pytest.fixture
+def labeled_table(isolated):
+    posts = synthetic_data.generate_posts(300, seed=7)
+    embeddings = synthetic_data.generate_embeddings(len(posts), dim=EMBEDDING_DIM, seed=7)
+    synthetic_data.load_sqlite(posts, embeddings, str(isolated / "engagement.sqlite3"))
+
+@pytest.mark.parametrize("reducer", ["random", "pca"])
+def test_retrain_keeps_reduced_embedding(labeled_table, tmp_path, reducer):
+    train_model.train_model(embedding_dim=16, reducer=reducer, model_format="json")
+    first = model_artifact.load_metadata()
+    assert first["embedding"] == {"source_dim": EMBEDDING_DIM, "dim": 16, "reducer": reducer}
+
+    state = pipeline.PipelineState(str(tmp_path / "state.json"))
+    assert pipeline.run_train(state, min_new_labels=0, retrain=True, use_snapshot=False, rounds=5,
+                              featurizer="openai", model_format="json")
+    retrained = model_artifact.load_metadata()
+    assert retrained["embedding"] == first["embedding"]
+    assert retrained["n_features"] == first["n_features"]
+
+def test_retrain_settings():
+    embedding = {"source_dim": EMBEDDING_DIM, "dim": EMBEDDING_DIM, "reducer": None}
+    assert pipeline.retrain_settings({"embedding": embedding}) == \
+        {"featurizer": "openai", "embedding_dim": None, "reducer": "truncate"}
+    assert pipeline.retrain_settings({"caption_featurizer": {"method": "hashing", "dim": 64}}) == \
+        {"featurizer": "hashing", "embedding_dim": 64}
+    # Embeddings stored at another native size than the one configured now
+    with pytest.raises(ValueError, match="EMBEDDING_DIMENSIONS"):
+        pipeline.retrain_settings({"embedding": {"source_dim": EMBEDDING_DIM // 2, "dim": 16,
+                                                 "reducer": "pca"}})
@@ -0,0 +1,58 @@
+"""
+Status codes of the online scoring server (predict.py serve).
+"""
+
+import json
+import threading
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from predict import make_handler
+
+class FixedScorer:
+    """Scores every post 1.5, or raises when a post asks it to."""
+
+    predictor = SimpleNamespace(version="test")
+
+    def score(self, posts):
+        if any(post.get("fail") for post in posts):
+            raise RuntimeError("booster exploded")
+        return [1.5] * len(posts)
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(FixedScorer()))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+def post(address, body) -> tuple:
+    conn = HTTPConnection(*address, timeout=5)
+    conn.request("POST", "/predict", body=body if isinstance(body, bytes) else json.dumps(body).encode("utf-8"),
+                 headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    return response.status, payload
+
+def test_scores_posts(server):
+    status, payload = post(server, {"posts": [{"caption": "a"}, {"caption": "b"}]})
+    assert status == 200
+    assert payload["predictions"] == [1.5, 1.5]
+    assert post(server, {"post": {"caption": "a"}})[1]["predictions"] == [1.5]
+
+@pytest.mark.parametrize("body", [b"{not json", {}, [], {"posts": "x"}, {"posts": [1, 2]}, {"post": None}])
+def test_malformed_requests_are_400(server, body):
+    status, payload = post(server, body)
+    assert status == 400
+    assert payload["error"]
+
+def test_scoring_failures_are_500(server):
+    status, payload = post(server, {"post": {"fail": True}})
+    assert status == 500
+    assert "booster exploded" in payload["error"]
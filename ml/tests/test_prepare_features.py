@@ -0,0 +1,189 @@
+"""
+Parity between the vectorized feature builder and the original iterrows one.
+
+reference_features is the row-by-row prepare_features from before the
+vectorized rewrite, verbatim except that it takes the vocabularies as an
+optional argument (to check unseen categories), sizes the empty embedding
+with EMBEDDING_DIM instead of a literal 1536 and leaves out the vocabulary
+prints. It still tests embeddings with `if embedding:` and returns the
+float64 np.array(features); expected() casts that to float32, the dtype
+the model is trained on, so the vectorized matrix must match the cast
+values exactly. The vectorized path is compared with unknown_bucket=False,
+the layout the original builder produced.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from feature_pipeline import EMBEDDING_DIM, FeatureTransformer, split_comma_separated
+from train_model import prepare_features
+
+def reference_features(df, vocabularies=None):
+    """The original iterrows prepare_features: (X, themes, tones, colors)."""
+    features = []
+    
+    if vocabularies is None:
+        # Collect all unique values for theme, tone, and color
+        all_themes = set()
+        all_tones = set()
+        all_colors = set()
+        
+        for _, row in df.iterrows():
+            themes = split_comma_separated(row.get('theme'))
+            tones = split_comma_separated(row.get('tone'))
+            colors = split_comma_separated(row.get('dominant_color'))
+            
+            all_themes.update(themes)
+            all_tones.update(tones)
+            all_colors.update(colors)
+        
+        # Convert to sorted lists for consistent ordering
+        all_themes = sorted(list(all_themes))
+        all_tones = sorted(list(all_tones))
+        all_colors = sorted(list(all_colors))
+    else:
+        all_themes, all_tones, all_colors = vocabularies
+    
+    for _, row in df.iterrows():
+        feature_vector = []
+        
+        # 1. Caption embedding (1536 dimensions for text-embedding-3-small)
+        embedding = row.get('caption_embedding')
+        if embedding:
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            feature_vector.extend(embedding)
+        else:
+            feature_vector.extend([0.0] * EMBEDDING_DIM)
+        
+        # 2. Numerical features
+        feature_vector.append(float(row.get('likes_count', 0)))
+        feature_vector.append(float(row.get('comments_count', 0)))
+        feature_vector.append(float(row.get('views_count', 0) or 0))
+        # Followers field is named 'followers' in the table; fall back if older name exists
+        follower_val = row.get('followers')
+        if follower_val is None:
+            follower_val = row.get('followers_count', 0)
+        feature_vector.append(float(follower_val or 0))
+        
+        # 3. Post type (one-hot encoded)
+        post_type = row.get('post_type', 'image')
+        post_types = ['reel', 'video', 'image', 'carousel']
+        for pt in post_types:
+            feature_vector.append(1.0 if post_type == pt else 0.0)
+        
+        # 4. Theme (multi-hot encoding for comma-separated values)
+        themes = split_comma_separated(row.get('theme'))
+        for theme in all_themes:
+            feature_vector.append(1.0 if theme in themes else 0.0)
+        
+        # 5. Tone (multi-hot encoding for comma-separated values)
+        tones = split_comma_separated(row.get('tone'))
+        for tone in all_tones:
+            feature_vector.append(1.0 if tone in tones else 0.0)
+        
+        # 6. Color (multi-hot encoding for comma-separated values)
+        colors = split_comma_separated(row.get('dominant_color'))
+        for color in all_colors:
+            feature_vector.append(1.0 if color in colors else 0.0)
+        
+        # 7. Boolean features
+        feature_vector.append(1.0 if row.get('cta_present', False) else 0.0)
+        feature_vector.append(1.0 if row.get('paid', False) else 0.0)
+        
+        # 8. Posting hour (if available)
+        posting_time = row.get('posting_time')
+        if posting_time:
+            try:
+                hour = int(str(posting_time).split(':')[0])
+                feature_vector.append(hour / 24.0)
+            except:
+                feature_vector.append(0.5)
+        else:
+            feature_vector.append(0.5)
+        
+        # 9. Language (one-hot)
+        language = row.get('language', 'English')
+        languages = ['English', 'Hindi', 'Bengali', 'Hinglish', 'Other']
+        for lang in languages:
+            feature_vector.append(1.0 if language == lang else 0.0)
+        
+        features.append(feature_vector)
+    
+    return np.array(features), all_themes, all_tones, all_colors
+
+def expected(df, vocabularies=None) -> np.ndarray:
+    """The reference matrix in the model's float32."""
+    X, *_ = reference_features(df, vocabularies)
+    assert X.dtype == np.float64
+    return X.astype(np.float32)
+
+def vectorized(df, transformer=None):
+    transformer = transformer or FeatureTransformer(unknown_bucket=False).fit(df)
+    return transformer.transform(df), transformer
+
+def test_vocabularies_match_reference(sample_posts):
+    df = sample_posts()
+    _, themes, tones, colors = reference_features(df)
+    _, transformer = prepare_features(df)
+    assert transformer.themes == themes
+    assert transformer.tones == tones
+    assert transformer.colors == colors
+
+def test_matrix_matches_reference(sample_posts):
+    df = sample_posts()
+    reference = expected(df)
+    X, transformer = vectorized(df)
+    assert X.shape == reference.shape == (len(df), transformer.n_features)
+    np.testing.assert_array_equal(X, reference)
+
+def test_column_order_matches_reference(sample_posts):
+    df = sample_posts()
+    _, themes, tones, colors = reference_features(df)
+    _, transformer = vectorized(df)
+    names = transformer.feature_names()
+    tabular = names[transformer.embedding_features:]
+    assert tabular == (
+        ["likes_count", "comments_count", "views_count", "followers"]
+        + [f"post_type={v}" for v in ["reel", "video", "image", "carousel"]]
+        + [f"theme={v}" for v in themes] + [f"tone={v}" for v in tones]
+        + [f"dominant_color={v}" for v in colors]
+        + ["cta_present", "paid", "posting_hour"]
+        + [f"language={v}" for v in ["English", "Hindi", "Bengali", "Hinglish", "Other"]]
+    )
+
+def test_unseen_categories_are_dropped_like_reference(sample_posts):
+    train = sample_posts(40, seed=1)
+    scored = sample_posts(20, seed=2, themes=("festive", "streetwear", "vintage"))
+    _, themes, tones, colors = reference_features(train)
+    X, _ = vectorized(scored, FeatureTransformer(unknown_bucket=False).fit(train))
+    np.testing.assert_array_equal(X, expected(scored, (themes, tones, colors)))
+
+def test_empty_multi_hot_strings_set_no_columns(sample_posts):
+    df = sample_posts(8)
+    df["theme"] = ["", " , ", None, ",,", "", None, " ", ""]
+    X, transformer = vectorized(df)
+    assert transformer.themes == []
+    np.testing.assert_array_equal(X, expected(df))
+
+@pytest.mark.parametrize("missing", [None, float("nan")])
+def test_missing_embedding_is_all_zero(sample_posts, missing):
+    df = sample_posts(8)
+    df["caption_embedding"] = df["caption_embedding"].astype(object)
+    df.at[0, "caption_embedding"] = missing
+    X, transformer = vectorized(df)
+    assert not X[0, :transformer.embedding_features].any()
+
+def test_nan_metrics_become_zero(sample_posts):
+    # The documented difference from the original: NaN views/followers
+    # (pandas' missing value in numeric columns) count as 0, not NaN
+    df = sample_posts(8)
+    df["views_count"] = np.nan
+    df["followers"] = np.nan
+    df["followers_count"] = np.nan
+    X, transformer = vectorized(df)
+    dim = transformer.embedding_features
+    assert not X[:, dim + 2:dim + 4].any()
+    assert not np.isnan(X).any()
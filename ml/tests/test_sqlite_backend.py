@@ -0,0 +1,46 @@
+"""
+SQLiteClient: the score trigger and what writes return.
+"""
+
+import pytest
+
+from sqlite_backend import SQLiteAPIError, calculate_engagement_score
+from storage import get_client
+
+def table():
+    return get_client().table("engagement_training_data")
+
+def test_trigger_scores_inserted_and_updated_rows():
+    inserted = table().insert([
+        {"post_url": "a", "post_type": "reel", "likes_count": 120, "comments_count": 8, "views_count": 4000,
+         "followers": 9000, "is_labeled": True},
+        {"post_url": "b", "post_type": "image", "likes_count": 40, "comments_count": 2, "followers": 3000},
+    ]).execute().data
+    # Rows come back as stored: trigger-computed columns and defaults included
+    assert [row["post_url"] for row in inserted] == ["a", "b"]
+    assert inserted[0]["engagement_score"] == calculate_engagement_score(120, 8, 4000, "reel", 9000, None)
+    assert inserted[1]["engagement_score"] == calculate_engagement_score(40, 2, None, "image", 3000, None)
+    assert inserted[0]["engagement_score"] > 0
+    assert inserted[0]["labeled_at"] is not None and inserted[1]["labeled_at"] is None
+    assert inserted[1]["has_prediction"] is False
+    assert inserted == table().select("*").order("post_url").execute().data
+
+    table().update({"likes_count": 600}).eq("post_url", "a").execute()
+    stored = table().select("engagement_score").eq("post_url", "a").execute().data[0]
+    assert stored["engagement_score"] == calculate_engagement_score(600, 8, 4000, "reel", 9000, None)
+
+def test_upsert_returns_stored_rows():
+    row = table().insert({"post_url": "a", "post_type": "image", "likes_count": 10}).execute().data[0]
+    upserted = table().upsert([{"id": "new", "post_url": "b", "post_type": "image", "likes_count": 5},
+                               {"id": row["id"], "post_url": "a", "post_type": "image", "likes_count": 90}]) \
+        .execute().data
+    assert [r["post_url"] for r in upserted] == ["b", "a"]
+    assert upserted[1]["created_at"] == row["created_at"]
+    assert upserted[1]["engagement_score"] == calculate_engagement_score(90, 0, None, "image", None, None)
+    assert upserted[1]["engagement_score"] != row["engagement_score"]
+
+def test_duplicate_post_url_fails_and_inserts_nothing():
+    table().insert({"post_url": "a", "post_type": "image"}).execute()
+    with pytest.raises(SQLiteAPIError):
+        table().insert([{"post_url": "b", "post_type": "image"}, {"post_url": "a", "post_type": "image"}]).execute()
+    assert [row["post_url"] for row in table().select("post_url").execute().data] == ["a"]
@@ -0,0 +1,80 @@
+"""
+Streamed training's id-hashed holdout and page sources.
+"""
+
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import streaming_training
+import synthetic_data
+from feature_pipeline import EMBEDDING_DIM, FeatureTransformer
+from storage import get_client
+from streaming_training import HOLDOUT_BUCKETS, RunningMetrics, SnapshotPages, SupabasePages, holdout_mask
+
+def test_holdout_share_is_about_one_in_buckets():
+    ids = [str(uuid.UUID(int=i * 7919 + 1)) for i in range(5000)]
+    share = holdout_mask(ids).mean()
+    assert abs(share - 1 / HOLDOUT_BUCKETS) < 0.02
+
+def test_holdout_is_stable_per_id():
+    ids = [str(uuid.UUID(int=i)) for i in range(500)]
+    mask = holdout_mask(ids)
+    # Same verdict whatever the order or batch the id arrives in
+    shuffled = np.random.default_rng(0).permutation(len(ids))
+    np.testing.assert_array_equal(holdout_mask([ids[i] for i in shuffled]), mask[shuffled])
+    np.testing.assert_array_equal(np.concatenate([holdout_mask(ids[:123]), holdout_mask(ids[123:])]), mask)
+    np.testing.assert_array_equal(holdout_mask(pd.Series(ids)), mask)
+    assert holdout_mask([]).shape == (0,)
+
+@pytest.mark.parametrize("page_size", [1, 7, 1000])
+def test_snapshot_pages_agree_on_holdout(page_size):
+    posts = synthetic_data.generate_posts(60, seed=3)
+    embeddings = np.zeros((len(posts), 4), dtype=np.float32)
+    pages = list(SnapshotPages(posts, embeddings, page_size).pages())
+    assert sum(len(page) for page, _ in pages) == len(posts)
+    assert all(len(page) == len(page_embeddings) for page, page_embeddings in pages)
+    masks = np.concatenate([holdout_mask(page["id"]) for page, _ in pages])
+    np.testing.assert_array_equal(masks, holdout_mask(posts["id"]))
+
+@pytest.fixture
+def labeled_table(isolated):
+    posts = synthetic_data.generate_posts(40, seed=5)
+    embeddings = synthetic_data.generate_embeddings(len(posts), dim=EMBEDDING_DIM, seed=5)
+    synthetic_data.load_sqlite(posts, embeddings, str(isolated / "engagement.sqlite3"))
+    return posts, embeddings
+
+def test_database_pages_split_like_the_table(labeled_table):
+    posts, _ = labeled_table
+    source = SupabasePages(get_client(), page_size=7, dim=EMBEDDING_DIM)
+    seen = []
+    for page, page_embeddings in source.pages():
+        assert page_embeddings.shape == (len(page), EMBEDDING_DIM)
+        assert page_embeddings.any(axis=1).all()
+        seen.extend(zip(page["id"].astype(str), holdout_mask(page["id"])))
+    expected = dict(zip(posts["id"].astype(str), holdout_mask(posts["id"])))
+    assert dict(seen) == expected
+    assert len(seen) == len(expected)
+
+def test_scan_fits_vocabularies_across_pages(labeled_table):
+    posts, _ = labeled_table
+    transformer = FeatureTransformer()
+    scanned = streaming_training.scan(SupabasePages(get_client(), page_size=6, dim=EMBEDDING_DIM), transformer)
+    reference = FeatureTransformer().fit(posts)
+    assert scanned["rows"] == len(posts)
+    assert (transformer.themes, transformer.tones, transformer.colors) == \
+        (reference.themes, reference.tones, reference.colors)
+
+def test_running_metrics_match_whole_array():
+    rng = np.random.default_rng(1)
+    y, predictions = rng.normal(50, 10, 300), rng.normal(50, 10, 300)
+    metrics = RunningMetrics()
+    for start in range(0, 300, 37):
+        metrics.add(y[start:start + 37], predictions[start:start + 37])
+    assert metrics.n == 300
+    assert metrics.mae == pytest.approx(np.abs(y - predictions).mean())
+    r2 = 1 - ((y - predictions) ** 2).sum() / ((y - y.mean()) ** 2).sum()
+    assert metrics.r2 == pytest.approx(r2)
+    assert np.isnan(RunningMetrics().mae)
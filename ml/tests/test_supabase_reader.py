@@ -0,0 +1,31 @@
+"""
+Keyset page readers.
+"""
+
+import pytest
+
+from storage import get_client
+from supabase_reader import iter_pages, iter_pages_by
+
+def insert(rows):
+    get_client().table("engagement_training_data").insert(
+        [{"post_type": "image", **row} for row in rows]).execute()
+
+def query():
+    return get_client().table("engagement_training_data").select("id, post_url, created_at")
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 100])
+def test_pages_by_created_at_then_id(page_size):
+    stamps = ["2024-11-02T10:00:00+00:00", "2024-11-01T10:00:00+00:00", "2024-11-02T10:00:00+00:00",
+              "2024-11-02T10:00:00+00:00", "2024-11-03T09:30:00.5+00:00"]
+    insert([{"id": f"{i:02d}", "post_url": f"u{i}", "created_at": stamp} for i, stamp in enumerate(stamps)])
+    # created_at is stamped on insert when missing, so clear one to check nulls come first
+    get_client().table("engagement_training_data").update({"created_at": None}).eq("id", "04").execute()
+
+    pages = list(iter_pages_by(query, "created_at", page_size))
+    assert all(len(page) <= page_size for page in pages)
+    assert [row["id"] for page in pages for row in page] == ["04", "01", "00", "02", "03"]
+
+def test_pages_by_id_resume():
+    insert([{"id": f"{i:02d}", "post_url": f"u{i}"} for i in range(5)])
+    assert [row["id"] for page in iter_pages(query, 2, after_id="01") for row in page] == ["02", "03", "04"]
@@ -2,36 +2,64 @@
 """
 Train engagement prediction model.
 Supports comma-separated values for theme, tone, and color.
-Run this weekly after adding new labeled data.
+Run this weekly after adding new labeled data, or with --incremental to
+continue the latest model on posts labeled since it was trained.
 """
 
 import os
 import sys
 import json
+import argparse
+import tempfile
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, r2_score, mean_squared_error
-import xgboost as xgb
-import joblib
-from datetime import datetime
+from feature_pipeline import EMBEDDING_DIM, MULTI_HOT_COLUMNS, FeatureTransformer
+from embedding_codec import BINARY_COLUMN, coalesce_embedding_columns, decode_embeddings, has_embedding_filter
+from embedding_reducer import REDUCERS, EmbeddingReducer
+from caption_featurizer import FEATURIZERS, CaptionFeaturizer
+from feature_store import FeatureSnapshot
+import hyperparameter_search
+import instrumentation
+import lean_training
+import model_artifact
+import segmented_training
+import storage
+import streaming_training
+from storage import get_client, has_column
+from near_duplicates import COPY_COLUMN
+from datetime import datetime, timezone
 
 load_dotenv()
 
-supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+DEFAULT_MODEL_PARAMS = {
+    "n_estimators": 300,
+    "max_depth": 4,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "min_child_weight": 1.0,
+    "reg_lambda": 1.0,
+}
+INCREMENTAL_ROUNDS = 50
+MIN_INCREMENTAL_ROWS = 20
+METADATA_PATH = model_artifact.METADATA_PATH
+TRANSFORMER_PATH = model_artifact.TRANSFORMER_PATH
 
-if not supabase_url or not supabase_key:
-    print("❌ Supabase credentials not found")
-    sys.exit(1)
+def image_score_range(df):
+    """(min, max) raw engagement score of images/carousels, or None."""
+    image_mask = df['post_type'].isin(['image', 'carousel'])
+    raw_scores = pd.to_numeric(df.loc[image_mask, 'engagement_score'], errors='coerce')
+    if raw_scores.isna().all():
+        return None
+    return float(raw_scores.min()), float(raw_scores.max())
 
-supabase: Client = create_client(supabase_url, supabase_key)
+def normalize_engagement_scores(df, score_range=None, verbose: bool = True):
+    """Normalize engagement scores for images/carousels (0-100 scale).
 
-def normalize_engagement_scores(df):
-    """Normalize engagement scores for images/carousels (0-100 scale)."""
+    score_range: (min, max) to scale with, e.g. the range saved with the
+    model being continued; taken from df when omitted.
+    """
     # Videos/reels already normalized (0-100)
     # Images/carousels need normalization
     
@@ -44,237 +72,782 @@ def normalize_engagement_scores(df):
     if raw_scores.empty or raw_scores.isna().all():
         return df
     
-    min_score = raw_scores.min()
-    max_score = raw_scores.max()
+    min_score, max_score = score_range or image_score_range(df)
     
     if max_score > min_score:
         normalized = ((raw_scores - min_score) / (max_score - min_score)) * 100
         df.loc[image_mask, 'engagement_score'] = normalized
-        print(f"   📊 Image normalization: min={min_score:.2f}, max={max_score:.2f}")
+        if verbose:
+            print(f"   📊 Image normalization: min={min_score:.2f}, max={max_score:.2f}")
     
     return df
 
-def split_comma_separated(value):
-    """Split comma-separated string into list of values."""
-    if not value or pd.isna(value):
-        return []
-    if isinstance(value, str):
-        return [v.strip() for v in value.split(',') if v.strip()]
-    return []
+def prepare_features(df, embeddings=None, transformer: FeatureTransformer = None,
+                     embedding_dim: int = None, reducer: str = "truncate", featurizer: str = "openai"):
+    """Prepare feature matrix from training data.
 
-def prepare_features(df):
-    """Prepare feature matrix from training data."""
-    features = []
-    
-    # Collect all unique values for theme, tone, and color
-    all_themes = set()
-    all_tones = set()
-    all_colors = set()
-    
-    for _, row in df.iterrows():
-        themes = split_comma_separated(row.get('theme'))
-        tones = split_comma_separated(row.get('tone'))
-        colors = split_comma_separated(row.get('dominant_color'))
-        
-        all_themes.update(themes)
-        all_tones.update(tones)
-        all_colors.update(colors)
+    Fits a FeatureTransformer on df unless a fitted one is given, and returns
+    (X, transformer). embeddings: already-decoded (len(df), EMBEDDING_DIM)
+    matrix, e.g. from a feature snapshot. embedding_dim: shrink the embedding
+    block to this many columns with the given reducer. featurizer: a local
+    caption featurizer (see caption_featurizer.py) to use instead of the
+    stored embeddings; embeddings are then ignored.
+    """
+    local = featurizer != "openai" or (transformer is not None and not transformer.uses_stored_embeddings)
+    if embeddings is None and not local:
+        # Decode once; the reducer fit and the transform both need them
+        embeddings = decode_embeddings(coalesce_embedding_columns(df), EMBEDDING_DIM)
+    
+    if transformer is None:
+        transformer = fit_transformer(df, embeddings, embedding_dim, reducer, featurizer)
+    
+    if local:
+        embeddings = transformer.caption_features(df)
+    return transformer.transform(df, embeddings[:]), transformer
+
+def fit_transformer(df, embeddings, embedding_dim: int = None, reducer: str = "truncate",
+                    featurizer: str = "openai"):
+    """Fit the feature layout (and embedding reducer or caption featurizer, if any) on the training rows."""
+    if featurizer != "openai":
+        # embedding_dim sizes the featurizer's output instead of a reduction
+        caption_featurizer = CaptionFeaturizer(featurizer, embedding_dim)
+        print(f"   🔤 Featurizing captions locally: {featurizer} -> {caption_featurizer.dim} dims")
+        transformer = FeatureTransformer(featurizer=caption_featurizer).fit(df)
+    else:
+        embedding_reducer = None
+        if embedding_dim and embedding_dim < EMBEDDING_DIM:
+            embedding_reducer = EmbeddingReducer(reducer, embedding_dim, EMBEDDING_DIM)
+            print(f"   📐 Reducing embeddings {EMBEDDING_DIM} -> {embedding_dim} ({reducer})")
+        transformer = FeatureTransformer(reducer=embedding_reducer).fit(df, embeddings)
+    
+    print(f"   📋 Found {len(transformer.themes)} unique themes: {transformer.themes[:10]}...")
+    print(f"   📋 Found {len(transformer.tones)} unique tones: {transformer.tones[:10]}...")
+    print(f"   📋 Found {len(transformer.colors)} unique colors: {transformer.colors[:10]}...")
+    return transformer
+
+def labeled_rows_query(labeled_since: str = None, require_embeddings: bool = True,
+                       columns: str = "*", count: str = None):
+    """Labeled rows (with embeddings, unless not required), labeled after labeled_since.
+
+    Flagged near-duplicates (near_duplicate_of set) are left out.
+    """
+    query = get_client().table("engagement_training_data") \
+        .select(columns, count=count) \
+        .eq("is_labeled", True)
+    if has_column("engagement_training_data", COPY_COLUMN):
+        query = query.is_(COPY_COLUMN, "null")
+    if require_embeddings:
+        query = query.or_(has_embedding_filter(has_column("engagement_training_data", BINARY_COLUMN)))
+    if labeled_since:
+        query = query.gt("labeled_at", labeled_since)
+    return query
+
+def fetch_training_data(labeled_since: str = None, require_embeddings: bool = True):
+    """Fetch labeled rows (with embeddings, unless not required) straight from Supabase."""
+    response = labeled_rows_query(labeled_since, require_embeddings).execute()
+    instrumentation.count("api_calls")
+    instrumentation.count("rows_fetched", len(response.data or []))
     
-    # Convert to sorted lists for consistent ordering
-    all_themes = sorted(list(all_themes))
-    all_tones = sorted(list(all_tones))
-    all_colors = sorted(list(all_colors))
+    return pd.DataFrame(response.data or []), None
+
+def load_snapshot_training_data(offline: bool = False, full_sync: bool = False, lazy: bool = False,
+                                require_embeddings: bool = True):
+    """Sync the local feature snapshot (unless offline) and select labeled rows.
+
+    lazy: return the embeddings as a RowSubset of the memory-mapped matrix
+    instead of reading them into RAM. require_embeddings: skip labeled rows
+    without an embedding (a local caption featurizer needs only the caption).
+    Flagged near-duplicates are left out.
+    """
+    snapshot = FeatureSnapshot(dim=EMBEDDING_DIM)
+    
+    if not offline:
+        with instrumentation.stage("snapshot_sync"):
+            fetched = snapshot.sync(get_client(), full=full_sync)
+        print(f"   🔄 Snapshot sync: {fetched} changed rows")
+    elif not snapshot.exists():
+        print(f"❌ No feature snapshot at {snapshot.path}; run once without --offline")
+        sys.exit(1)
     
-    print(f"   📋 Found {len(all_themes)} unique themes: {all_themes[:10]}...")
-    print(f"   📋 Found {len(all_tones)} unique tones: {all_tones[:10]}...")
-    print(f"   📋 Found {len(all_colors)} unique colors: {all_colors[:10]}...")
+    rows, embeddings = snapshot.load()
+    labeled = rows["is_labeled"].where(rows["is_labeled"].notna(), False).astype(bool)
+    if COPY_COLUMN in rows.columns:
+        labeled &= rows[COPY_COLUMN].isna()
+    if require_embeddings:
+        labeled &= rows["has_embedding"].astype(bool)
+    mask = labeled.to_numpy()
+    
+    df = rows[mask].reset_index(drop=True)
+    subset = lean_training.RowSubset(embeddings, np.nonzero(mask)[0])
+    return df, (subset if lazy else subset[:])
+
+def train_model(use_snapshot: bool = False, offline: bool = False, full_sync: bool = False,
+                tune: bool = False, trials: int = hyperparameter_search.DEFAULT_TRIALS,
+                folds: int = hyperparameter_search.DEFAULT_FOLDS, workers: int = None,
+                embedding_dim: int = None, reducer: str = "truncate", lean: bool = False,
+                memory_budget_mb: int = lean_training.DEFAULT_MEMORY_BUDGET_MB,
+                featurizer: str = "openai", model_format: str = model_artifact.MODEL_FORMAT,
+                segment_by: tuple = (), min_segment_rows: int = segmented_training.DEFAULT_MIN_SEGMENT_ROWS):
+    """Train the engagement prediction model.
+
+    lean: keep features as a dense float32 embedding block plus a sparse
+    tabular block and train from row chunks; chosen automatically when the
+    dense matrix would exceed memory_budget_mb. featurizer: build the
+    caption block from caption text with a local featurizer instead of the
+    stored OpenAI embeddings. segment_by: also train per-segment models keyed
+    by these columns (see segmented_training.py); dense path only.
+    """
+    import xgboost as xgb
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error, r2_score
+    
+    local = featurizer != "openai"
+    print("🔍 Fetching labeled training data...")
     
-    for _, row in df.iterrows():
-        feature_vector = []
-        
-        # 1. Caption embedding (1536 dimensions for text-embedding-3-small)
-        embedding = row.get('caption_embedding')
-        if embedding:
-            if isinstance(embedding, str):
-                embedding = json.loads(embedding)
-            feature_vector.extend(embedding)
+    with instrumentation.stage("fetch"):
+        if use_snapshot or offline:
+            # Embeddings stay memory-mapped until the dense path needs them
+            df, embeddings = load_snapshot_training_data(offline, full_sync, lazy=True,
+                                                         require_embeddings=not local)
         else:
-            feature_vector.extend([0.0] * 1536)
+            df, embeddings = fetch_training_data(require_embeddings=not local)
+    
+    if len(df) == 0:
+        print(f"❌ No labeled data{'' if local else ' with embeddings'} found!")
+        print("   Please:")
+        print("   1. Import posts and label them")
+        if not local:
+            print("   2. Run generate_embeddings.py (or train with a local --featurizer)")
+        sys.exit(1)
+    
+    print(f"   ✅ Found {len(df)} labeled posts{'' if local else ' with embeddings'}")
+    
+    # Normalize engagement scores
+    score_range = image_score_range(df)
+    df = normalize_engagement_scores(df, score_range)
+    
+    # Prepare features
+    print("🔧 Preparing features...")
+    with instrumentation.stage("prepare_features"):
+        if local:
+            transformer = fit_transformer(df, None, embedding_dim, reducer, featurizer)
+            # The featurized captions take the embeddings' place from here on
+            with instrumentation.stage("featurize_captions"):
+                embeddings = transformer.caption_features(df)
+        else:
+            if embeddings is None:
+                with instrumentation.stage("decode_embeddings"):
+                    embeddings = decode_embeddings(coalesce_embedding_columns(df), EMBEDDING_DIM)
+            transformer = fit_transformer(df, embeddings, embedding_dim, reducer)
+    y = df['engagement_score'].to_numpy(dtype=np.float64)
+    
+    dense_mb = lean_training.dense_nbytes(len(df), transformer.n_features) / 1e6
+    if not lean and dense_mb > memory_budget_mb:
+        print(f"   💾 Dense features need ~{dense_mb:.0f} MB (budget {memory_budget_mb} MB), "
+              f"switching to the lean path")
+        lean = True
+    if lean and segment_by:
+        print("   ⚠️  Segment models need the dense feature matrix; training the global model only")
+        segment_by = ()
+    
+    params = dict(DEFAULT_MODEL_PARAMS)
+    search_result = None
+    segments = None
+    
+    if lean:
+        chunk_rows = lean_training.chunk_rows_for(transformer.n_features, memory_budget_mb)
+        with instrumentation.stage("prepare_features"):
+            blocks = lean_training.FeatureBlocks.build(transformer, df, embeddings, chunk_rows)
+            rows = blocks.valid_rows(y, chunk_rows)
         
-        # 2. Numerical features
-        feature_vector.append(float(row.get('likes_count', 0)))
-        feature_vector.append(float(row.get('comments_count', 0)))
-        feature_vector.append(float(row.get('views_count', 0) or 0))
-        # Followers field is named 'followers' in the table; fall back if older name exists
-        follower_val = row.get('followers')
-        if follower_val is None:
-            follower_val = row.get('followers_count', 0)
-        feature_vector.append(float(follower_val or 0))
+        if len(rows) == 0:
+            print("❌ No valid data after cleaning!")
+            sys.exit(1)
         
-        # 3. Post type (one-hot encoded)
-        post_type = row.get('post_type', 'image')
-        post_types = ['reel', 'video', 'image', 'carousel']
-        for pt in post_types:
-            feature_vector.append(1.0 if post_type == pt else 0.0)
+        feature_mb = blocks.nbytes / 1e6
+        print(f"   ✅ Feature blocks: {len(rows)} x {blocks.n_features} "
+              f"({feature_mb:.1f} MB in RAM vs ~{dense_mb:.0f} MB dense, {chunk_rows} rows per chunk)")
         
-        # 4. Theme (multi-hot encoding for comma-separated values)
-        themes = split_comma_separated(row.get('theme'))
-        for theme in all_themes:
-            feature_vector.append(1.0 if theme in themes else 0.0)
+        # Same split as the dense path: positions among the valid rows
+        train_rows, test_rows = train_test_split(rows, test_size=0.2, random_state=42)
         
-        # 5. Tone (multi-hot encoding for comma-separated values)
-        tones = split_comma_separated(row.get('tone'))
-        for tone in all_tones:
-            feature_vector.append(1.0 if tone in tones else 0.0)
+        if tune:
+            # The search needs a dense matrix; tune on a sample that fits the budget
+            budget_rows = int(memory_budget_mb * 1e6 / 2 / lean_training.dense_nbytes(1, blocks.n_features))
+            sample = train_rows
+            if len(sample) > budget_rows:
+                sample = np.random.default_rng(42).choice(train_rows, budget_rows, replace=False)
+                print(f"   🔬 Tuning on a {budget_rows}-row sample of the training split")
+            sample = np.sort(sample)
+            with instrumentation.stage("tune"):
+                search_result = hyperparameter_search.search(
+                    blocks.dense(sample), y[sample], trials=trials, folds=folds, workers=workers
+                )
+            params.update(search_result["best_params"])
         
-        # 6. Color (multi-hot encoding for comma-separated values)
-        colors = split_comma_separated(row.get('dominant_color'))
-        for color in all_colors:
-            feature_vector.append(1.0 if color in colors else 0.0)
+        print("🎯 Training XGBoost model (lean, chunked QuantileDMatrix)...")
         
-        # 7. Boolean features
-        feature_vector.append(1.0 if row.get('cta_present', False) else 0.0)
-        feature_vector.append(1.0 if row.get('paid', False) else 0.0)
+        train_batches = blocks.batches(train_rows, y, chunk_rows)
+        test_batches = blocks.batches(test_rows, y, chunk_rows)
+        with instrumentation.stage("fit"):
+            model = lean_training.train_regressor(params, train_batches)
         
-        # 8. Posting hour (if available)
-        posting_time = row.get('posting_time')
-        if posting_time:
-            try:
-                hour = int(str(posting_time).split(':')[0])
-                feature_vector.append(hour / 24.0)
-            except:
-                feature_vector.append(0.5)
-        else:
-            feature_vector.append(0.5)
+        # batches() yields rows in sorted order
+        y_train = y[np.sort(train_rows)]
+        y_test = y[np.sort(test_rows)]
+        with instrumentation.stage("evaluate"):
+            y_pred_train = lean_training.predict_batches(model, train_batches)
+            y_pred_test = lean_training.predict_batches(model, test_batches)
+        n_samples, n_features = len(rows), blocks.n_features
+    else:
+        with instrumentation.stage("prepare_features"):
+            X = transformer.transform(df, embeddings[:])
+        
+        # Remove NaN values
+        valid_mask = ~(np.isnan(y) | np.isnan(X).any(axis=1))
+        X = X[valid_mask]
+        y = y[valid_mask]
+        
+        if len(X) == 0:
+            print("❌ No valid data after cleaning!")
+            sys.exit(1)
+        
+        feature_mb = X.nbytes / 1e6
+        print(f"   ✅ Feature matrix shape: {X.shape} ({feature_mb:.1f} MB)")
+        print(f"   ✅ Target vector shape: {y.shape}")
+        
+        # Split data
+        X_train, X_test, y_train, y_test, train_idx, test_idx = train_test_split(
+            X, y, np.arange(len(X)), test_size=0.2, random_state=42
+        )
         
-        # 9. Language (one-hot)
-        language = row.get('language', 'English')
-        languages = ['English', 'Hindi', 'Bengali', 'Hinglish', 'Other']
-        for lang in languages:
-            feature_vector.append(1.0 if language == lang else 0.0)
+        if tune:
+            # Search on the training split only; the test split stays a holdout
+            with instrumentation.stage("tune"):
+                search_result = hyperparameter_search.search(
+                    X_train, y_train, trials=trials, folds=folds, workers=workers
+                )
+            params.update(search_result["best_params"])
         
-        features.append(feature_vector)
+        print("🎯 Training XGBoost model...")
+        
+        # Train model
+        model = xgb.XGBRegressor(**params, random_state=42, n_jobs=-1)
+        
+        with instrumentation.stage("fit"):
+            model.fit(X_train, y_train)
+        
+        # Evaluate
+        with instrumentation.stage("evaluate"):
+            y_pred_train = model.predict(X_train)
+            y_pred_test = model.predict(X_test)
+        n_samples, n_features = X.shape
+        
+        if segment_by:
+            labels = segmented_training.segment_labels(df, segment_by)[valid_mask]
+            with instrumentation.stage("fit_segments"):
+                segment_boosters, segment_metrics = segmented_training.train_segments(
+                    X, y, labels, train_idx, test_idx, params, y_pred_test, min_rows=min_segment_rows
+                )
+            routed = segmented_training.route_predictions(
+                X_test, labels[test_idx], model.get_booster(), segment_boosters)
+            segments = {
+                "keys": list(segment_by),
+                "min_rows": min_segment_rows,
+                "test_mae": float(mean_absolute_error(y_test, routed)),
+                "boosters": segment_boosters,
+                "models": segment_metrics,
+            }
     
-    return np.array(features), all_themes, all_tones, all_colors
-
-def train_model():
-    """Train the engagement prediction model."""
-    print("🔍 Fetching labeled training data...")
+    train_mae = mean_absolute_error(y_train, y_pred_train)
+    test_mae = mean_absolute_error(y_test, y_pred_test)
+    train_r2 = r2_score(y_train, y_pred_train)
+    test_r2 = r2_score(y_test, y_pred_test)
+    peak_mb = instrumentation.peak_rss_mb()
+    instrumentation.count("rows_trained", int(n_samples))
+    instrumentation.count("feature_bytes", int(feature_mb * 1e6))
     
-    response = supabase.table("engagement_training_data") \
-        .select("*") \
-        .eq("is_labeled", True) \
-        .not_.is_("caption_embedding", "null") \
-        .execute()
+    print(f"\n{'='*60}")
+    print(f"📊 Model Performance:")
+    print(f"   Training MAE: {train_mae:.2f}")
+    print(f"   Test MAE: {test_mae:.2f}")
+    print(f"   Training R²: {train_r2:.4f}")
+    print(f"   Test R²: {test_r2:.4f}")
+    if segments:
+        print(f"   Test MAE with {len(segments['boosters'])} segment models: {segments['test_mae']:.2f}")
+    print(f"   Peak RSS: {peak_mb:.0f} MB ({'lean' if lean else 'dense'} features, {feature_mb:.1f} MB)")
+    print(f"{'='*60}")
     
-    if not response.data or len(response.data) == 0:
+    metadata = {
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "train_mae": float(train_mae),
+        "test_mae": float(test_mae),
+        "train_r2": float(train_r2),
+        "test_r2": float(test_r2),
+        "n_samples": int(n_samples),
+        "n_features": int(n_features),
+        "themes": transformer.themes,
+        "tones": transformer.tones,
+        "colors": transformer.colors,
+        "feature_transformer": transformer.to_dict(),
+        "embedding": {
+            "source_dim": transformer.embedding_dim,
+            "dim": transformer.embedding_features,
+            "reducer": transformer.reducer.method if transformer.reducer else None,
+        },
+        "caption_featurizer": featurizer_metadata(transformer),
+        "params": params,
+        "image_score_range": score_range,
+        "data_watermark": labeled_watermark(df),
+        "training": {
+            "mode": "lean" if lean else "dense",
+            "feature_mb": round(feature_mb, 1),
+            "peak_rss_mb": round(peak_mb, 1),
+        },
+    }
+    if search_result:
+        metadata["hyperparameter_search"] = search_result
+    segment_map = None
+    if segments:
+        segment_boosters = segments.pop("boosters")
+        metadata["segments"] = segments
+        if segment_boosters:
+            segment_map = model_artifact.save_segment_boosters(
+                segment_boosters, segment_by, metadata["timestamp"], model_format)
+    
+    save_model(model, transformer, metadata, model_format, segment_map)
+
+def train_streaming(use_snapshot: bool = False, offline: bool = False, full_sync: bool = False,
+                    embedding_dim: int = None, reducer: str = "truncate",
+                    page_size: int = streaming_training.DEFAULT_PAGE_SIZE,
+                    model_format: str = model_artifact.MODEL_FORMAT):
+    """Train out of core from pages of Supabase rows or the local snapshot.
+
+    Neither the labeled table nor the feature matrix is ever held in memory:
+    pages are transformed on the fly and XGBoost keeps its quantized pages on
+    disk, so the dataset size is bounded by disk space. Writes the same
+    artifacts and metadata as train_model(); the holdout is a stable 20%
+    of rows by id hash instead of a shuffled split.
+    """
+    if use_snapshot or offline:
+        df, embeddings = load_snapshot_training_data(offline, full_sync, lazy=True)
+        source = streaming_training.SnapshotPages(df, embeddings, page_size)
+    else:
+        source = streaming_training.SupabasePages(get_client(), page_size, dim=EMBEDDING_DIM)
+    
+    print("🔍 Scanning labeled training data...")
+    embedding_reducer = None
+    if embedding_dim and embedding_dim < EMBEDDING_DIM:
+        embedding_reducer = EmbeddingReducer(reducer, embedding_dim, EMBEDDING_DIM)
+        print(f"   📐 Reducing embeddings {EMBEDDING_DIM} -> {embedding_dim} ({reducer})")
+    transformer = FeatureTransformer(reducer=embedding_reducer)
+    with instrumentation.stage("scan"):
+        scanned = streaming_training.scan(source, transformer)
+    
+    if scanned["rows"] == 0:
         print("❌ No labeled data with embeddings found!")
-        print("   Please:")
-        print("   1. Import posts and label them")
-        print("   2. Run generate_embeddings.py")
         sys.exit(1)
     
-    df = pd.DataFrame(response.data)
-    print(f"   ✅ Found {len(df)} labeled posts with embeddings")
+    score_range = scanned["score_range"]
+    print(f"   ✅ Found {scanned['rows']} labeled posts with embeddings")
+    print(f"   📋 {len(transformer.themes)} themes, {len(transformer.tones)} tones, "
+          f"{len(transformer.colors)} colors -> {transformer.n_features} features")
+    if score_range:
+        print(f"   📊 Image normalization: min={score_range[0]:.2f}, max={score_range[1]:.2f}")
+    
+    def labeled_pages():
+        """(X, y, is_holdout) for the valid rows of each page."""
+        for page, page_embeddings in source.pages():
+            page = normalize_engagement_scores(page, score_range, verbose=False)
+            X = transformer.transform(page, page_embeddings)
+            y = pd.to_numeric(page['engagement_score'], errors='coerce').to_numpy(dtype=np.float64)
+            valid = ~(np.isnan(y) | np.isnan(X).any(axis=1))
+            holdout = streaming_training.holdout_mask(page['id'])
+            yield X[valid], y[valid], holdout[valid]
+    
+    def training_batches():
+        for X, y, holdout in labeled_pages():
+            if (~holdout).any():
+                yield X[~holdout], y[~holdout]
+    
+    params = dict(DEFAULT_MODEL_PARAMS)
+    
+    print("🎯 Training XGBoost model (external memory)...")
+    os.makedirs(".cache", exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="xgb_external_", dir=".cache") as cache_dir:
+        with instrumentation.stage("fit"):
+            model = lean_training.train_regressor(params, training_batches, cache_dir=cache_dir)
+    
+    print("📊 Evaluating...")
+    train_metrics = streaming_training.RunningMetrics()
+    test_metrics = streaming_training.RunningMetrics()
+    with instrumentation.stage("evaluate"):
+        for X, y, holdout in labeled_pages():
+            if len(y) == 0:
+                continue
+            predictions = model.predict(X)
+            train_metrics.add(y[~holdout], predictions[~holdout])
+            test_metrics.add(y[holdout], predictions[holdout])
+    
+    peak_mb = instrumentation.peak_rss_mb()
+    instrumentation.count("rows_trained", train_metrics.n + test_metrics.n)
     
-    # Normalize engagement scores
-    df = normalize_engagement_scores(df)
+    print(f"\n{'='*60}")
+    print(f"📊 Model Performance:")
+    print(f"   Training MAE: {train_metrics.mae:.2f}")
+    print(f"   Test MAE: {test_metrics.mae:.2f}")
+    print(f"   Training R²: {train_metrics.r2:.4f}")
+    print(f"   Test R²: {test_metrics.r2:.4f}")
+    print(f"   Peak RSS: {peak_mb:.0f} MB (streamed, {train_metrics.n + test_metrics.n} rows)")
+    print(f"{'='*60}")
+    
+    metadata = {
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "train_mae": float(train_metrics.mae),
+        "test_mae": float(test_metrics.mae),
+        "train_r2": float(train_metrics.r2),
+        "test_r2": float(test_metrics.r2),
+        "n_samples": int(train_metrics.n + test_metrics.n),
+        "n_features": int(transformer.n_features),
+        "themes": transformer.themes,
+        "tones": transformer.tones,
+        "colors": transformer.colors,
+        "feature_transformer": transformer.to_dict(),
+        "embedding": {
+            "source_dim": transformer.embedding_dim,
+            "dim": transformer.embedding_features,
+            "reducer": transformer.reducer.method if transformer.reducer else None,
+        },
+        "caption_featurizer": featurizer_metadata(transformer),
+        "params": params,
+        "image_score_range": score_range,
+        "data_watermark": scanned["watermark"],
+        "training": {
+            "mode": "stream",
+            "page_size": page_size,
+            "peak_rss_mb": round(peak_mb, 1),
+        },
+    }
+    
+    save_model(model, transformer, metadata, model_format)
+
+def featurizer_metadata(transformer: FeatureTransformer) -> dict:
+    """Which featurizer builds the model's caption block, for the metadata."""
+    featurizer = transformer.featurizer
+    if featurizer is None:
+        return {"method": "openai", "dim": transformer.embedding_features}
+    return {
+        "method": featurizer.method,
+        "dim": featurizer.dim,
+        "vocabulary_size": len(featurizer.vocabulary) if featurizer.vocabulary else None,
+    }
+
+def save_model(model, transformer: FeatureTransformer, metadata: dict,
+               model_format: str = model_artifact.MODEL_FORMAT, segments: dict = None):
+    """Write the model, its feature layout and metadata, and promote them to latest.
+
+    The model goes out in XGBoost's native format with the layout embedded
+    (see model_artifact.py). segments: the segment models it routes to, from
+    model_artifact.save_segment_boosters. The metadata also records the
+    active run's stage timings and counters.
+    """
+    metadata.pop("run", None)
+    run = instrumentation.summary()
+    if run:
+        metadata["run"] = run
+    models_dir = model_artifact.MODELS_DIR
+    timestamp = metadata["timestamp"]
+    metadata["model_format"] = model_format
+    
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    model_path = model_artifact.save_booster(booster, transformer.to_dict(), timestamp, model_format, segments)
+    
+    # Fitted feature layout, also embedded in the model file
+    transformer.save(os.path.join(models_dir, f"feature_transformer_{timestamp}.json"))
+    transformer.save(TRANSFORMER_PATH)
+    
+    with open(os.path.join(models_dir, f"model_metadata_{timestamp}.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    
+    with open(METADATA_PATH, "w") as f:
+        json.dump(metadata, f, indent=2)
+    
+    print(f"\n✅ Model saved:")
+    print(f"   {model_path}")
+    print(f"   {model_artifact.model_path('latest', model_format)}")
+    print(f"   Metadata: {METADATA_PATH}")
+    print(f"   Features: {TRANSFORMER_PATH}")
+    if segments:
+        print(f"   Segment models: {len(segments['models'])} ({', '.join(segments['keys'])})")
+
+def labeled_watermark(df):
+    """Latest labeled_at among the training rows (ISO string), or None."""
+    if 'labeled_at' not in df.columns:
+        return None
+    labeled_at = pd.to_datetime(df['labeled_at'], utc=True, errors='coerce')
+    if labeled_at.isna().all():
+        return None
+    return labeled_at.max().isoformat()
+
+def previous_watermark(metadata: dict):
+    """Where the previous model's training data ends.
+
+    Models trained before data_watermark was recorded fall back to their
+    training time (local clock).
+    """
+    if metadata.get("data_watermark"):
+        return metadata["data_watermark"]
+    trained_at = datetime.strptime(metadata["timestamp"], "%Y%m%d_%H%M%S")
+    return trained_at.astimezone(timezone.utc).isoformat()
+
+def train_incremental(use_snapshot: bool = False, offline: bool = False, full_sync: bool = False,
+                      rounds: int = INCREMENTAL_ROUNDS, model_format: str = model_artifact.MODEL_FORMAT):
+    """Continue boosting the latest model on posts labeled since it was trained.
+
+    The feature layout stays the one the previous model was trained with:
+    XGBoost can only add trees over the same columns, so new theme/tone/color
+    values land in each block's "other" column and are listed under
+    pending_categories until the next full retrain gives them their own.
+    The continued model replaces the latest one only if its holdout MAE is
+    not worse than the previous model's on the same holdout rows. Segment
+    models are kept as they are and still route their segments.
+    """
+    import xgboost as xgb
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error, r2_score
+    
+    previous_path = model_artifact.latest_model_path()
+    if previous_path is None or not os.path.exists(METADATA_PATH):
+        print("⚠️  No previous model found, running a full training instead")
+        return train_model(use_snapshot, offline, full_sync, model_format=model_format)
+    
+    with open(METADATA_PATH) as f:
+        previous = json.load(f)
+    previous_booster, layout, _ = model_artifact.load_booster(previous_path)
+    if layout:
+        transformer = FeatureTransformer.from_dict(layout)
+    elif os.path.exists(TRANSFORMER_PATH):
+        transformer = FeatureTransformer.load(TRANSFORMER_PATH)
+    else:
+        transformer = FeatureTransformer.from_metadata(previous)
+    
+    if "caption_featurizer" not in previous:
+        previous["caption_featurizer"] = featurizer_metadata(transformer)
+    require_embeddings = transformer.uses_stored_embeddings
+    
+    since = previous_watermark(previous)
+    print(f"🧠 Continuing model {previous['timestamp']} ({previous_booster.num_boosted_rounds()} rounds)")
+    print(f"🔍 Fetching posts labeled since {since}...")
+    
+    with instrumentation.stage("fetch"):
+        if use_snapshot or offline:
+            df, embeddings = load_snapshot_training_data(offline, full_sync,
+                                                         require_embeddings=require_embeddings)
+            labeled_at = pd.to_datetime(df['labeled_at'], utc=True, errors='coerce') \
+                if 'labeled_at' in df.columns else pd.Series(pd.NaT, index=df.index)
+            mask = (labeled_at > pd.Timestamp(since)).to_numpy()
+            df = df[mask].reset_index(drop=True)
+            embeddings = embeddings[mask]
+        else:
+            df, embeddings = fetch_training_data(labeled_since=since, require_embeddings=require_embeddings)
+    
+    if len(df) < MIN_INCREMENTAL_ROWS:
+        print(f"✅ Only {len(df)} newly labeled posts (need {MIN_INCREMENTAL_ROWS}); keeping model {previous['timestamp']}")
+        return
+    
+    print(f"   ✅ Found {len(df)} newly labeled posts{' with embeddings' if require_embeddings else ''}")
+    
+    # Scale image scores the way the previous model's targets were scaled
+    score_range = previous.get("image_score_range")
+    df = normalize_engagement_scores(df, score_range)
+    
+    unseen = transformer.unseen_values(df)
+    pending = {name: sorted(set(previous.get("pending_categories", {}).get(name, [])) | set(unseen.get(name, [])))
+               for name, _ in MULTI_HOT_COLUMNS}
+    pending = {name: values for name, values in pending.items() if values}
+    for name, values in unseen.items():
+        bucket = "'other' column" if transformer.unknown_bucket else "no column (legacy layout)"
+        print(f"   📋 {len(values)} new {name} mapped to the {bucket}: {values[:10]}")
     
-    # Prepare features
     print("🔧 Preparing features...")
-    X, all_themes, all_tones, all_colors = prepare_features(df)
-    y = df['engagement_score'].values
+    with instrumentation.stage("prepare_features"):
+        X, _ = prepare_features(df, embeddings, transformer)
+    y = df['engagement_score'].values.astype(np.float64)
     
-    # Remove NaN values
     valid_mask = ~(np.isnan(y) | np.isnan(X).any(axis=1))
     X = X[valid_mask]
     y = y[valid_mask]
     
-    if len(X) == 0:
-        print("❌ No valid data after cleaning!")
-        sys.exit(1)
+    if len(X) < MIN_INCREMENTAL_ROWS:
+        print(f"✅ Only {len(X)} valid newly labeled posts; keeping model {previous['timestamp']}")
+        return
     
-    print(f"   ✅ Feature matrix shape: {X.shape}")
-    print(f"   ✅ Target vector shape: {y.shape}")
-    
-    # Split data
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
     
-    print("🎯 Training XGBoost model...")
-    
-    # Train model
-    model = xgb.XGBRegressor(
-        n_estimators=300,
-        max_depth=4,
-        learning_rate=0.05,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        min_child_weight=1.0,
-        reg_lambda=1.0,
-        random_state=42,
-        n_jobs=-1,
-    )
+    print(f"🎯 Adding {rounds} boosting rounds on {len(X_train)} posts...")
     
-    model.fit(X_train, y_train)
+    params = dict(DEFAULT_MODEL_PARAMS)
+    params.update(previous.get("params", {}))
+    params["n_estimators"] = rounds
+    model = xgb.XGBRegressor(**params, random_state=42, n_jobs=-1)
+    with instrumentation.stage("fit"):
+        model.fit(X_train, y_train, xgb_model=previous_booster)
     
-    # Evaluate
-    y_pred_train = model.predict(X_train)
-    y_pred_test = model.predict(X_test)
+    with instrumentation.stage("evaluate"):
+        previous_mae = mean_absolute_error(y_test, previous_booster.inplace_predict(X_test))
+        y_pred_train = model.predict(X_train)
+        y_pred_test = model.predict(X_test)
+    instrumentation.count("rows_trained", int(len(X)))
     
     train_mae = mean_absolute_error(y_train, y_pred_train)
     test_mae = mean_absolute_error(y_test, y_pred_test)
-    train_r2 = r2_score(y_train, y_pred_train)
-    test_r2 = r2_score(y_test, y_pred_test)
+    promote = test_mae <= previous_mae
     
     print(f"\n{'='*60}")
-    print(f"📊 Model Performance:")
-    print(f"   Training MAE: {train_mae:.2f}")
-    print(f"   Test MAE: {test_mae:.2f}")
-    print(f"   Training R²: {train_r2:.4f}")
-    print(f"   Test R²: {test_r2:.4f}")
+    print(f"📊 Holdout ({len(X_test)} newly labeled posts):")
+    print(f"   Previous model MAE: {previous_mae:.2f}")
+    print(f"   Continued model MAE: {test_mae:.2f}")
+    print(f"   {'✅ Promoting continued model' if promote else '❌ Continued model is worse, keeping previous'}")
     print(f"{'='*60}")
     
-    # Save model
-    os.makedirs("models", exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    model_path = f"models/engagement_model_{timestamp}.pkl"
-    latest_path = "models/engagement_model_latest.pkl"
-    
-    joblib.dump(model, model_path)
-    joblib.dump(model, latest_path)
+    if not promote:
+        return
     
-    # Save metadata
-    metadata = {
-        "timestamp": timestamp,
+    metadata = dict(previous)
+    metadata.pop("hyperparameter_search", None)
+    if "segments" in metadata:
+        # Measured against the previous global model
+        metadata["segments"] = {**metadata["segments"], "test_mae": None}
+    metadata.update({
+        "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
         "train_mae": float(train_mae),
         "test_mae": float(test_mae),
-        "train_r2": float(train_r2),
-        "test_r2": float(test_r2),
+        "train_r2": float(r2_score(y_train, y_pred_train)),
+        "test_r2": float(r2_score(y_test, y_pred_test)),
         "n_samples": int(len(X)),
         "n_features": int(X.shape[1]),
-        "themes": all_themes,
-        "tones": all_tones,
-        "colors": all_colors,
-    }
-    
-    with open(f"models/model_metadata_{timestamp}.json", "w") as f:
-        json.dump(metadata, f, indent=2)
-    
-    with open("models/model_metadata_latest.json", "w") as f:
-        json.dump(metadata, f, indent=2)
-    
-    print(f"\n✅ Model saved:")
-    print(f"   {model_path}")
-    print(f"   {latest_path}")
-    print(f"   Metadata: models/model_metadata_latest.json")
+        "feature_transformer": transformer.to_dict(),
+        "params": previous.get("params", params),
+        "data_watermark": labeled_watermark(df) or since,
+        "incremental": {
+            "base_model": previous["timestamp"],
+            "new_rows": int(len(X)),
+            "rounds_added": rounds,
+            "total_rounds": int(model.get_booster().num_boosted_rounds()),
+            "previous_holdout_mae": float(previous_mae),
+            "holdout_mae": float(test_mae),
+        },
+    })
+    if pending:
+        metadata["pending_categories"] = pending
+        print(f"   💡 New categories pending; run a full retrain to give them their own columns")
+    else:
+        metadata.pop("pending_categories", None)
+    
+    save_model(model, transformer, metadata, model_format, model_artifact.segment_map(previous_booster))
 
-if __name__ == "__main__":
+def parse_args(argv=None, prog: str = None):
+    parser = argparse.ArgumentParser(prog=prog, description="Train the engagement prediction model")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="incrementally sync and train from the local feature snapshot")
+    parser.add_argument("--offline", action="store_true",
+                        help="train from the existing snapshot without contacting Supabase")
+    parser.add_argument("--full-sync", action="store_true",
+                        help="rebuild the snapshot from scratch before training")
+    parser.add_argument("--tune", action="store_true",
+                        help="pick hyperparameters by parallel k-fold search first")
+    parser.add_argument("--trials", type=int, default=hyperparameter_search.DEFAULT_TRIALS,
+                        help="configurations tried by --tune")
+    parser.add_argument("--folds", type=int, default=hyperparameter_search.DEFAULT_FOLDS,
+                        help="cross-validation folds used by --tune")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes used by --tune (default: CPU count)")
+    parser.add_argument("--embedding-dim", type=int, default=None,
+                        help=f"reduce the caption embedding block to this size (default: all {EMBEDDING_DIM}); "
+                             "with a local --featurizer, its output size")
+    parser.add_argument("--reducer", choices=REDUCERS, default="truncate",
+                        help="how --embedding-dim is reached; saved with the model and reapplied at scoring")
+    parser.add_argument("--featurizer", choices=FEATURIZERS, default="openai",
+                        help="caption block source: stored OpenAI embeddings, or a local CPU featurizer "
+                             "fitted on the training captions and saved with the model")
+    parser.add_argument("--stream", action="store_true",
+                        help="train out of core from pages of Supabase rows (or the snapshot "
+                             "with --snapshot/--offline); XGBoost keeps its data on disk")
+    parser.add_argument("--page-size", type=int, default=streaming_training.DEFAULT_PAGE_SIZE,
+                        help="rows per page read by --stream")
+    parser.add_argument("--lean", action="store_true",
+                        help="train from float32/sparse feature blocks in row chunks")
+    parser.add_argument("--memory-budget", type=int, default=lean_training.DEFAULT_MEMORY_BUDGET_MB,
+                        help="MB the dense feature matrix may use before --lean is picked automatically")
+    parser.add_argument("--incremental", action="store_true",
+                        help="continue the latest model on posts labeled since it was trained")
+    parser.add_argument("--rounds", type=int, default=INCREMENTAL_ROUNDS,
+                        help="boosting rounds added by --incremental")
+    parser.add_argument("--model-format", choices=model_artifact.MODEL_FORMATS, default=model_artifact.MODEL_FORMAT,
+                        help="XGBoost native format the model is saved in (layout embedded)")
+    parser.add_argument("--segment-by", nargs="+", choices=segmented_training.SEGMENT_KEYS, default=[],
+                        help="also train one model per segment of these columns, in parallel")
+    parser.add_argument("--min-segment-rows", type=int, default=segmented_training.DEFAULT_MIN_SEGMENT_ROWS,
+                        help="labeled posts a segment needs for its own model (default: %(default)s)")
+    instrumentation.add_arguments(parser)
+    storage.add_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.stream and args.featurizer != "openai":
+        parser.error("--stream trains from stored embeddings only; drop --featurizer or --stream")
+    if args.incremental and args.featurizer != "openai":
+        parser.error("--incremental keeps the previous model's featurizer; drop --featurizer")
+    if args.segment_by and (args.stream or args.incremental):
+        parser.error("--segment-by needs a full dense training; drop --stream/--incremental")
+    return args
+
+def main(argv=None, prog: str = None):
+    args = parse_args(argv, prog)
+    
     print("╔══════════════════════════════════════════════════════╗")
     print("║  Engagement Prediction Model Training               ║")
     print("║  Supports comma-separated theme/tone/color values   ║")
     print("╚══════════════════════════════════════════════════════╝\n")
     
-    train_model()
+    storage.configure(args.backend, args.sqlite_path)
+    with instrumentation.run("train_model", vars(args), args.run_log, args.profile, args.profiler):
+        if args.incremental:
+            train_incremental(
+                use_snapshot=args.snapshot,
+                offline=args.offline,
+                full_sync=args.full_sync,
+                rounds=args.rounds,
+                model_format=args.model_format,
+            )
+        elif args.stream:
+            train_streaming(
+                use_snapshot=args.snapshot,
+                offline=args.offline,
+                full_sync=args.full_sync,
+                embedding_dim=args.embedding_dim,
+                reducer=args.reducer,
+                page_size=args.page_size,
+                model_format=args.model_format,
+            )
+        else:
+            train_model(
+                use_snapshot=args.snapshot,
+                offline=args.offline,
+                full_sync=args.full_sync,
+                tune=args.tune,
+                trials=args.trials,
+                folds=args.folds,
+                workers=args.workers,
+                embedding_dim=args.embedding_dim,
+                reducer=args.reducer,
+                lean=args.lean,
+                memory_budget_mb=args.memory_budget,
+                featurizer=args.featurizer,
+                model_format=args.model_format,
+                segment_by=tuple(args.segment_by),
+                min_segment_rows=args.min_segment_rows,
+            )
+
+if __name__ == "__main__":
+    main()